@@ -1,16 +1,24 @@
 """异步 SQLModel CRUD 路由器"""
 
-from typing import Any, Callable, List, Type, AsyncGenerator, Optional, Union, Dict, Literal
-from functools import wraps
+from typing import Any, AsyncIterator, Callable, List, Sequence, Type, AsyncGenerator, Optional, Union, Dict, Literal
+from functools import partial, wraps
 
 from fastapi import Depends, HTTPException
 from sqlmodel import select
+from sqlalchemy import delete, update
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 
 from .base import CRUDGenerator, NOT_FOUND
-from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, ResponseModel, CALLABLE, CALLABLE_LIST, SearchRequest, Sorting
+from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, PageResponseModel, ResponseModel, CALLABLE, CALLABLE_LIST, SearchRequest, Sorting, BatchCreateResult, BatchItemError, BatchWriteResult, DeleteAllResponseModel
+from .batch import aio_sa_insert_many, chunked, error_msg
+from .counting import TOTAL, filters_key
+from .loader import BatchLoader
+from .cursor import sort_keys
+from .projection import sa_load_only
+from .sa_query import SAQueryMixin
+from .streaming import STREAM_FORMAT
 from .utils import get_pk_type
 
 
@@ -28,8 +36,15 @@ def get_primary_key(db_model: Any) -> str:
         return "id"
 
 
-class AioSQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
-    """异步 SQLModel CRUD 路由器"""
+class AioSQLModelCRUDRouter(SAQueryMixin, CRUDGenerator[SCHEMA]):
+    """
+    异步 SQLModel CRUD 路由器
+
+    stream_session: 流式输出 (Accept: application/x-ndjson 或 stream=true) 读取数据用的会话工厂,
+    如应用的 async_sessionmaker. 流式响应在路由返回后才读取数据库, 那时请求的会话可能已经关闭,
+    所以流式读取总是使用单独的会话, 输出结束时关闭. 未指定时退回到在请求会话的 engine 上新建一个普通 AsyncSession:
+    不带应用对会话的配置 (会话类、事件、execution_options 等), 也看不到请求事务中未提交的修改
+    """
     
     def __init__(
         self,
@@ -48,10 +63,13 @@ class AioSQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
         delete_one_route: Union[bool, DEPENDENCIES] = True,
         delete_all_route: Union[bool, DEPENDENCIES] = True,
         search_route: Union[bool, DEPENDENCIES] = True,
+        stream_session: Optional[Callable[[], AsyncSession]] = None,
+        coalesce_window: Optional[float] = None,
         **kwargs: Any
     ) -> None:
         self.db_model = db_model
         self.db_func = db
+        self.stream_session = stream_session
         
         # 获取主键字段名
         self._pk: str = get_primary_key(db_model)
@@ -74,35 +92,134 @@ class AioSQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             **kwargs
         )
 
+        # coalesce_window: 把这么多秒内并发的 GET /{item_id} 合并成一条 IN 查询 (每批最多 batch_chunk_size 个主键)
+        self._loader = (
+            None if coalesce_window is None
+            else BatchLoader(self._load_many, window=coalesce_window, max_batch=self.batch_chunk_size)
+        )
+
+    def coalesce_stats(self) -> Dict[str, Any]:
+        """GET /{item_id} 请求合并的批大小和等待时间, 用于调整 coalesce_window"""
+        return {} if self._loader is None else self._loader.stats()
+
+    async def _load_many(self, ids: List[Any], db: AsyncSession) -> Dict[Any, Any]:
+        """合并后的批量读取: 一条 IN 查询, 在会话内转换成 schema, 结果交给其它请求时不依赖这个会话"""
+        statement = select(self.db_model).where(self._pk_column.in_(ids))
+        db_models = (await db.execute(statement)).scalars().all()
+        return {getattr(m, self._pk): self.schema.model_validate(m, from_attributes=True) for m in db_models}
+
+    async def _batch_write(self, db: AsyncSession, statement: Any, request: Any) -> BatchWriteResult:
+        """
+        执行一条 UPDATE / DELETE ... WHERE 并提交
+
+        请求 returning 时, 支持 RETURNING 的数据库在同一条语句里返回主键;
+        其余数据库先在同一事务里查出主键, 再按主键更新 / 删除
+        """
+        statement, returning = self._batch_statement(db, statement, request)
+        if not request.returning:
+            result = await db.execute(statement)
+            await db.commit()
+            return BatchWriteResult(affected=result.rowcount)
+        if returning:
+            ids = list((await db.scalars(statement.returning(self._pk_column))).all())
+        else:
+            ids = list((await db.scalars(self._batch_where(select(self._pk_column), request))).all())
+            await db.execute(statement.where(self._pk_column.in_(ids)))
+        await db.commit()
+        return BatchWriteResult(affected=len(ids), ids=ids)
+
+    async def _delete_rows(self, db: AsyncSession) -> int:
+        """删除全部行; 设置 delete_all_chunk_size 时按主键范围分块删除, 每块单独提交, 限制锁的持有时间和单个事务的日志量"""
+        deleted = 0
+        while True:
+            bound_statement = self._chunk_bound_statement()
+            bound = None if bound_statement is None else await db.scalar(bound_statement)
+            deleted += (await db.execute(self._delete_rows_statement(bound))).rowcount
+            await db.commit()
+            if bound is None:
+                return deleted
+
+    async def _total(self, db: AsyncSession, filtered: Any, cursor: Optional[str], cache_key: str) -> Optional[TOTAL]:
+        """列表响应的总数, 见 _count_plan"""
+        total, statement = self._count_plan(filtered, cursor, cache_key)
+        if statement is None:
+            return total
+        return self._counted(await db.scalar(statement), cache_key)
+
+    async def _iter_chunks(self, db: AsyncSession, statement: Any) -> AsyncIterator[Sequence[Any]]:
+        """
+        流式输出时用服务端游标 (stream_scalars + yield_per) 分块读取; 生成器惰性执行, 响应开始发送后才查询
+
+        路由返回后请求的会话可能已被依赖清理关闭 (FastAPI 0.106 ~ 0.117 在发送响应前清理 yield 依赖),
+        所以用 stream_session 另开一个会话读取 (未指定时在请求会话的 engine 上新建), 输出结束 (或客户端断开) 时关闭
+        """
+        factory = self.stream_session or partial(AsyncSession, db.bind)
+        async with factory() as stream_db:
+            result = await stream_db.stream_scalars(statement.execution_options(yield_per=self.stream_chunk_size))
+            try:
+                async for rows in result.partitions():
+                    yield rows
+            finally:
+                await result.close()
+
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
         async def route(
             db: AsyncSession = Depends(self.db_func),
             pagination: PAGINATION = self.pagination,
-        ) -> ResponseModel[List[Any]]:
-            skip, limit = pagination.get("skip"), pagination.get("limit")
-
-            statement = select(self.db_model).offset(skip).limit(limit)
+            stream: Optional[STREAM_FORMAT] = self.stream,
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[Any]]:
+            fields = self._fields(fields)
+
+            keys = sort_keys(None, self._pk)
+            filtered = select(self.db_model)
+            statement = self._page_statement(db, filtered, keys, pagination, fields)
+            if stream:
+                return self._stream_response(self._iter_chunks(db, statement), stream, fields)
             result = await db.execute(statement)
             db_models = result.scalars().all()
-            return ResponseModel(data=list(db_models))
+            total = await self._total(db, filtered, pagination.get("cursor"), "")
+            return self._page_response(db_models, pagination.get("limit"), keys, total, fields)
 
         return route
 
     def _get_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
         async def route(
-            item_id: self._pk_type, db: AsyncSession = Depends(self.db_func)  # type: ignore
+            item_id: self._pk_type,  # type: ignore
+            db: AsyncSession = Depends(self.db_func),
+            fields: Optional[str] = None,
         ) -> Any:
-            statement = select(self.db_model).where(getattr(self.db_model, self._pk) == item_id)
-            result = await db.execute(statement)
-            model = result.scalar_one_or_none()
+            fields = self._fields(fields)
+            if self._loader is not None:
+                # 合并读取整行, 字段投影只作用于响应
+                model = await self._loader.load(item_id, db)
+            else:
+                statement = select(self.db_model).where(getattr(self.db_model, self._pk) == item_id)
+                statement = sa_load_only(statement, self.db_model, fields)
+                result = await db.execute(statement)
+                model = result.scalar_one_or_none()
 
             if model:
-                return ResponseModel(data=model)
+                return self._item_response(model, fields)
             else:
                 raise NOT_FOUND
 
         return route
 
+    def _get_many(self, ids: Any, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            ids: List[Any] = ids,
+            db: AsyncSession = Depends(self.db_func),
+            fields: Optional[str] = None,
+        ) -> Any:
+            fields = self._fields(fields)
+            db_models: List[Any] = []
+            for statement in self._many_statements(ids, fields):
+                db_models.extend((await db.execute(statement)).scalars().all())
+            return self._many_response(ids, db_models, fields)
+
+        return route
+
     def _create(self, *args: Any, **kwargs: Any) -> CALLABLE:
         async def route(
             model: self.create_schema,  # type: ignore
@@ -120,6 +237,66 @@ class AioSQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
 
         return route
 
+    async def _insert_chunk(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> List[Any]:
+        """插入一块数据并提交; 提交前先转换成 schema, 提交后 ORM 对象过期, 再读取会逐行 SELECT"""
+        db_models = await aio_sa_insert_many(db, self.db_model, rows)
+        items = [self.schema.model_validate(m, from_attributes=True) for m in db_models]
+        await db.commit()
+        return items
+
+    def _create_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            models: List[self.create_schema],  # type: ignore
+            db: AsyncSession = Depends(self.db_func),
+        ) -> Any:
+            created: List[Any] = []
+            errors: List[BatchItemError] = []
+            for start, chunk in chunked(models, self.batch_chunk_size):
+                rows = [model.model_dump() for model in chunk]
+                try:
+                    created.extend(await self._insert_chunk(db, rows))
+                except SQLAlchemyError:
+                    await db.rollback()
+                    # 整块失败 (约束冲突、取值超出列类型等任何数据库错误) 时逐条重试, 只有出错的条目记入 errors
+                    for i, row in enumerate(rows, start):
+                        try:
+                            created.extend(await self._insert_chunk(db, [row]))
+                        except SQLAlchemyError as e:
+                            await db.rollback()
+                            errors.append(BatchItemError(index=i, msg=error_msg(e)))
+
+            return ResponseModel(data=BatchCreateResult(created=created, errors=errors))
+
+        return route
+
+    def _update_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            request: self._batch_update_request,  # type: ignore
+            db: AsyncSession = Depends(self.db_func),
+        ) -> Any:
+            statement = update(self.db_model).values(**self._update_values(request))
+            try:
+                return ResponseModel(data=await self._batch_write(db, statement, request))
+            except IntegrityError as e:
+                await db.rollback()
+                self._raise(e)
+
+        return route
+
+    def _delete_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            request: self._batch_delete_request,  # type: ignore
+            db: AsyncSession = Depends(self.db_func),
+        ) -> Any:
+            self._check_batch(request)
+            try:
+                return ResponseModel(data=await self._batch_write(db, delete(self.db_model), request))
+            except IntegrityError as e:
+                await db.rollback()
+                self._raise(e)
+
+        return route
+
     def _update(self, *args: Any, **kwargs: Any) -> CALLABLE:
         async def route(
             item_id: self._pk_type,  # type: ignore
@@ -152,15 +329,8 @@ class AioSQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
         return route
 
     def _delete_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        async def route(db: AsyncSession = Depends(self.db_func)) -> ResponseModel[List[Any]]:
-            statement = select(self.db_model)
-            result = await db.execute(statement)
-            models = result.scalars().all()
-            for model in models:
-                await db.delete(model)
-            await db.commit()
-
-            return ResponseModel(data=[])
+        async def route(db: AsyncSession = Depends(self.db_func)) -> DeleteAllResponseModel[List[Any]]:
+            return DeleteAllResponseModel(data=[], deleted_count=await self._delete_rows(db))
 
         return route
 
@@ -188,49 +358,24 @@ class AioSQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             search_params: SearchRequest,
             db: AsyncSession = Depends(self.db_func),
             pagination: PAGINATION = self.pagination,
-        ) -> ResponseModel[List[Any]]:
-            skip, limit = pagination.get("skip"), pagination.get("limit")
+            stream: Optional[STREAM_FORMAT] = self.stream,
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[Any]]:
+            # 1. 应用过滤器 (filters)
+            filtered = self._where(select(self.db_model), search_params.filters)
 
-            statement = select(self.db_model)
+            # 2. 校验排序字段 (sorting)
+            self._check_sorting(search_params.sorting)
 
-            # 1. 应用过滤器 (filters)
-            if search_params.filters:
-                for f in search_params.filters:
-                    if not hasattr(self.db_model, f.field):
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid filter field: '{f.field}' is not a valid field for {self.db_model.__name__}."
-                        )
-                    
-                    column = getattr(self.db_model, f.field)
-
-                    if f.operator == "gt":
-                        statement = statement.where(column > f.value)
-                    elif f.operator == "lt":
-                        statement = statement.where(column < f.value)
-                    elif f.operator == "eq":
-                        statement = statement.where(column == f.value)
-                    elif f.operator == "ne":
-                        statement = statement.where(column != f.value)
-                    elif f.operator == "contains":
-                        statement = statement.where(column.contains(f.value))
-                    elif f.operator == "in":
-                        statement = statement.where(column.in_(f.value))
-
-            # 2. 应用排序 (sorting)
-            if search_params.sorting:
-                for s in search_params.sorting:
-                    if not hasattr(self.db_model, s.field):
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid sorting field: '{s.field}' is not a valid field for {self.db_model.__name__}."
-                        )
-                    column = getattr(self.db_model, s.field)
-                    statement = statement.order_by(column.desc() if s.direction == "desc" else column.asc())
-
-            statement = statement.offset(skip).limit(limit)
+            # 3. 按排序字段 + 主键排序, 有游标时从游标位置继续
+            keys = sort_keys(search_params.sorting, self._pk)
+            fields = self._fields(fields, search_params)
+            statement = self._page_statement(db, filtered, keys, pagination, fields)
+            if stream:
+                return self._stream_response(self._iter_chunks(db, statement), stream, fields)
             result = await db.execute(statement)
             db_models = result.scalars().all()
-            return ResponseModel(data=list(db_models))
+            total = await self._total(db, filtered, pagination.get("cursor"), filters_key(search_params.filters))
+            return self._page_response(db_models, pagination.get("limit"), keys, total, fields)
 
         return route
\ No newline at end of file
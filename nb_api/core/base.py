@@ -1,20 +1,79 @@
 """CRUD 路由生成器基类"""
 
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Generic, List, Optional, Type, Union
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, Type, Union
+from functools import lru_cache, wraps
+import asyncio
 import time
 import logging
 
 from fastapi import APIRouter, HTTPException, Request, routing, Response
 from fastapi.types import DecoratedCallable
 from fastapi.responses import JSONResponse
-from .types import T, DEPENDENCIES, ErrorResponseModel, ResponseModel
-from .utils import pagination_factory, schema_factory
+from fastapi.datastructures import DefaultPlaceholder
+from pydantic import TypeAdapter
+from .types import T, DEPENDENCIES, BatchCreateResult, BatchDeleteRequest, BatchUpdateRequest, BatchWriteResult, DeleteAllResponseModel, ErrorResponseModel, GetManyResult, PageResponseModel, ResponseModel
+from .counting import COUNT_STRATEGY, TOTAL, CountCache
+from .cursor import SORT_KEYS, CursorCodec
+from .projection import FIELDS, Projection
+from .serializers import SERIALIZER, get_response_class
+from .streaming import CHUNKS, STREAM_FORMAT, StreamEncoder, stream_factory, stream_response
+from .utils import ids_factory, pagination_factory, partial_schema, schema_factory
 
 logger = logging.getLogger("nb_api")
 
 NOT_FOUND = HTTPException(404, "Item not found")
 
+
+def _render(adapter: TypeAdapter, result: Any) -> Any:
+    if isinstance(result, Response):
+        return result
+    # 从属性读取 (ORM 对象 / 未参数化的 ResponseModel) 一次性校验成响应模型, 再直接序列化成 JSON
+    content = adapter.dump_json(adapter.validate_python(result, from_attributes=True), by_alias=True)
+    return Response(content=content, media_type="application/json")
+
+
+def _trusted_route(endpoint: Callable[..., Any], response_model: Any) -> Callable[..., Any]:
+    """
+    包装路由函数: 用预先构建的 TypeAdapter 生成响应, 直接返回 Response
+
+    FastAPI 遇到 Response 不会再按 response_model 校验和序列化, 省掉一轮重复校验;
+    路由仍然声明 response_model, OpenAPI 文档不变
+    """
+    adapter = TypeAdapter(response_model)
+
+    if asyncio.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def async_route(*args: Any, **kwargs: Any) -> Any:
+            return _render(adapter, await endpoint(*args, **kwargs))
+        return async_route
+
+    @wraps(endpoint)
+    def route(*args: Any, **kwargs: Any) -> Any:
+        return _render(adapter, endpoint(*args, **kwargs))
+    return route
+
+
+def _invalidating_route(endpoint: Callable[..., Any], cache: CountCache) -> Callable[..., Any]:
+    """包装写路由: 执行后 (无论成功与否) 清空总数缓存"""
+    if asyncio.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def async_route(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                cache.invalidate()
+        return async_route
+
+    @wraps(endpoint)
+    def route(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            cache.invalidate()
+    return route
+
+
 class CustomRoute(routing.APIRoute):
     """
     自定义路由类,用于统一错误响应格式
@@ -25,11 +84,18 @@ class CustomRoute(routing.APIRoute):
     def get_route_handler(self) -> Callable:
         original_route_handler = super().get_route_handler()
 
+        # 错误响应与正常响应使用同一个 JSON 编码器
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        if not (isinstance(response_class, type) and issubclass(response_class, JSONResponse)):
+            response_class = JSONResponse
+
         async def custom_route_handler(request: Request) -> Any:
             try:
                 return await original_route_handler(request)
             except HTTPException as exc:
-                return JSONResponse(
+                return response_class(
                     status_code=exc.status_code,
                     content={"status_code": exc.status_code, "msg": str(exc.detail)},
                     headers=exc.headers
@@ -59,10 +125,43 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
         delete_one_route: Union[bool, DEPENDENCIES] = True,
         delete_all_route: Union[bool, DEPENDENCIES] = True,
         search_route: Union[bool, DEPENDENCIES] = True,
+        create_batch_route: Union[bool, DEPENDENCIES] = True,
+        update_batch_route: Union[bool, DEPENDENCIES] = True,
+        delete_batch_route: Union[bool, DEPENDENCIES] = True,
+        get_many_route: Union[bool, DEPENDENCIES] = True,
+        trusted_output: bool = False,
+        serializer: Optional[SERIALIZER] = None,
+        stream_chunk_size: int = 1000,
+        count: Optional[COUNT_STRATEGY] = None,
+        count_cap: int = 10_000,
+        count_cache_ttl: Optional[float] = 60.0,
+        batch_chunk_size: int = 500,
+        delete_all_chunk_size: Optional[int] = None,
         **kwargs: Any,
     ) -> None:
         self.schema = schema
+        # trusted_output: 路由返回的数据一次性转换成响应模型并序列化, 跳过 FastAPI 对 response_model 的再次校验
+        self.trusted_output = trusted_output
+        # serializer: 用 orjson / msgspec 渲染所有响应 (含错误响应), auto 选择已安装的最快编码器, 都没有时退回 json
+        if serializer is not None:
+            kwargs.setdefault("default_response_class", get_response_class(serializer))
         self.pagination = pagination_factory(max_limit=paginate)
+        # 游标分页 (cursor 参数 / 响应中的 next_cursor) 的编解码
+        self._cursors = CursorCodec(self.schema)
+        # count: 列表响应附带 total 的策略 (exact / cached / capped), None 表示不计数
+        self.count = count
+        self.count_cap = count_cap
+        self._count_cache = CountCache(ttl=count_cache_ttl)
+        # 流式输出 (Accept: application/x-ndjson 或 stream=true): 每次从数据库游标取 stream_chunk_size 行
+        self.stream = stream_factory()
+        self.stream_chunk_size = stream_chunk_size
+        # 字段投影 (?fields=a,b 或 SearchRequest.fields): 只查询 / 只返回这些字段, 投影模型按字段组合缓存
+        self._projection = Projection(self.schema)
+        self._stream_encoder = lru_cache(maxsize=256)(self._build_stream_encoder)
+        # 批量写入 (POST /batch): 每 batch_chunk_size 行一条语句 / 一个事务
+        self.batch_chunk_size = batch_chunk_size
+        # 删除全部 (DELETE /): 默认一条 DELETE; 设置后按主键范围每次删除 delete_all_chunk_size 行, 每块单独提交
+        self.delete_all_chunk_size = delete_all_chunk_size
         self._pk: str = self._pk if hasattr(self, "_pk") else "id"
         
         # 创建 create_schema 和 update_schema
@@ -71,6 +170,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
             if create_schema
             else schema_factory(self.schema, pk_field_name=self._pk, name="Create")
         )
+        self._custom_update_schema = update_schema is not None
         self.update_schema = (
             update_schema
             if update_schema
@@ -89,7 +189,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 "",
                 self._get_all(),
                 methods=["GET"],
-                response_model=ResponseModel[List[self.schema]],  # type: ignore
+                response_model=PageResponseModel[List[self.schema]],  # type: ignore
                 summary="Get All",
                 dependencies=get_all_route,
             )
@@ -102,6 +202,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 response_model=ResponseModel[self.schema],
                 summary="Create One",
                 dependencies=create_route,
+                writes=True,
             )
 
         if delete_all_route:
@@ -109,11 +210,58 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 "",
                 self._delete_all(),
                 methods=["DELETE"],
-                response_model=ResponseModel[List[self.schema]],  # type: ignore
+                response_model=DeleteAllResponseModel[List[self.schema]],  # type: ignore
                 summary="Delete All",
                 dependencies=delete_all_route,
+                writes=True,
+            )
+
+        # /batch 等固定路径要在 /{item_id} 之前注册, 否则会被当成 item_id 匹配
+        if create_batch_route:
+            self._add_api_route(
+                "/batch",
+                self._create_batch(),
+                methods=["POST"],
+                response_model=ResponseModel[BatchCreateResult[self.schema]],  # type: ignore
+                summary="Create Batch",
+                dependencies=create_batch_route,
+                writes=True,
+            )
+
+        if update_batch_route:
+            self._add_api_route(
+                "/batch",
+                self._update_batch(),
+                methods=["PUT"],
+                response_model=ResponseModel[BatchWriteResult],
+                summary="Update Batch",
+                dependencies=update_batch_route,
+                writes=True,
             )
 
+        if delete_batch_route:
+            self._add_api_route(
+                "/batch",
+                self._delete_batch(),
+                methods=["DELETE"],
+                response_model=ResponseModel[BatchWriteResult],
+                summary="Delete Batch",
+                dependencies=delete_batch_route,
+                writes=True,
+            )
+
+        if get_many_route:
+            # GET /many?ids=1,2,3; 主键很多时 URL 会过长, 用 POST /many 在请求体里传主键列表
+            for method, from_body in (("GET", False), ("POST", True)):
+                self._add_api_route(
+                    "/many",
+                    self._get_many(ids_factory(self._pk_type, from_body=from_body)),
+                    methods=[method],
+                    response_model=ResponseModel[GetManyResult[self.schema]],  # type: ignore
+                    summary="Get Many",
+                    dependencies=get_many_route,
+                )
+
         if get_one_route:
             self._add_api_route(
                 "/{item_id}",
@@ -133,6 +281,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 response_model=ResponseModel[self.schema],
                 summary="Update One",
                 dependencies=update_route,
+                writes=True,
                 error_responses=[NOT_FOUND],
             )
 
@@ -144,6 +293,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 response_model=ResponseModel[self.schema],
                 summary="Delete One",
                 dependencies=delete_one_route,
+                writes=True,
                 error_responses=[NOT_FOUND],
             )
 
@@ -153,7 +303,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 "/search",
                 self._search(),
                 methods=["POST"],
-                response_model=ResponseModel[List[self.schema]],  # type: ignore
+                response_model=PageResponseModel[List[self.schema]],  # type: ignore
                 summary="Search",
                 dependencies=search_route,
             )
@@ -164,10 +314,15 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
         endpoint: Callable[..., Any],
         dependencies: Union[bool, DEPENDENCIES],
         error_responses: Optional[List[HTTPException]] = None,
+        writes: bool = False,
         **kwargs: Any,
     ) -> None:
-        """添加 API 路由"""
+        """添加 API 路由, writes=True 的写路由执行后使总数缓存失效"""
         dependencies = [] if isinstance(dependencies, bool) else dependencies
+        if writes and self.count == "cached":
+            endpoint = _invalidating_route(endpoint, self._count_cache)
+        if self.trusted_output and kwargs.get("response_model") is not None:
+            endpoint = _trusted_route(endpoint, kwargs["response_model"])
         responses: Any = {}
         if error_responses:
             for err in error_responses:
@@ -234,11 +389,31 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
         """获取单条记录"""
         raise NotImplementedError
 
+    @abstractmethod
+    def _get_many(self, ids: Any, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        """按主键列表获取多条记录, ids 为解析主键列表的依赖"""
+        raise NotImplementedError
+
     @abstractmethod
     def _create(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         """创建记录"""
         raise NotImplementedError
 
+    @abstractmethod
+    def _create_batch(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        """批量创建记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _update_batch(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        """按主键列表 / 过滤条件批量更新记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _delete_batch(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        """按主键列表 / 过滤条件批量删除记录"""
+        raise NotImplementedError
+
     @abstractmethod
     def _update(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         """更新记录"""
@@ -259,11 +434,95 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
         """搜索记录"""
         raise NotImplementedError
 
+    def _page_response(
+        self,
+        rows: Sequence[Any],
+        limit: Optional[int],
+        keys: SORT_KEYS,
+        total: Optional[TOTAL] = None,
+        fields: FIELDS = None,
+    ) -> Any:
+        """列表响应: 取满一页时附带 next_cursor, 总数随游标带到下一页"""
+        return self._envelope(rows, self._cursors.next_cursor(rows, limit, keys, total), total, fields)
+
+    def _envelope(
+        self, rows: Sequence[Any], next_cursor: Optional[str], total: Optional[TOTAL] = None, fields: FIELDS = None
+    ) -> Any:
+        """组装列表响应, 指定 fields 时只输出这些字段"""
+        if total is None:
+            page = PageResponseModel(data=list(rows), next_cursor=next_cursor)
+        else:
+            page = PageResponseModel(data=list(rows), next_cursor=next_cursor, total=total[0], total_capped=total[1])
+        if fields is None:
+            return page
+        return _render(self._projection.page_adapter(fields), page)
+
+    def _item_response(self, model: Any, fields: FIELDS = None) -> Any:
+        """单条记录的响应, 指定 fields 时只输出这些字段"""
+        if fields is None:
+            return ResponseModel(data=model)
+        return _render(self._projection.item_adapter(fields), ResponseModel(data=model))
+
+    def _many_response(self, ids: Sequence[Any], rows: Sequence[Any], fields: FIELDS = None) -> Any:
+        """按请求中主键的顺序排列查到的行, 不存在的主键放进 missing; 指定 fields 时只输出这些字段"""
+        by_pk = {getattr(row, self._pk): row for row in rows}
+        result = GetManyResult(items=[by_pk[i] for i in ids if i in by_pk], missing=[i for i in ids if i not in by_pk])
+        if fields is None:
+            return ResponseModel(data=result)
+        return _render(self._projection.many_adapter(fields), ResponseModel(data=result))
+
+    def _fields(self, fields: Optional[str], search_params: Any = None) -> FIELDS:
+        """?fields=a,b 查询参数 -> 校验后的字段元组; 搜索请求体里的 fields 优先"""
+        if search_params is not None and search_params.fields is not None:
+            return self._projection.resolve(search_params.fields)
+        return None if fields is None else self._projection.resolve(fields.split(","))
+
+    @property
+    def _batch_update_request(self) -> Any:
+        """
+        PUT /batch 的请求体类型: ids 按主键类型校验, values 是 update_schema 的字段都可省略的版本
+
+        自动生成的 update_schema 不带字段约束, 这时按 schema 的字段 (含约束) 生成
+        """
+        source = self.update_schema if self._custom_update_schema else self.schema
+        return BatchUpdateRequest[self._pk_type, partial_schema(source)]  # type: ignore
+
+    @property
+    def _batch_delete_request(self) -> Any:
+        """DELETE /batch 的请求体类型"""
+        return BatchDeleteRequest[self._pk_type]  # type: ignore
+
+    @staticmethod
+    def _check_batch(request: Any) -> None:
+        """
+        批量更新 / 删除的请求必须给出非空的 ids 或非空的 filters, 不允许无条件地改动整张表
+
+        空的 filters 列表不过滤任何行, 与不给条件等价, 同样拒绝
+        """
+        if not request.ids and not request.filters:
+            raise HTTPException(422, "Either ids or filters is required.")
+
+    def _batch_values(self, request: Any) -> Dict[str, Any]:
+        """校验批量更新请求, 返回要更新的字段 (只含请求中实际给出的字段, 不含主键)"""
+        self._check_batch(request)
+        changes = request.values.model_dump(exclude_unset=True, exclude={self._pk})
+        if not changes:
+            raise HTTPException(422, "No fields to update.")
+        return changes
+
+    def _build_stream_encoder(self, fmt: STREAM_FORMAT, fields: FIELDS) -> StreamEncoder:
+        return StreamEncoder(self.schema if fields is None else self._projection.model(fields), fmt)
+
+    def _stream_response(self, chunks: CHUNKS, fmt: STREAM_FORMAT, fields: FIELDS = None) -> Response:
+        """用分块数据生成流式响应, 每种输出格式 (和字段组合) 的编码器只创建一次"""
+        return stream_response(chunks, self._stream_encoder(fmt, fields))
+
     def _raise(self, e: Exception, status_code: int = 422) -> HTTPException:
         """抛出 HTTP 异常"""
-        raise HTTPException(status_code, ", ".join(e.args)) from e
+        # Tortoise 的异常参数是驱动的原始异常, 不一定是字符串
+        raise HTTPException(status_code, ", ".join(str(arg) for arg in e.args)) from e
 
     @staticmethod
     def get_routes() -> List[str]:
         """获取所有路由名称"""
-        return ["get_all", "create", "delete_all", "get_one", "update", "delete_one", "search"]
+        return ["get_all", "create", "delete_all", "create_batch", "update_batch", "delete_batch", "get_many", "get_one", "update", "delete_one", "search"]
@@ -0,0 +1,89 @@
+"""批量操作 (POST /batch, DELETE / 等) 的公共工具: 分块和 SQL 语句构造"""
+
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import Integer, insert, select
+from sqlalchemy.inspection import inspect as sql_inspect
+
+V = TypeVar("V")
+
+
+def chunked(items: Sequence[V], size: int) -> Iterator[Tuple[int, Sequence[V]]]:
+    """按 size 分块, 产生 (块内第一项在原列表中的下标, 块)"""
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+
+def _returning_order(db_model: Any, rows: List[dict]) -> Optional[Callable[[Any], Any]]:
+    """
+    不依赖 sort_by_parameter_order 就能把 RETURNING 的结果还原成输入顺序时, 返回排序用的 key
+
+    - 主键由客户端给出: 按主键值在输入中的位置排序
+    - 单列自增整数主键: 同一会话内按插入顺序分配, 按主键升序即输入顺序
+    其余情况返回 None, 由数据库保证顺序 (SQLite 等会因此退化成逐行 INSERT)
+    """
+    primary_key = sql_inspect(db_model).primary_key
+    if len(primary_key) != 1:
+        return None
+    column = primary_key[0]
+    if all(column.key in row for row in rows):
+        position = {row[column.key]: i for i, row in enumerate(rows)}
+        if len(position) == len(rows):
+            return lambda obj: position[getattr(obj, column.key)]
+        return None
+    if not any(column.key in row for row in rows) and column.autoincrement in (True, "auto") \
+            and isinstance(column.type, Integer):
+        return lambda obj: getattr(obj, column.key)
+    return None
+
+
+def _insert_statement(db: Any, db_model: Any, rows: List[dict]) -> Tuple[Any, Optional[Callable[[Any], Any]]]:
+    """(INSERT ... RETURNING 语句, 结果排序 key); 数据库不支持 executemany + RETURNING 时返回 (None, None)"""
+    dialect = db.get_bind().dialect
+    if not dialect.insert_executemany_returning:
+        return None, None
+    order = _returning_order(db_model, rows)
+    if order is not None:
+        return insert(db_model).returning(db_model), order
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        return insert(db_model).returning(db_model, sort_by_parameter_order=True), None
+    return None, None
+
+
+def sa_insert_many(db: Any, db_model: Any, rows: List[dict]) -> List[Any]:
+    """
+    一条 INSERT 插入一块数据, 返回按输入顺序排列的 ORM 对象
+
+    支持 executemany + RETURNING 的数据库 (PostgreSQL / SQLite 3.35+ / ...) 用 insert().returning(),
+    由 insertmanyvalues 合并成少量多行 INSERT; 其余数据库 (MySQL) 退回 add_all + flush
+    """
+    statement, order = _insert_statement(db, db_model, rows)
+    if statement is not None:
+        objects = list(db.scalars(statement, rows).all())
+        return sorted(objects, key=order) if order else objects
+    objects = [db_model(**row) for row in rows]
+    db.add_all(objects)
+    db.flush()
+    return objects
+
+
+async def aio_sa_insert_many(db: Any, db_model: Any, rows: List[dict]) -> List[Any]:
+    """sa_insert_many 的异步版本"""
+    statement, order = _insert_statement(db, db_model, rows)
+    if statement is not None:
+        objects = list((await db.scalars(statement, rows)).all())
+        return sorted(objects, key=order) if order else objects
+    objects = [db_model(**row) for row in rows]
+    db.add_all(objects)
+    await db.flush()
+    return objects
+
+
+def sa_chunk_bound(pk: Any, size: int) -> Any:
+    """按主键顺序第 size 行的主键; DELETE ... WHERE pk <= 它 恰好删除 size 行, 没有这么多行时查询结果为空"""
+    return select(pk).order_by(pk).offset(size - 1).limit(1)
+
+
+def error_msg(e: Exception) -> str:
+    """单个条目的错误信息: 数据库异常取驱动给出的原始信息"""
+    return str(getattr(e, "orig", None) or e)
@@ -0,0 +1,65 @@
+"""列表响应的总数 (total): exact / cached / capped 三种计数策略"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from .types import Filter
+
+# exact: 精确总数, 只在第一页计数一次, 之后随游标带到各页;
+# cached: 按查询条件缓存精确总数, 经由路由的写操作使缓存失效;
+# capped: 最多数到 count_cap 行, 超出时返回 count_cap 并标记 total_capped
+COUNT_STRATEGY = Literal["exact", "cached", "capped"]
+# (总数, 是否被截断)
+TOTAL = Tuple[int, bool]
+
+
+def filters_key(filters: Optional[List[Filter]]) -> str:
+    """过滤条件 -> 缓存键, 没有过滤条件时为空串"""
+    if not filters:
+        return ""
+    return json.dumps([f.model_dump() for f in filters], sort_keys=True, default=str)
+
+
+class CountCache:
+    """
+    按查询条件缓存总数
+
+    路由的写操作 (创建 / 更新 / 删除) 调用 invalidate 整体清空;
+    ttl 秒后条目过期, 兜住不经过路由的写入
+    """
+
+    def __init__(self, ttl: Optional[float] = 60.0) -> None:
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None or (self.ttl is not None and time.monotonic() - entry[0] > self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, total: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), total)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries = {}
+
+
+def sa_count_statement(filtered: Any, cap: Optional[int] = None) -> Any:
+    """SELECT count(*) FROM (过滤后的查询 [LIMIT cap + 1]); 传入 cap 时最多扫描 cap + 1 行"""
+    inner = filtered.order_by(None)
+    if cap is not None:
+        inner = inner.limit(cap + 1)
+    return select(func.count()).select_from(inner.subquery())
+
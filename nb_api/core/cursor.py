@@ -0,0 +1,161 @@
+"""游标分页: 不透明游标的编解码, 以及 SQL 路由的 (排序键, 主键) > (...) 定位条件"""
+
+import base64
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import and_, false, or_
+
+from .counting import TOTAL
+from .types import PYDANTIC_SCHEMA as SCHEMA, Sorting
+
+# 排序键: [(字段, 是否降序), ...], 最后一项是保证顺序唯一的决胜字段
+SORT_KEYS = List[Tuple[str, bool]]
+# SQL 定位条件的输入: [(列, 是否降序, 游标中的值, 列是否可为空), ...]
+SEEK_ENTRIES = Sequence[Tuple[Any, bool, Any, bool]]
+
+# NULL 在升序中排在最后的数据库 (其它数据库排在最前)
+NULLS_HIGH_DIALECTS = ("postgresql", "postgres", "oracle")
+
+
+def sort_keys(sorting: Optional[List[Sorting]], tiebreaker: str) -> SORT_KEYS:
+    """用户排序字段 + 决胜字段 (已在排序字段中时不重复添加)"""
+    keys = [(s.field, s.direction == "desc") for s in sorting or []]
+    if all(field != tiebreaker for field, _ in keys):
+        keys.append((tiebreaker, False))
+    return keys
+
+
+def _invalid_cursor(msg: str) -> HTTPException:
+    return HTTPException(422, f"Invalid cursor: {msg}")
+
+
+class CursorCodec:
+    """
+    游标 = base64url(JSON [排序签名, 上一页最后一行的排序键值, 可选的 [总数, 是否截断]])
+
+    签名由排序字段和方向算出, 换了排序条件的旧游标会被拒绝;
+    解码时按 schema 的字段类型还原值 (datetime / Decimal 等), 以便和列值比较。
+    第一页算出的总数随游标带到后续各页, 翻页时不再重复计数
+    """
+
+    def __init__(self, schema: Type[SCHEMA]) -> None:
+        self.schema = schema
+        self._adapters: Dict[str, TypeAdapter] = {}
+
+    @staticmethod
+    def _signature(keys: SORT_KEYS) -> int:
+        return zlib.crc32(",".join(f"{field}:{int(desc)}" for field, desc in keys).encode())
+
+    def _adapter(self, field: str) -> TypeAdapter:
+        adapter = self._adapters.get(field)
+        if adapter is None:
+            info = self.schema.model_fields.get(field)
+            adapter = self._adapters[field] = TypeAdapter(Optional[info.annotation] if info else Any)  # type: ignore[valid-type]
+        return adapter
+
+    def encode(self, keys: SORT_KEYS, values: List[Any], total: Optional[TOTAL] = None) -> str:
+        payload: List[Any] = [self._signature(keys), jsonable_encoder(values)]
+        if total is not None:
+            payload.append(list(total))
+        data = json.dumps(payload, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _payload(cursor: str) -> List[Any]:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (ValueError, TypeError):
+            raise _invalid_cursor("malformed cursor.") from None
+        if not isinstance(payload, list) or len(payload) < 2:
+            raise _invalid_cursor("malformed cursor.")
+        return payload
+
+    def decode(self, cursor: str, keys: SORT_KEYS) -> List[Any]:
+        signature, values = self._payload(cursor)[:2]
+        if signature != self._signature(keys) or not isinstance(values, list) or len(values) != len(keys):
+            raise _invalid_cursor("the cursor does not match the sorting of this request.")
+        try:
+            return [self._adapter(field).validate_python(value) for (field, _), value in zip(keys, values)]
+        except ValueError:
+            raise _invalid_cursor("malformed cursor.") from None
+
+    def carried_total(self, cursor: Optional[str]) -> Optional[TOTAL]:
+        """游标里带着的总数, 没有时返回 None"""
+        if cursor is None:
+            return None
+        payload = self._payload(cursor)
+        if len(payload) < 3:
+            return None
+        try:
+            total, capped = payload[2]
+            return int(total), bool(capped)
+        except (ValueError, TypeError):
+            raise _invalid_cursor("malformed cursor.") from None
+
+    def next_cursor(
+        self, rows: Sequence[Any], limit: Optional[int], keys: SORT_KEYS, total: Optional[TOTAL] = None
+    ) -> Optional[str]:
+        """取满一页时用最后一行的排序键生成下一页的游标; 不足一页说明已经到底"""
+        if limit is None or not rows or len(rows) < limit:
+            return None
+        last = rows[-1]
+        return self.encode(keys, [getattr(last, field, None) for field, _ in keys], total)
+
+
+def _sa_after(column: Any, desc: bool, value: Any, nullable: bool, nulls_high: bool) -> Any:
+    """按排序方向严格排在 value 之后的条件; 没有任何行能排在其后时返回 None"""
+    # NULL 是否排在这一排序方向的末尾
+    nulls_last = nulls_high != desc
+    if value is None:
+        return None if nulls_last else column.isnot(None)
+    after = column < value if desc else column > value
+    if nullable and nulls_last:
+        after = or_(after, column.is_(None))
+    return after
+
+
+def sa_seek(entries: SEEK_ENTRIES, nulls_high: bool) -> Any:
+    """
+    展开的行值比较: c1 >= v1 AND ((c1 > v1) OR (c1 = v1 AND c2 > v2) OR ...)
+
+    每个分支都是索引可用的简单比较 (比 ROW(c1, c2) > ROW(v1, v2) 兼容更多数据库, 也能处理混合升降序);
+    NULL 按数据库默认的排序位置处理, 非空列不生成 IS NULL 分支
+    """
+    clauses = []
+    for i, (column, desc, value, nullable) in enumerate(entries):
+        after = _sa_after(column, desc, value, nullable, nulls_high)
+        if after is not None:
+            equal = [c.is_(None) if v is None else c == v for c, _, v, _ in entries[:i]]
+            clauses.append(and_(*equal, after))
+    if not clauses:
+        return false()
+
+    # 冗余的首列范围条件 (c1 >= v1): 优化器据此对整个 OR 条件做索引区间扫描, 而不是从头扫描索引
+    column, desc, value, nullable = entries[0]
+    nulls_last = nulls_high != desc
+    if value is None:
+        bound = column.is_(None) if nulls_last else None
+    else:
+        bound = column <= value if desc else column >= value
+        if nullable and nulls_last:
+            bound = or_(bound, column.is_(None))
+    return or_(*clauses) if bound is None else and_(bound, or_(*clauses))
+
+
+def sa_keyset(
+    statement: Any, db_model: Any, keys: SORT_KEYS, values: Optional[List[Any]] = None, dialect: str = ""
+) -> Any:
+    """按排序键 (含决胜主键) 排序, 传入游标值时加上定位条件, 深翻页只需一次索引定位"""
+    columns = [getattr(db_model, field) for field, _ in keys]
+    if values is not None:
+        entries = [
+            (column, desc, value, getattr(getattr(column, "expression", column), "nullable", True))
+            for column, (_, desc), value in zip(columns, keys, values)
+        ]
+        statement = statement.where(sa_seek(entries, dialect in NULLS_HIGH_DIALECTS))
+    return statement.order_by(*[column.desc() if desc else column.asc() for column, (_, desc) in zip(columns, keys)])
@@ -0,0 +1,124 @@
+"""请求合并 (DataLoader 式): 窗口期内并发的按主键读取合并成一次 IN 查询"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# fetch(主键列表, 上下文) -> {主键: 行}, 查不到的主键不出现在结果中
+FETCH = Callable[[List[Any], Any], Awaitable[Dict[Any, Any]]]
+
+
+class _Window:
+    """一个合并窗口: 等待中的请求、批量查询使用的上下文、发出查询的后台任务"""
+
+    def __init__(self, context: Any) -> None:
+        # 主键 -> [(等待结果的 future, 入队时间), ...]
+        self.pending: Dict[Any, List[Tuple["asyncio.Future[Any]", float]]] = {}
+        self.context = context
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+
+
+class BatchLoader:
+    """
+    把 window 秒内到达的按主键读取合并成一次批量查询, 结果再分发给各个等待的请求
+
+    - 第一个请求到达时开始计时, 窗口结束或攒够 max_batch 个主键时发出查询
+    - 同一主键的并发请求只查询一次
+    - 查询出错时, 这一批的所有请求都收到同一个异常
+    - 批量查询使用这一批第一个请求的上下文 (如数据库会话). 该请求在查询结束前不会返回:
+      正常情况下它本来就在等结果; 被取消 (客户端断开) 时也先等这一批查询结束再抛出 CancelledError,
+      否则框架会在查询途中关闭它的会话, 这一批的其他请求都会收到错误
+
+    统计 (stats): 批次数、平均 / 最大批大小、请求在窗口中等待的平均 / 最大时间, 用于调整 window
+    """
+
+    def __init__(self, fetch: FETCH, window: float = 0.002, max_batch: int = 500) -> None:
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max_batch
+        self._window: Optional[_Window] = None
+
+        self.batches = 0
+        self.requests = 0
+        self.keys = 0
+        self.max_batch_size = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def load(self, key: Any, context: Any = None) -> Optional[Any]:
+        """按主键读取一行, 不存在时返回 None"""
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Any]" = loop.create_future()
+        window = self._window
+        owner = window is None
+        if window is None:
+            window = self._window = _Window(context)
+            window.timer = loop.call_later(self.window, self._flush, window)
+        window.pending.setdefault(key, []).append((future, time.perf_counter()))
+        if len(window.pending) >= self.max_batch:
+            self._flush(window)
+        if not owner:
+            return await future
+        try:
+            return await future
+        except asyncio.CancelledError:
+            await self._release(window)
+            raise
+
+    async def _release(self, window: _Window) -> None:
+        """上下文的提供者被取消: 立即发出这一批查询, 并等它结束后才让出上下文"""
+        if window.task is None:
+            self._flush(window)
+        while window.task is not None and not window.task.done():
+            try:
+                await asyncio.wait([window.task])
+            except asyncio.CancelledError:
+                # 再次取消也要等查询结束, 取消在返回时仍会抛出
+                continue
+
+    def _flush(self, window: _Window) -> None:
+        """取出窗口的所有请求, 交给后台任务查询"""
+        if window.timer is not None:
+            window.timer.cancel()
+            window.timer = None
+        if self._window is window:
+            self._window = None
+        if window.task is None and window.pending:
+            window.task = asyncio.ensure_future(self._dispatch(window.pending, window.context))
+
+    async def _dispatch(self, batch: Dict[Any, List[Tuple["asyncio.Future[Any]", float]]], context: Any) -> None:
+        now = time.perf_counter()
+        waits = [now - enqueued for waiters in batch.values() for _, enqueued in waiters]
+        self.batches += 1
+        self.requests += len(waits)
+        self.keys += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.wait_total += sum(waits)
+        self.wait_max = max(self.wait_max, *waits)
+
+        try:
+            rows = await self.fetch(list(batch), context)
+        except Exception as e:
+            for waiters in batch.values():
+                for future, _ in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, waiters in batch.items():
+            row = rows.get(key)
+            for future, _ in waiters:
+                # 请求已被取消 (客户端断开) 时不再设置结果
+                if not future.done():
+                    future.set_result(row)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.keys / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_wait_ms": self.wait_total / self.requests * 1000 if self.requests else 0.0,
+            "max_wait_ms": self.wait_max * 1000,
+        }
@@ -0,0 +1,113 @@
+"""并发控制工具"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+    fcntl_installed = False
+else:
+    fcntl_installed = True
+
+
+class _Guard:
+    """把 acquire / release 包装成上下文管理器, 比 contextmanager 生成器少一层开销"""
+
+    __slots__ = ("_acquire", "_release")
+
+    def __init__(self, acquire: Callable[[], None], release: Callable[[], None]) -> None:
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self) -> None:
+        self._acquire()
+
+    def __exit__(self, *exc: Any) -> None:
+        self._release()
+
+
+class RWLock:
+    """
+    读写锁 (写优先)
+
+    多个读者可以同时持有读锁; 写者独占, 且有写者排队时新的读者会等待, 避免写饥饿。
+    不可重入: 持有锁时不要再次获取同一把锁
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        self._read_guard = _Guard(self._acquire_read, self._release_read)
+        self._write_guard = _Guard(self._acquire_write, self._release_write)
+
+    def read(self) -> _Guard:
+        return self._read_guard
+
+    def write(self) -> _Guard:
+        return self._write_guard
+
+    def _acquire_read(self) -> None:
+        with self._cond:
+            if self._writer or self._waiting_writers:
+                self._waiting_readers += 1
+                while self._writer or self._waiting_writers:
+                    self._cond.wait()
+                self._waiting_readers -= 1
+            self._readers += 1
+
+    def _release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            # 只有写者会等待读者离开
+            if not self._readers and self._waiting_writers:
+                self._cond.notify_all()
+
+    def _acquire_write(self) -> None:
+        with self._cond:
+            if self._writer or self._readers:
+                self._waiting_writers += 1
+                while self._writer or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def _release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            # 没有人排队时省掉 notify_all
+            if self._waiting_writers or self._waiting_readers:
+                self._cond.notify_all()
+
+
+class ProcessLock:
+    """
+    跨进程互斥锁 (同一进程内的线程也互斥)
+
+    基于锁文件上的 fcntl.flock, 持锁进程崩溃时由操作系统自动释放。仅支持 POSIX 系统
+    """
+
+    def __init__(self, path: str) -> None:
+        if not fcntl_installed:
+            raise RuntimeError("fcntl is required for cross-process locking (POSIX only).")
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        os.close(self._fd)
@@ -1,16 +1,41 @@
 """内存 CRUD 路由器 (用于快速原型开发和测试)"""
 
+import asyncio
 from typing import Any, Callable, List, Type, Optional, Union, Dict, Literal, cast
-from functools import wraps
+from functools import partial, wraps
 
 from fastapi import HTTPException
 
 from .base import CRUDGenerator, NOT_FOUND
-from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, ResponseModel, CALLABLE, CALLABLE_LIST, SearchRequest, Sorting
+from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, PageResponseModel, ResponseModel, CALLABLE, CALLABLE_LIST, Filter, SearchRequest, Sorting, BatchCreateResult, BatchItemError, BatchWriteResult, DeleteAllResponseModel
+from .counting import TOTAL, filters_key
+from .cursor import sort_keys
+from .projection import FIELDS
+from .utils import get_pk_type
+from .mem_store import MemoryStore
+from .mem_columnar import ColumnarStore
+from .mem_persist import MemoryJournal
+from .mem_shared import SharedMemoryStore
+from .mem_record import get_record_codec
 
-# 全局存储所有内存模型的字典
-_memory_stores: Dict[str, List[SCHEMA]] = {}
-_id_counters: Dict[str, int] = {}
+# 内存路由游标的决胜键: 行的插入序号 (不是 schema 字段)
+_SEQ = "_seq"
+
+# 全局存储所有内存模型的字典, store_key -> 以主键为索引的存储
+_memory_stores: Dict[str, Union[MemoryStore, ColumnarStore, SharedMemoryStore]] = {}
+
+
+def _run_on_loop(route: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    把同步路由包装成 async def, FastAPI 会直接在事件循环里执行它, 不再转交线程池
+
+    wraps 保留原函数的签名 (__wrapped__), FastAPI 仍能解析出同样的参数和依赖
+    """
+    @wraps(route)
+    async def async_route(*args: Any, **kwargs: Any) -> Any:
+        return route(*args, **kwargs)
+
+    return async_route
 
 
 class MemoryCRUDRouter(CRUDGenerator[SCHEMA]):
@@ -31,16 +56,77 @@ class MemoryCRUDRouter(CRUDGenerator[SCHEMA]):
         delete_one_route: Union[bool, DEPENDENCIES] = True,
         delete_all_route: Union[bool, DEPENDENCIES] = True,
         search_route: Union[bool, DEPENDENCIES] = True,
+        pk_field: str = "id",
+        indexes: Optional[List[str]] = None,
+        sorted_indexes: Optional[List[str]] = None,
+        text_indexes: Optional[List[str]] = None,
+        storage: Literal["row", "columnar", "shared"] = "row",
+        persist_dir: Optional[str] = None,
+        fsync_interval: float = 0.01,
+        snapshot_every: int = 100_000,
+        shared_capacity: int = 10_000,
+        shared_slot_size: int = 1024,
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        compact: bool = False,
+        async_routes: bool = False,
         **kwargs: Any
     ) -> None:
+        self._pk: str = pk_field
+        self._pk_type: type = get_pk_type(schema, self._pk)
+        # async_routes: 路由以 async def 注册, 在事件循环里直接执行, 不占用 anyio 线程池的令牌。
+        # 存储操作都是纯内存计算, 执行期间不会 await, 因此对其它协程来说是原子的;
+        # 存储自身的读写锁在单线程里没有竞争, 仍保护与线程池路由 / 后台线程的并发访问
+        self.async_routes = async_routes
+
         # 初始化内存存储
         self.store_key = prefix or schema.__name__.lower()
         if self.store_key not in _memory_stores:
-            _memory_stores[self.store_key] = []
-            _id_counters[self.store_key] = 1
-            
-        self.models = _memory_stores[self.store_key]
-        self._id_counter_key = self.store_key
+            # row: 每行一个 Pydantic 对象; columnar: 每个字段一列 NumPy 数组 (需要安装 numpy);
+            # shared: 多个 worker 进程共享的共享内存 (最多 shared_capacity 行, 每行 JSON 不超过 shared_slot_size 字节)
+            store: Union[MemoryStore, ColumnarStore, SharedMemoryStore]
+            if storage != "row" and (max_items or max_bytes or ttl or compact):
+                raise ValueError("max_items, max_bytes, ttl and compact are only supported by row storage.")
+            if storage == "columnar":
+                store = ColumnarStore(schema, pk=self._pk)
+            elif storage == "shared":
+                if persist_dir:
+                    raise ValueError("persist_dir is not supported by shared storage.")
+                store = SharedMemoryStore(
+                    schema, self.store_key, pk=self._pk,
+                    capacity=shared_capacity, slot_size=shared_slot_size,
+                )
+            else:
+                # 有界存储: 超出 max_items / max_bytes 时按 LRU 淘汰, 写入 ttl 秒后过期;
+                # compact: 行存为 __slots__ 记录, 返回时才构造模型
+                store = MemoryStore(
+                    pk=self._pk, max_items=max_items, max_bytes=max_bytes, ttl=ttl,
+                    codec=get_record_codec(schema) if compact else None,
+                )
+            if persist_dir:
+                # 持久化: 先从快照 + WAL 恢复, 之后的写操作追加到 WAL
+                MemoryJournal(
+                    persist_dir, self.store_key, schema,
+                    fsync_interval=fsync_interval, snapshot_every=snapshot_every,
+                ).open(store)
+            _memory_stores[self.store_key] = store
+
+        self.store = _memory_stores[self.store_key]
+
+        # 二级索引: 哈希索引加速 eq / in / ne 过滤, 有序索引加速 gt / lt 过滤和排序,
+        # n-gram 倒排索引加速 contains 过滤
+        if (indexes or sorted_indexes or text_indexes) and not isinstance(self.store, MemoryStore):
+            raise ValueError("indexes, sorted_indexes and text_indexes are only supported by row storage.")
+        for field in [*(indexes or []), *(sorted_indexes or []), *(text_indexes or [])]:
+            if field not in schema.model_fields:
+                raise ValueError(f"Invalid index field: '{field}' is not a valid field for {schema.__name__}.")
+        for field in indexes or []:
+            self.store.add_index(field)
+        for field in sorted_indexes or []:
+            self.store.add_sorted_index(field)
+        for field in text_indexes or []:
+            self.store.add_text_index(field)
 
         super().__init__(
             schema=schema,
@@ -59,84 +145,313 @@ class MemoryCRUDRouter(CRUDGenerator[SCHEMA]):
             **kwargs
         )
 
+    def _add_api_route(
+        self,
+        path: str,
+        endpoint: Callable[..., Any],
+        dependencies: Union[bool, DEPENDENCIES],
+        error_responses: Optional[List[HTTPException]] = None,
+        **kwargs: Any,
+    ) -> None:
+        if self.async_routes and not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _run_on_loop(endpoint)
+        super()._add_api_route(path, endpoint, dependencies, error_responses, **kwargs)
+
+    @property
+    def models(self) -> List[SCHEMA]:
+        """按插入顺序返回所有行 (快照)"""
+        return list(self.store)
+
+    def index_stats(self) -> List[Dict[str, Any]]:
+        """n-gram 索引的内存占用和命中率, 用于判断哪些字段值得建索引"""
+        if not isinstance(self.store, MemoryStore):
+            return []
+        return self.store.index_stats()
+
+    def eviction_stats(self) -> Dict[str, Any]:
+        """容量限制和淘汰 / 过期计数"""
+        if not isinstance(self.store, MemoryStore):
+            return {}
+        return self.store.eviction_stats()
+
+    def _page(
+        self,
+        filters: Optional[List[Filter]],
+        sorting: Optional[List[Sorting]],
+        skip: int,
+        limit: Optional[int],
+        cursor: Optional[str],
+        fields: FIELDS = None,
+    ) -> Any:
+        """行存储的分页查询, 支持游标; 游标的决胜键是插入序号, 顺序与偏移分页一致"""
+        keys = sort_keys(sorting, _SEQ)
+        after = None if cursor is None else self._cursors.decode(cursor, keys)
+        rows, last = self.store.search_page(filters, sorting, skip, limit, after)  # type: ignore[union-attr]
+        total = self._total(filters, cursor)
+        next_cursor = None if last is None else self._cursors.encode(keys, last, total)
+        return self._envelope(rows, next_cursor, total, fields)
+
+    def _count_rows(self, filters: Optional[List[Filter]], cap: Optional[int]) -> int:
+        if isinstance(self.store, MemoryStore):
+            return self.store.count(filters, cap)
+        if not filters:
+            return len(self.store)
+        return len(self.store.search(filters, None, 0, None if cap is None else cap + 1))
+
+    def _total(self, filters: Optional[List[Filter]], cursor: Optional[str] = None) -> Optional[TOTAL]:
+        """
+        列表响应的总数; 游标里带着总数时直接沿用
+
+        行存储无过滤条件时直接取行数, 有过滤条件时只校验索引选出的候选行, capped 数到 count_cap + 1 即停止
+        """
+        if self.count is None:
+            return None
+        total = self._cursors.carried_total(cursor)
+        if total is not None:
+            return total
+        if self.count == "capped":
+            n = self._count_rows(filters, self.count_cap)
+            return min(n, self.count_cap), n > self.count_cap
+        if self.count == "cached":
+            cached = self._count_cache.get(filters_key(filters))
+            if cached is not None:
+                return cached, False
+        n = self._count_rows(filters, None)
+        if self.count == "cached":
+            self._count_cache.set(filters_key(filters), n)
+        return n, False
+
+    @staticmethod
+    def _check_cursor(cursor: Optional[str]) -> None:
+        if cursor is not None:
+            raise HTTPException(422, "Cursor pagination is only supported by row storage.")
+
+    def _check_filters(self, filters: Optional[List[Filter]]) -> None:
+        for f in filters or []:
+            if f.field not in self.schema.model_fields:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Invalid filter field: '{f.field}' is not a valid field for {self.schema.__name__}."
+                )
+
+    def _batch_pks(self, request: Any) -> List[Any]:
+        """列存储 / 共享内存存储: 批量更新 / 删除选中的主键 (行存储由 MemoryStore 在写锁内选取)"""
+        if request.filters is None:
+            return [pk for pk in dict.fromkeys(request.ids) if self.store.get(pk) is not None]
+        pks = [getattr(row, self._pk) for row in self.store.search(request.filters, None, 0, None)]
+        if request.ids is None:
+            return pks
+        matched = set(pks)
+        return [pk for pk in dict.fromkeys(request.ids) if pk in matched]
+
     def _get_next_id(self) -> int:
         """获取下一个 ID"""
-        current_id = _id_counters[self._id_counter_key]
-        _id_counters[self._id_counter_key] += 1
-        return current_id
+        return self.store.next_pk()
+
+    def _make_row(self, model_dict: Dict[str, Any], pk: int) -> SCHEMA:
+        """用存储分配的自增主键生成完整的行"""
+        return self.schema(**{**model_dict, self._pk: pk})
 
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
         def route(
-            pagination: PAGINATION = self.pagination
-        ) -> ResponseModel[List[SCHEMA]]:
+            pagination: PAGINATION = self.pagination,
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[SCHEMA]]:
             skip, limit = pagination.get("skip"), pagination.get("limit")
+            fields = self._fields(fields)
             skip = cast(int, skip)
 
-            if limit is None:
-                result = self.models[skip:]
-            else:
-                result = self.models[skip : skip + limit]
-                
-            return ResponseModel(data=result)
+            if isinstance(self.store, MemoryStore):
+                return self._page(None, None, skip, limit, pagination.get("cursor"), fields)
+            self._check_cursor(pagination.get("cursor"))
+            return self._envelope(self.store.page(skip, limit), None, self._total(None), fields)
 
         return route
 
     def _get_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
-        def route(item_id: int) -> Any:
-            for model in self.models:
-                if getattr(model, "id", None) == item_id:
-                    return ResponseModel(data=model)
-            raise NOT_FOUND
+        def route(item_id: self._pk_type, fields: Optional[str] = None) -> Any:  # type: ignore
+            fields = self._fields(fields)
+            model = self.store.get(item_id)
+            if model is None:
+                raise NOT_FOUND
+            return self._item_response(model, fields)
+
+        return route
+
+    def _get_many(self, ids: Any, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(ids: List[Any] = ids, fields: Optional[str] = None) -> Any:
+            fields = self._fields(fields)
+            # 逐个按主键查字典, 不扫描
+            models = [model for model in map(self.store.get, ids) if model is not None]
+            return self._many_response(ids, models, fields)
 
         return route
 
     def _create(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(model: self.create_schema) -> Any:  # type: ignore
             model_dict = model.model_dump()
-            
-            # 如果没有提供 id，则自动生成
-            if "id" not in model_dict or model_dict["id"] is None:
-                model_dict["id"] = self._get_next_id()
-                
-            ready_model = self.schema(**model_dict)
-            self.models.append(ready_model)
+
+            try:
+                # 如果没有提供主键，则由存储在同一次加锁内分配主键并插入
+                if model_dict.get(self._pk) is None:
+                    ready_model = self.store.insert_auto(partial(self._make_row, model_dict))
+                else:
+                    ready_model = self.store.insert(self.schema(**model_dict))
+            except KeyError:
+                raise HTTPException(422, "Key already exists") from None
+            except ValueError as e:
+                # 不符合 schema, 共享内存存储已满, 或行超出槽位大小
+                raise HTTPException(422, str(e)) from None
             return ResponseModel(data=ready_model)
 
         return route
 
+    def _create_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(models: List[self.create_schema]) -> Any:  # type: ignore
+            # 每个条目的结果: 插入后的行, 或 KeyError (主键冲突) / ValueError (校验失败)
+            results: List[Any] = [None] * len(models)
+            # 待插入的行; 没有主键的条目放 make_row 函数, 由存储在锁内分配主键后生成行
+            rows: List[Any] = []
+            positions = []
+            for i, model in enumerate(models):
+                model_dict = model.model_dump()
+                if model_dict.get(self._pk) is None:
+                    rows.append(partial(self._make_row, model_dict))
+                else:
+                    try:
+                        rows.append(self.schema(**model_dict))
+                    except ValueError as e:
+                        results[i] = e
+                        continue
+                positions.append(i)
+
+            # 行存储整批只取一次写锁; 其它存储逐行插入
+            inserted: List[Any]
+            if isinstance(self.store, MemoryStore):
+                inserted = self.store.insert_many(rows)
+            else:
+                inserted = []
+                for row in rows:
+                    try:
+                        if callable(row):
+                            inserted.append(self.store.insert_auto(row))
+                        else:
+                            inserted.append(self.store.insert(row))
+                    except (KeyError, ValueError) as e:
+                        inserted.append(e)
+            for i, result in zip(positions, inserted):
+                results[i] = result
+
+            created: List[SCHEMA] = []
+            errors: List[BatchItemError] = []
+            for i, result in enumerate(results):
+                if isinstance(result, KeyError):
+                    errors.append(BatchItemError(index=i, msg="Key already exists"))
+                elif isinstance(result, ValueError):
+                    errors.append(BatchItemError(index=i, msg=str(result)))
+                else:
+                    created.append(result)
+            return ResponseModel(data=BatchCreateResult(created=created, errors=errors))
+
+        return route
+
+    def _update_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(request: self._batch_update_request) -> Any:  # type: ignore
+            changes = {k: v for k, v in self._batch_values(request).items() if k in self.schema.model_fields}
+            self._check_filters(request.filters)
+
+            if isinstance(self.store, MemoryStore):
+                try:
+                    pks = self.store.update_many(request.ids, request.filters, changes)
+                except ValueError as e:
+                    # 合并后的行不满足 schema 的约束
+                    raise HTTPException(422, str(e)) from None
+            else:
+                def apply(model_: SCHEMA) -> SCHEMA:
+                    return self.schema.model_validate({**model_.model_dump(), **changes})
+
+                pks = []
+                for pk in self._batch_pks(request):
+                    try:
+                        self.store.update(pk, apply)
+                    except KeyError:
+                        continue
+                    except ValueError as e:
+                        raise HTTPException(422, str(e)) from None
+                    pks.append(pk)
+            return ResponseModel(data=BatchWriteResult(affected=len(pks), ids=pks if request.returning else None))
+
+        return route
+
+    def _delete_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(request: self._batch_delete_request) -> Any:  # type: ignore
+            self._check_batch(request)
+            self._check_filters(request.filters)
+
+            if isinstance(self.store, MemoryStore):
+                pks = self.store.remove_many(request.ids, request.filters)
+            else:
+                pks = []
+                for pk in self._batch_pks(request):
+                    try:
+                        self.store.remove(pk)
+                    except KeyError:
+                        continue
+                    pks.append(pk)
+            return ResponseModel(data=BatchWriteResult(affected=len(pks), ids=pks if request.returning else None))
+
+        return route
+
     def _update(self, *args: Any, **kwargs: Any) -> CALLABLE:
-        def route(item_id: int, model: self.update_schema) -> Any:  # type: ignore
-            for ind, model_ in enumerate(self.models):
-                if getattr(model_, "id") == item_id:
-                    # 更新模型数据
-                    update_data = model.model_dump(exclude_unset=True)
-                    model_dict = model_.model_dump()
-                    model_dict.update(update_data)
-                    # 保持原有的 id
-                    model_dict["id"] = item_id
-                    self.models[ind] = self.schema(**model_dict)
-                    return ResponseModel(data=self.models[ind])
-            raise NOT_FOUND
+        def route(item_id: self._pk_type, model: self.update_schema) -> Any:  # type: ignore
+            if isinstance(self.store, MemoryStore) and self.store.codec is not None:
+                # 紧凑表示: 只合并提交的字段, 合并后的行与行存储一样按 schema 整行校验
+                changes = {
+                    field: getattr(model, field) for field in model.model_fields_set
+                    if field != self._pk and field in self.schema.model_fields
+                }
+                try:
+                    return ResponseModel(data=self.store.patch(item_id, changes))
+                except KeyError:
+                    raise NOT_FOUND from None
+                except ValueError as e:
+                    raise HTTPException(422, str(e)) from None
+
+            update_data = model.model_dump(exclude_unset=True)
+
+            def apply(model_: SCHEMA) -> SCHEMA:
+                # 更新模型数据
+                model_dict = model_.model_dump()
+                model_dict.update(update_data)
+                # 保持原有的主键
+                model_dict[self._pk] = item_id
+                return self.schema(**model_dict)
+
+            # 读-改-写在存储的写锁内完成, 并发更新不会互相覆盖
+            try:
+                return ResponseModel(data=self.store.update(item_id, apply))
+            except KeyError:
+                raise NOT_FOUND from None
+            except ValueError as e:
+                raise HTTPException(422, str(e)) from None
 
         return route
 
     def _delete_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        def route() -> ResponseModel[List[SCHEMA]]:
-            deleted = self.models.copy()
-            self.models.clear()
-            # 重置 ID 计数器
-            _id_counters[self._id_counter_key] = 1
-            return ResponseModel(data=deleted)
+        def route() -> DeleteAllResponseModel[List[SCHEMA]]:
+            # clear 同时重置 ID 计数器
+            deleted = self.store.clear()
+            return DeleteAllResponseModel(data=deleted, deleted_count=len(deleted))
 
         return route
 
     def _delete_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
-        def route(item_id: int) -> Any:
-            for ind, model in enumerate(self.models):
-                if getattr(model, "id") == item_id:
-                    deleted_model = self.models.pop(ind)
-                    return ResponseModel(data=deleted_model)
-            raise NOT_FOUND
+        def route(item_id: self._pk_type) -> Any:  # type: ignore
+            try:
+                deleted_model = self.store.remove(item_id)
+            except KeyError:
+                raise NOT_FOUND from None
+            return ResponseModel(data=deleted_model)
 
         return route
 
@@ -145,62 +460,29 @@ class MemoryCRUDRouter(CRUDGenerator[SCHEMA]):
         def route(
             search_params: SearchRequest,
             pagination: PAGINATION = self.pagination,
-        ) -> ResponseModel[List[SCHEMA]]:
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[SCHEMA]]:
             skip, limit = pagination.get("skip"), pagination.get("limit")
+            fields = self._fields(fields, search_params)
 
-            # 开始时获取所有模型
-            filtered_models = self.models.copy()
-
-            # 1. 应用过滤器 (filters)
-            if search_params.filters:
-                for f in search_params.filters:
-                    if f.field not in self.schema.model_fields:
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid filter field: '{f.field}' is not a valid field for {self.schema.__name__}."
-                        )
-
-                    # 过滤模型
-                    new_filtered_models = []
-                    for model in filtered_models:
-                        model_value = getattr(model, f.field, None)
-                        if model_value is None:
-                            continue
-                            
-                        if f.operator == "eq" and model_value == f.value:
-                            new_filtered_models.append(model)
-                        elif f.operator == "ne" and model_value != f.value:
-                            new_filtered_models.append(model)
-                        elif f.operator == "gt" and model_value > f.value:
-                            new_filtered_models.append(model)
-                        elif f.operator == "lt" and model_value < f.value:
-                            new_filtered_models.append(model)
-                        elif f.operator == "contains" and isinstance(model_value, str) and f.value in model_value:
-                            new_filtered_models.append(model)
-                        elif f.operator == "in" and model_value in f.value:
-                            new_filtered_models.append(model)
-                    
-                    filtered_models = new_filtered_models
-
-            # 2. 应用排序 (sorting)
-            if search_params.sorting:
-                for s in reversed(search_params.sorting):  # 反向应用排序以获得正确的顺序
-                    if s.field not in self.schema.model_fields:
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid sorting field: '{s.field}' is not a valid field for {self.schema.__name__}."
-                        )
-                    
-                    # 排序
-                    reverse = (s.direction == "desc")
-                    filtered_models.sort(key=lambda x: getattr(x, s.field, 0), reverse=reverse)
-
-            # 应用分页
-            if limit is None:
-                result = filtered_models[skip:]
-            else:
-                result = filtered_models[skip : skip + limit]
-                
-            return ResponseModel(data=result)
+            # 校验过滤和排序字段
+            self._check_filters(search_params.filters)
+            for s in search_params.sorting or []:
+                if s.field not in self.schema.model_fields:
+                    raise HTTPException(
+                        status_code=422,
+                        detail=f"Invalid sorting field: '{s.field}' is not a valid field for {self.schema.__name__}."
+                    )
+
+            # 过滤 / 排序 / 分页交给存储, 由它决定走索引还是全表扫描
+            if isinstance(self.store, MemoryStore):
+                return self._page(
+                    search_params.filters, search_params.sorting, cast(int, skip), limit, pagination.get("cursor"), fields
+                )
+            self._check_cursor(pagination.get("cursor"))
+            result = self.store.search(
+                search_params.filters, search_params.sorting, cast(int, skip), limit
+            )
+            return self._envelope(result, None, self._total(search_params.filters), fields)
 
         return route
\ No newline at end of file
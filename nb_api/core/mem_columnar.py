@@ -0,0 +1,417 @@
+"""列式内存存储 (基于 NumPy, MemoryCRUDRouter(storage="columnar") 使用)"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type, Union, get_args, get_origin
+
+from .locks import RWLock
+from .mem_store import match_value
+from .types import PYDANTIC_SCHEMA as SCHEMA, Filter, Sorting
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+    numpy_installed = False
+else:
+    numpy_installed = True
+
+try:
+    from types import UnionType  # type: ignore
+except ImportError:  # Python < 3.10
+    UnionType = Union  # type: ignore
+
+_INITIAL_CAPACITY = 1024
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    """Optional[X] / X | None -> X, 其它联合类型原样返回"""
+    if get_origin(annotation) in (Union, UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+class _Column:
+    """单个字段的一列数据, 按类型选择存储方式"""
+
+    def __init__(self, name: str, annotation: Any) -> None:
+        self.name = name
+        python_type = _unwrap_optional(annotation)
+        if python_type is bool:
+            self.kind, dtype = "bool", np.bool_
+        elif python_type is int:
+            self.kind, dtype = "int", np.int64
+        elif python_type is float:
+            self.kind, dtype = "float", np.float64
+        elif python_type is str:
+            # 字典编码: 列里只存编码, -1 表示 None
+            self.kind, dtype = "str", np.int32
+            self.dictionary: List[str] = []
+            self.codes: Dict[str, int] = {}
+        else:
+            self.kind, dtype = "object", object
+        self.data = np.zeros(_INITIAL_CAPACITY, dtype=dtype)
+        self.null = np.zeros(_INITIAL_CAPACITY, dtype=np.bool_)
+
+    def grow(self, capacity: int) -> None:
+        data = np.zeros(capacity, dtype=self.data.dtype)
+        data[: len(self.data)] = self.data
+        null = np.zeros(capacity, dtype=np.bool_)
+        null[: len(self.null)] = self.null
+        self.data, self.null = data, null
+
+    def clear(self) -> None:
+        self.data = np.zeros(_INITIAL_CAPACITY, dtype=self.data.dtype)
+        self.null = np.zeros(_INITIAL_CAPACITY, dtype=np.bool_)
+        if self.kind == "str":
+            self.dictionary = []
+            self.codes = {}
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+    def set(self, slot: int, value: Any) -> None:
+        if value is None:
+            self.null[slot] = True
+            self.data[slot] = -1 if self.kind == "str" else (None if self.kind == "object" else 0)
+            return
+        self.null[slot] = False
+        self.data[slot] = self.encode(value) if self.kind == "str" else value
+
+    def get(self, slot: int) -> Any:
+        if self.null[slot]:
+            return None
+        value = self.data[slot]
+        if self.kind == "str":
+            return self.dictionary[value]
+        if self.kind == "object":
+            return value
+        return value.item()
+
+    def compact(self, keep: Any) -> None:
+        """只保留 keep 中的槽位, 按原顺序移到数组前部"""
+        m = len(keep)
+        self.data[:m] = self.data[keep]
+        self.null[:m] = self.null[keep]
+
+    def _codes_where(self, predicate: Any) -> Any:
+        return np.fromiter(
+            (code for code, s in enumerate(self.dictionary) if predicate(s)), dtype=np.int32
+        )
+
+    def mask(self, f: Filter, n: int) -> Any:
+        """向量化计算过滤条件, 返回长度为 n 的布尔掩码"""
+        valid = ~self.null[:n]
+        data = self.data[:n]
+        op, value = f.operator, f.value
+
+        if self.kind == "str":
+            try:
+                if op == "eq":
+                    return valid & (data == self.codes.get(value, -2))
+                if op == "ne":
+                    return valid & (data != self.codes.get(value, -2))
+                if op == "in":
+                    return valid & np.isin(data, self._codes_where(lambda s: s in value))
+                if op == "contains":
+                    if not isinstance(value, str):
+                        return np.zeros(n, dtype=np.bool_)
+                    return valid & np.isin(data, self._codes_where(lambda s: value in s))
+                if op == "gt":
+                    return valid & np.isin(data, self._codes_where(lambda s: s > value))
+                if op == "lt":
+                    return valid & np.isin(data, self._codes_where(lambda s: s < value))
+            except TypeError:
+                pass
+            return np.zeros(n, dtype=np.bool_) if op != "ne" else valid
+
+        if self.kind == "object":
+            return np.fromiter((match_value(v, f) for v in data), dtype=np.bool_, count=n)
+
+        if op == "contains":
+            return np.zeros(n, dtype=np.bool_)
+        try:
+            if op == "in":
+                if not isinstance(value, (list, tuple, set, frozenset)):
+                    return np.zeros(n, dtype=np.bool_)
+                numbers = [v for v in value if isinstance(v, (int, float))]
+                if not numbers:
+                    return np.zeros(n, dtype=np.bool_)
+                return valid & np.isin(data, np.asarray(numbers))
+            if not isinstance(value, (int, float)):
+                # 与 Python 语义一致: 数值永远不等于非数值
+                return valid if op == "ne" else np.zeros(n, dtype=np.bool_)
+            if op == "eq":
+                return valid & (data == value)
+            if op == "ne":
+                return valid & (data != value)
+            if op == "gt":
+                return valid & (data > value)
+            if op == "lt":
+                return valid & (data < value)
+        except (TypeError, ValueError, OverflowError):
+            pass
+        return np.zeros(n, dtype=np.bool_)
+
+    def sort_key(self, positions: Any, descending: bool) -> List[Any]:
+        """返回供 lexsort 使用的排序键 (优先级从低到高), None 值总是排在最后"""
+        data = self.data[positions]
+        if self.kind == "str":
+            # 编码按字典序的名次排序
+            ranks = np.empty(len(self.dictionary) + 1, dtype=np.int64)
+            ranks[np.argsort(np.asarray(self.dictionary, dtype=object), kind="stable")] = np.arange(len(self.dictionary))
+            ranks[-1] = 0  # -1 (None) 的占位
+            key = ranks[data]
+        elif self.kind == "object":
+            # 退化为 Python 排序, 相等的值取相同名次以保持降序时的稳定性;
+            # 只给非 None 的位置排名次 (None 与 date / Decimal 等不可比较), None 由 null 掩码排到最后
+            order = sorted((i for i in range(len(positions)) if data[i] is not None), key=data.__getitem__)
+            key = np.zeros(len(positions), dtype=np.int64)
+            rank = 0
+            for prev, i in zip([None, *order], order):
+                if prev is not None and data[i] != data[prev]:
+                    rank += 1
+                key[i] = rank
+        elif self.kind == "bool":
+            key = data.astype(np.int8)
+        else:
+            key = data
+        return [-key if descending else key, self.null[positions]]
+
+
+class ColumnarStore:
+    """
+    列式内存存储
+
+    每个数值/布尔字段一列 NumPy 数组, 字符串字段做字典编码, 其它类型退化为 object 列;
+    过滤是向量化的布尔掩码, 排序用 lexsort, 只为返回的那一页构造 Pydantic 对象。
+    写操作持有写锁, 读操作 (含按主键读取, 因为要从多列拼出一行) 持有读锁
+
+    删除只在 alive 掩码上打墓碑, O(1); 墓碑超过 compact_ratio, 或最后一次写入后空闲
+    compact_idle 秒时, 把存活的行挪到数组前部 (压缩)。遍历、分页和搜索都跳过墓碑
+    """
+
+    def __init__(
+        self,
+        schema: Type[SCHEMA],
+        pk: str = "id",
+        compact_ratio: float = 0.25,
+        compact_idle: float = 1.0,
+    ) -> None:
+        if not numpy_installed:
+            raise ImportError("numpy must be installed to use columnar storage.")
+        self.schema = schema
+        self.pk = pk
+        self.next_id = 1
+        self.columns: Dict[str, _Column] = {
+            name: _Column(name, field.annotation) for name, field in schema.model_fields.items()
+        }
+        self.capacity = _INITIAL_CAPACITY
+        self.n = 0
+        self._slot: Dict[Any, int] = {}
+        self.alive = np.zeros(_INITIAL_CAPACITY, dtype=np.bool_)
+        self.tombstones = 0
+        self.compact_ratio = compact_ratio
+        self.compact_idle = compact_idle
+        self.compactions = 0
+        self._last_write = 0.0
+        self._idle_thread: Optional[threading.Thread] = None
+        self.lock = RWLock()
+        # 可选的持久化日志 (MemoryJournal), 在写锁内、修改之前记录每次写操作
+        self.journal: Any = None
+
+    def __len__(self) -> int:
+        return len(self._slot)
+
+    def __iter__(self) -> Iterator[SCHEMA]:
+        with self.lock.read():
+            return iter(self.snapshot_rows())
+
+    def __contains__(self, pk: Any) -> bool:
+        return pk in self._slot
+
+    def _row(self, slot: int) -> SCHEMA:
+        return self.schema.model_construct(
+            **{name: column.get(slot) for name, column in self.columns.items()}
+        )
+
+    def _write(self, slot: int, row: SCHEMA) -> None:
+        for name, column in self.columns.items():
+            column.set(slot, getattr(row, name, None))
+
+    def next_pk(self) -> int:
+        """分配下一个自增主键, 跳过已被手动占用的值"""
+        with self.lock.write():
+            return self._next_pk_locked()
+
+    def _next_pk_locked(self) -> int:
+        pk = self.next_id
+        while pk in self._slot:
+            pk += 1
+        self.next_id = pk + 1
+        return pk
+
+    def get(self, pk: Any) -> Optional[SCHEMA]:
+        with self.lock.read():
+            slot = self._slot.get(pk)
+            return None if slot is None else self._row(slot)
+
+    def insert(self, row: SCHEMA) -> SCHEMA:
+        with self.lock.write():
+            return self._insert_locked(row)
+
+    def insert_auto(self, make_row: Callable[[int], SCHEMA]) -> SCHEMA:
+        """分配自增主键并插入 make_row(主键) 生成的行, 分配和插入在同一次写锁内完成"""
+        with self.lock.write():
+            return self._insert_locked(make_row(self._next_pk_locked()))
+
+    def _insert_locked(self, row: SCHEMA) -> SCHEMA:
+        pk = getattr(row, self.pk)
+        if pk in self._slot:
+            raise KeyError(pk)
+        if self.journal is not None:
+            self.journal.log_put(row, self.next_id)
+        if self.n == self.capacity:
+            if self.tombstones:
+                self._compact()
+            else:
+                self.capacity *= 2
+                for column in self.columns.values():
+                    column.grow(self.capacity)
+                alive = np.zeros(self.capacity, dtype=np.bool_)
+                alive[: self.n] = self.alive[: self.n]
+                self.alive = alive
+        self._write(self.n, row)
+        self.alive[self.n] = True
+        self._slot[pk] = self.n
+        self.n += 1
+        self._last_write = time.monotonic()
+        return row
+
+    def replace(self, pk: Any, row: SCHEMA) -> SCHEMA:
+        with self.lock.write():
+            slot = self._slot[pk]
+            if self.journal is not None:
+                self.journal.log_put(row, self.next_id)
+            self._write(slot, row)
+            self._last_write = time.monotonic()
+        return row
+
+    def update(self, pk: Any, apply: Callable[[SCHEMA], SCHEMA]) -> SCHEMA:
+        """在写锁内用 apply(旧行) 生成新行并写回, 保证读-改-写的原子性"""
+        with self.lock.write():
+            slot = self._slot[pk]
+            row = apply(self._row(slot))
+            if self.journal is not None:
+                self.journal.log_put(row, self.next_id)
+            self._write(slot, row)
+            self._last_write = time.monotonic()
+            return row
+
+    def remove(self, pk: Any) -> SCHEMA:
+        with self.lock.write():
+            slot = self._slot[pk]
+            if self.journal is not None:
+                self.journal.log_delete(pk)
+            del self._slot[pk]
+            row = self._row(slot)
+            self.alive[slot] = False
+            self.tombstones += 1
+            self._last_write = time.monotonic()
+            if self.tombstones > self.n * self.compact_ratio:
+                self._compact()
+            elif self._idle_thread is None and self.compact_idle > 0:
+                self._idle_thread = threading.Thread(
+                    target=self._idle_compaction, name="nb_api-columnar-compact", daemon=True
+                )
+                self._idle_thread.start()
+            return row
+
+    def _compact(self) -> None:
+        """去掉墓碑, 存活的行保持原顺序挪到前部 (调用方持有写锁)"""
+        keep = np.flatnonzero(self.alive[: self.n])
+        for column in self.columns.values():
+            column.compact(keep)
+        m = len(keep)
+        self.alive[:m] = True
+        self.alive[m : self.n] = False
+        pk_column = self.columns[self.pk]
+        self._slot = {pk_column.get(slot): slot for slot in range(m)}
+        self.n = m
+        self.tombstones = 0
+        self.compactions += 1
+
+    def _idle_compaction(self) -> None:
+        """后台线程: 删除之后空闲 compact_idle 秒再压缩, 期间有写入就继续等"""
+        while True:
+            time.sleep(self.compact_idle)
+            with self.lock.write():
+                if self.tombstones and time.monotonic() - self._last_write < self.compact_idle:
+                    continue
+                if self.tombstones:
+                    self._compact()
+                self._idle_thread = None
+                return
+
+    def clear(self) -> List[SCHEMA]:
+        """清空存储并重置自增主键, 返回被删除的行"""
+        with self.lock.write():
+            if self.journal is not None:
+                self.journal.log_clear()
+            deleted = self.snapshot_rows()
+            # 换上新的空数组, 旧数组整体丢弃
+            for column in self.columns.values():
+                column.clear()
+            self.capacity = _INITIAL_CAPACITY
+            self.alive = np.zeros(_INITIAL_CAPACITY, dtype=np.bool_)
+            self.n = 0
+            self.tombstones = 0
+            self._slot = {}
+            self.next_id = 1
+            self._last_write = time.monotonic()
+            return deleted
+
+    def _live_slots(self) -> Any:
+        if not self.tombstones:
+            return np.arange(self.n)
+        return np.flatnonzero(self.alive[: self.n])
+
+    def snapshot_rows(self) -> List[SCHEMA]:
+        """当前全部行的快照 (调用方需持有锁)"""
+        return [self._row(int(slot)) for slot in self._live_slots()]
+
+    def search(
+        self,
+        filters: Optional[List[Filter]] = None,
+        sorting: Optional[List[Sorting]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[SCHEMA]:
+        stop = None if limit is None else skip + limit
+        with self.lock.read():
+            n = self.n
+            mask = self.alive[:n].copy()
+            for f in filters or []:
+                mask &= self.columns[f.field].mask(f, n)
+            positions = np.nonzero(mask)[0]
+
+            if sorting and len(positions) > 1:
+                keys: List[Any] = []
+                for s in reversed(sorting):  # lexsort 以最后一个键为主键
+                    keys.extend(self.columns[s.field].sort_key(positions, s.direction == "desc"))
+                positions = positions[np.lexsort(keys)]
+
+            return [self._row(int(slot)) for slot in positions[skip:stop]]
+
+    def page(self, skip: int = 0, limit: Optional[int] = None) -> List[SCHEMA]:
+        stop = None if limit is None else skip + limit
+        with self.lock.read():
+            if not self.tombstones:
+                return [self._row(slot) for slot in range(skip, self.n if stop is None else min(self.n, stop))]
+            return [self._row(int(slot)) for slot in self._live_slots()[skip:stop]]
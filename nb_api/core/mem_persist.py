@@ -0,0 +1,261 @@
+"""内存存储的持久化: 追加写日志 (WAL) + 定期快照"""
+
+import atexit
+import glob
+import json
+import logging
+import mmap
+import os
+import threading
+from typing import Any, Iterator, List, Optional, Tuple, Type
+
+from pydantic import TypeAdapter
+
+from .types import PYDANTIC_SCHEMA as SCHEMA
+
+logger = logging.getLogger("nb_api")
+
+
+def _fsync_dir(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:  # Windows 不支持打开目录
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _iter_lines(path: str) -> Iterator[Tuple[bytes, int]]:
+    """用 mmap 逐行读取文件, 返回 (行内容, 行尾偏移)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while True:
+                line = mm.readline()
+                if not line:
+                    return
+                yield line, mm.tell()
+
+
+class MemoryJournal:
+    """
+    MemoryCRUDRouter 的持久化日志
+
+    - 每次写操作在存储的写锁内、修改存储之前追加一行 JSON 到 WAL, 只写进进程内缓冲区, 不等待磁盘;
+      写日志失败 (如无法编码) 时存储不被修改
+    - 删除记录的主键按 schema 中主键字段的类型编码 / 解码, 支持 UUID、datetime、Decimal 等主键
+    - 后台线程每 fsync_interval 秒 flush + fsync 一次 (组提交); fsync_interval=0 时每次写都同步落盘
+    - 累计 snapshot_every 条日志后切换到新一代 WAL, 后台把当时的全部行写成快照,
+      快照落盘后删除旧的 WAL
+    - 启动时 mmap 读取最新快照, 再重放快照之后的 WAL
+
+    文件布局: {directory}/{name}.snapshot, {directory}/{name}.wal.{generation}
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        schema: Type[SCHEMA],
+        fsync_interval: float = 0.01,
+        snapshot_every: int = 100_000,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.schema = schema
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        self.generation = 0
+        self.records = 0
+        self._file: Any = None
+        self._dirty = False
+        self._io_lock = threading.Lock()
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self._store: Any = None
+        self._pk_adapter: Any = None
+
+    # --- 路径 ---
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.snapshot")
+
+    def _wal_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"{self.name}.wal.{generation}")
+
+    def _wal_generations(self) -> List[int]:
+        generations = []
+        pattern = os.path.join(glob.escape(self.directory), glob.escape(self.name) + ".wal.*")
+        for path in glob.glob(pattern):
+            suffix = path.rsplit(".", 1)[-1]
+            if suffix.isdigit():
+                generations.append(int(suffix))
+        return sorted(generations)
+
+    # --- 启动恢复 ---
+
+    def open(self, store: Any) -> None:
+        """从快照和 WAL 恢复 store, 然后开始记录它的写操作"""
+        self._pk_adapter = TypeAdapter(self.schema.model_fields[store.pk].annotation)
+        generation = self._load_snapshot(store)
+        for gen in self._wal_generations():
+            if gen >= generation:
+                self._replay(store, gen)
+                generation = gen
+            else:
+                os.remove(self._wal_path(gen))
+
+        self.generation = generation
+        self._file = open(self._wal_path(generation), "ab")
+        self._store = store
+        store.journal = self
+
+        if self.fsync_interval > 0:
+            threading.Thread(target=self._fsync_loop, name=f"nb_api-wal-{self.name}", daemon=True).start()
+        atexit.register(self.close)
+
+    def _load_snapshot(self, store: Any) -> int:
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        lines = _iter_lines(self.snapshot_path)
+        header = json.loads(next(lines)[0])
+        for line, _ in lines:
+            store.insert(self.schema.model_validate_json(line))
+        store.next_id = header["next_id"]
+        return header["generation"]
+
+    def _replay(self, store: Any, generation: int) -> None:
+        path = self._wal_path(generation)
+        good = 0
+        for line, end in _iter_lines(path):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 崩溃时写了一半的最后一行
+                break
+            op = record["op"]
+            if op == "put":
+                row = self.schema.model_validate(record["row"])
+                pk = getattr(row, store.pk)
+                if pk in store:
+                    store.replace(pk, row)
+                else:
+                    store.insert(row)
+                store.next_id = record["next_id"]
+            elif op == "del":
+                pk = self._pk_adapter.validate_python(record["pk"])
+                if pk in store:
+                    store.remove(pk)
+            elif op == "clear":
+                store.clear()
+            good = end
+        if good < os.path.getsize(path):
+            logger.warning(f"Truncating torn tail of {path} at offset {good}")
+            with open(path, "r+b") as f:
+                f.truncate(good)
+
+    # --- 写路径 (调用方持有存储的写锁, 在修改存储之前调用) ---
+
+    def _append(self, line: bytes) -> None:
+        # 先切换 WAL 再写入: 快照取的是这次修改之前的行, 这条记录写进新一代 WAL, 不会随旧 WAL 删除
+        if self.records >= self.snapshot_every:
+            self._start_snapshot()
+        with self._io_lock:
+            self._file.write(line)
+            if self.fsync_interval <= 0:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            else:
+                self._dirty = True
+        self.records += 1
+
+    def log_put(self, row: SCHEMA, next_id: int) -> None:
+        self._append(b'{"op":"put","next_id":%d,"row":%s}\n' % (next_id, row.model_dump_json().encode()))
+
+    def log_delete(self, pk: Any) -> None:
+        encoded = json.dumps(self._pk_adapter.dump_python(pk, mode="json"))
+        self._append(b'{"op":"del","pk":%s}\n' % encoded.encode())
+
+    def log_clear(self) -> None:
+        self._append(b'{"op":"clear"}\n')
+
+    # --- 组提交 ---
+
+    def _fsync_loop(self) -> None:
+        while not self._closed.wait(self.fsync_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        """把缓冲区中的日志刷到磁盘"""
+        with self._io_lock:
+            if not self._dirty or self._file is None:
+                return
+            self._file.flush()
+            self._dirty = False
+            # fsync 在锁外进行, 不阻塞写路径
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # --- 快照 ---
+
+    def _start_snapshot(self) -> None:
+        """切换到新一代 WAL, 在后台把当前全部行写成快照 (调用方持有存储的写锁)"""
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        rows = self._store.snapshot_rows()
+        next_id = self._store.next_id
+        with self._io_lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self.generation += 1
+            self._file = open(self._wal_path(self.generation), "ab")
+            self._dirty = False
+        self.records = 0
+        self._snapshot_thread = threading.Thread(
+            target=self._write_snapshot, args=(rows, next_id, self.generation),
+            name=f"nb_api-snapshot-{self.name}", daemon=True,
+        )
+        self._snapshot_thread.start()
+
+    def _write_snapshot(self, rows: List[SCHEMA], next_id: int, generation: int) -> None:
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(json.dumps({"generation": generation, "next_id": next_id}).encode() + b"\n")
+            for row in rows:
+                f.write(row.model_dump_json().encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        _fsync_dir(self.directory)
+        for gen in self._wal_generations():
+            if gen < generation:
+                os.remove(self._wal_path(gen))
+
+    def snapshot(self) -> None:
+        """立即生成一次快照并等待完成"""
+        with self._store.lock.write():
+            self._start_snapshot()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self.sync()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
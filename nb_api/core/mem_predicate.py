@@ -0,0 +1,57 @@
+"""把搜索过滤条件编译成单个谓词函数 (内存后端使用)"""
+
+import keyword
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple
+
+from .types import Filter
+
+PREDICATE = Callable[[Any], bool]
+
+# 查询形状: ((字段, 操作符), ...), 过滤值不参与缓存键, 作为参数绑定
+SHAPE = Tuple[Tuple[str, str], ...]
+
+_EXPRESSIONS = {
+    "eq": "x == {v}",
+    "ne": "x != {v}",
+    "gt": "x > {v}",
+    "lt": "x < {v}",
+    "contains": "isinstance(x, str) and {v} in x",
+    "in": "x in {v}",
+}
+
+
+def _accessor(field: str) -> str:
+    if field.isidentifier() and not keyword.iskeyword(field):
+        return f"row.{field}"
+    return f"getattr(row, {field!r}, None)"
+
+
+@lru_cache(maxsize=256)
+def compile_shape(shape: SHAPE) -> Callable[..., PREDICATE]:
+    """
+    为一种查询形状生成谓词工厂: factory(v0, v1, ...) -> predicate(row)
+
+    生成的谓词在一次调用里依次检查所有条件, 没有逐行的操作符分派;
+    字段值为 None 的行不匹配任何条件, 与逐条过滤的语义一致
+    """
+    params = [f"v{i}" for i in range(len(shape))]
+    lines = [f"def factory({', '.join(params)}):", "    def predicate(row):"]
+    for (field, operator), param in zip(shape, params):
+        lines.append(f"        x = {_accessor(field)}")
+        lines.append(f"        if x is None or not ({_EXPRESSIONS[operator].format(v=param)}):")
+        lines.append("            return False")
+    lines.append("        return True")
+    lines.append("    return predicate")
+
+    namespace: dict = {}
+    exec(compile("\n".join(lines), f"<nb_api predicate {shape!r}>", "exec"), namespace)
+    return namespace["factory"]
+
+
+def compile_filters(filters: Optional[List[Filter]]) -> Optional[PREDICATE]:
+    """把过滤条件编译成谓词, 没有过滤条件时返回 None"""
+    if not filters:
+        return None
+    shape = tuple((f.field, f.operator) for f in filters)
+    return compile_shape(shape)(*(f.value for f in filters))
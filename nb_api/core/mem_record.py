@@ -0,0 +1,56 @@
+"""紧凑行表示: 按 schema 字段生成的 __slots__ 记录类 (MemoryCRUDRouter(compact=True) 使用)"""
+
+from functools import lru_cache
+from typing import Any, Callable, Dict, Tuple, Type
+
+from .types import PYDANTIC_SCHEMA as SCHEMA
+
+
+class RecordCodec:
+    """
+    schema <-> __slots__ 记录 的转换器
+
+    记录只有字段槽位, 没有 __dict__ 和 Pydantic 的元数据, 每行占用的内存小得多;
+    记录上的字段可以像模型一样用 row.field 读取, 因此索引、谓词和排序键无需区分两种表示。
+    转换函数按字段列表生成代码, 没有逐字段的循环
+    """
+
+    def __init__(self, schema: Type[SCHEMA]) -> None:
+        self.schema = schema
+        self.fields: Tuple[str, ...] = tuple(schema.model_fields)
+        self.record_type = type(f"{schema.__name__}Record", (), {"__slots__": self.fields})
+
+        assigns = "".join(f"    r.{f} = src.{f}\n" for f in self.fields)
+        if schema.__private_attributes__ or schema.model_config.get("extra") == "allow":
+            kwargs = ", ".join(f"{f}=r.{f}" for f in self.fields)
+            unpack = f"def unpack(r):\n    return construct({kwargs})\n"
+        else:
+            # 与 model_construct 的结果相同, 但省掉了它逐字段处理默认值和别名的开销
+            items = ", ".join(f"{f!r}: r.{f}" for f in self.fields)
+            unpack = (
+                "def unpack(r):\n    m = new(schema)\n"
+                f"    setattr_(m, '__dict__', {{{items}}})\n"
+                "    setattr_(m, '__pydantic_fields_set__', set(fields))\n"
+                "    setattr_(m, '__pydantic_extra__', None)\n"
+                "    setattr_(m, '__pydantic_private__', None)\n"
+                "    return m\n"
+            )
+        source = f"def pack(src):\n    r = new(cls)\n{assigns}    return r\n" + unpack
+        namespace: Dict[str, Any] = {
+            "new": object.__new__, "setattr_": object.__setattr__, "cls": self.record_type,
+            "schema": schema, "fields": self.fields, "construct": schema.model_construct,
+        }
+        exec(compile(source, f"<nb_api record {schema.__name__}>", "exec"), namespace)
+
+        # 模型 -> 记录
+        self.pack: Callable[[SCHEMA], Any] = namespace["pack"]
+        # 记录 -> 新记录 (写时复制), 记录和模型的字段读取方式相同, 直接复用 pack
+        self.copy: Callable[[Any], Any] = namespace["pack"]
+        # 记录 -> 模型, 跳过校验 (等价于 model_construct), 只在返回响应时调用
+        self.unpack: Callable[[Any], SCHEMA] = namespace["unpack"]
+
+
+@lru_cache(maxsize=None)
+def get_record_codec(schema: Type[SCHEMA]) -> RecordCodec:
+    """每个 schema 只生成一次转换器"""
+    return RecordCodec(schema)
@@ -0,0 +1,451 @@
+"""跨进程共享内存存储 (MemoryCRUDRouter(storage="shared") 使用)"""
+
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from itertools import islice
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+from pydantic import TypeAdapter
+
+from .locks import ProcessLock
+from .mem_predicate import compile_filters
+from .mem_store import select
+from .types import PYDANTIC_SCHEMA as SCHEMA, Filter, Sorting
+
+_MAGIC = b"NBAPISHM"
+
+# 头部: magic, schema 指纹, capacity, slot_size, table_size, used (已用槽位高水位), count, next_id, version
+_HEADER = struct.Struct("<8s8q")
+_HEADER_SIZE = 128
+_VERSION_OFFSET = 8 + 7 * 8
+_USED, _COUNT, _NEXT_ID = 4, 5, 6
+
+# 哈希表项: (pk 哈希, 槽位号), 槽位号 -1 表示空, -2 表示已删除
+_ENTRY = struct.Struct("<qq")
+_EMPTY, _DELETED = -1, -2
+
+# 槽位头: 状态 (1 = 有效), pk 长度, 行长度, 写入时的版本号; 后面紧跟 pk 和行的 JSON
+_SLOT = struct.Struct("<BxHIq")
+_LIVE = 1
+
+# version 为奇数 (有写者) 时读者自旋等待的最长时间, 超过后改为持锁读取
+_SPIN_TIMEOUT = 0.05
+
+
+class _TornRead(Exception):
+    """seqlock 读取期间数据被写者修改"""
+
+
+def _hash(pk: bytes) -> int:
+    # 不能用内置 hash(): 它在每个进程里加了不同的随机盐
+    return zlib.crc32(pk)
+
+
+def _schema_fingerprint(schema: Type[SCHEMA]) -> int:
+    fields = json.dumps([[name, repr(field.annotation)] for name, field in schema.model_fields.items()])
+    return zlib.crc32(f"{schema.__name__}:{fields}".encode())
+
+
+def _open_shared_memory(name: str, create: bool, size: int = 0) -> shared_memory.SharedMemory:
+    """打开共享内存段, 并且不让 resource_tracker 在本进程退出时删除它"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+    shm = shared_memory.SharedMemory(name, create=create, size=size)
+    # Python < 3.13 会在任意一个 (哪怕只是 attach 的) 进程退出时 unlink 共享内存, 数据随之丢失
+    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    return shm
+
+
+class SharedMemoryStore:
+    """
+    多个进程 (如 uvicorn --workers N) 共享的内存存储
+
+    一块 multiprocessing.shared_memory 里依次是头部、开放寻址的 pk 哈希表和定宽的行槽位,
+    每个槽位存一行的 JSON; 第一个进程创建并初始化, 其它进程直接 attach, 所有进程读到同一份数据。
+
+    - 写操作持有跨进程锁 (锁文件上的 flock), 同时用头部的 version 做 seqlock:
+      写前 version 变为奇数, 写完再变为偶数
+    - 读操作不加锁, 直接读共享内存, 读前后 version 不同就重试;
+      version 保持奇数超过 _SPIN_TIMEOUT 秒时改为持锁读取: 写者还活着就等它写完,
+      写者在写到一半时退出了 (flock 已由系统释放) 就把 version 修复为偶数
+      每个进程按 (槽位, 写入版本) 缓存解码后的行, 搜索只需重新解码变化过的槽位,
+      因此 CPU 密集的搜索可以在各个 worker 进程里并行
+    - 槽位按插入顺序分配, 删除只留下空洞, 槽位用完时先压缩空洞, 仍然不够才报错
+
+    共享内存段在所有进程退出后依然存在 (直到 unlink() 或重启系统), 重启服务后数据还在
+    """
+
+    def __init__(
+        self,
+        schema: Type[SCHEMA],
+        name: str,
+        pk: str = "id",
+        capacity: int = 10_000,
+        slot_size: int = 1024,
+    ) -> None:
+        self.schema = schema
+        self.pk = pk
+        # 主键按 schema 中主键字段的类型编码成 JSON, 支持 UUID、datetime、Decimal 等主键
+        self._pk_adapter = TypeAdapter(schema.model_fields[pk].annotation)
+        self.name = f"nb_api_{name}"
+        self.lock = ProcessLock(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"))
+        # 不支持持久化日志, 属性只为与其它存储保持一致
+        self.journal: Any = None
+
+        table_size = 1
+        while table_size < capacity * 2:
+            table_size *= 2
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.table_size = table_size
+        self._table_offset = _HEADER_SIZE
+        self._slots_offset = _HEADER_SIZE + table_size * _ENTRY.size
+        fingerprint = _schema_fingerprint(schema)
+
+        with self.lock.write():
+            try:
+                self._shm = _open_shared_memory(self.name, create=False)
+            except FileNotFoundError:
+                size = self._slots_offset + capacity * slot_size
+                self._shm = _open_shared_memory(self.name, create=True, size=size)
+                self.buf = self._shm.buf
+                self._clear_table()
+                _HEADER.pack_into(self.buf, 0, _MAGIC, fingerprint, capacity, slot_size, table_size, 0, 0, 1, 0)
+            else:
+                self.buf = self._shm.buf
+                header = _HEADER.unpack_from(self.buf, 0)
+                if header[:5] != (_MAGIC, fingerprint, capacity, slot_size, table_size):
+                    raise ValueError(
+                        f"Shared memory '{self.name}' already exists with a different schema or layout; "
+                        f"unlink it (SharedMemoryStore.unlink) or use another prefix."
+                    )
+                if self._version() % 2:
+                    # 上一个写者在写到一半时崩溃了, 让读者不再等待
+                    self._set_version(self._version() + 1)
+
+        # 本进程的解码缓存: 槽位 -> (写入版本, 行)
+        self._cache: Dict[int, Tuple[int, SCHEMA]] = {}
+
+    # --- 头部 ---
+
+    def _header(self, i: int) -> int:
+        return struct.unpack_from("<q", self.buf, 8 + i * 8)[0]
+
+    def _set_header(self, i: int, value: int) -> None:
+        struct.pack_into("<q", self.buf, 8 + i * 8, value)
+
+    def _version(self) -> int:
+        return struct.unpack_from("<q", self.buf, _VERSION_OFFSET)[0]
+
+    def _set_version(self, value: int) -> None:
+        struct.pack_into("<q", self.buf, _VERSION_OFFSET, value)
+
+    @property
+    def next_id(self) -> int:
+        return self._header(_NEXT_ID)
+
+    @next_id.setter
+    def next_id(self, value: int) -> None:
+        with self.lock.write():
+            self._set_header(_NEXT_ID, value)
+
+    # --- 无锁读取 (seqlock) ---
+
+    def _read(self, fn: Callable[[], Any]) -> Any:
+        deadline = None
+        while True:
+            version = self._version()
+            if version % 2:
+                if deadline is None:
+                    deadline = time.monotonic() + _SPIN_TIMEOUT
+                elif time.monotonic() > deadline:
+                    return self._locked_read(fn)
+                time.sleep(0)
+                continue
+            try:
+                result = fn()
+            except Exception:
+                if self._version() == version:
+                    raise
+                continue
+            if self._version() == version:
+                return result
+
+    def _locked_read(self, fn: Callable[[], Any]) -> Any:
+        """持跨进程锁读取; 拿到锁时 version 仍为奇数, 说明上一个写者写到一半时退出了"""
+        with self.lock.write():
+            version = self._version()
+            if version % 2:
+                self._set_version(version + 1)
+            return fn()
+
+    def _pk_bytes(self, pk: Any) -> bytes:
+        return json.dumps(self._pk_adapter.dump_python(pk, mode="json")).encode()
+
+    def _slot_offset(self, slot: int) -> int:
+        return self._slots_offset + slot * self.slot_size
+
+    def _slot_pk(self, slot: int) -> bytes:
+        offset = self._slot_offset(slot)
+        _, pk_len, _, _ = _SLOT.unpack_from(self.buf, offset)
+        start = offset + _SLOT.size
+        return bytes(self.buf[start : start + pk_len])
+
+    def _decode(self, slot: int) -> Tuple[int, SCHEMA]:
+        offset = self._slot_offset(slot)
+        state, pk_len, row_len, stamp = _SLOT.unpack_from(self.buf, offset)
+        if state != _LIVE:
+            raise _TornRead(slot)
+        start = offset + _SLOT.size + pk_len
+        return stamp, self.schema.model_validate_json(bytes(self.buf[start : start + row_len]))
+
+    def _find(self, pk: bytes) -> Tuple[int, int]:
+        """返回 (哈希表位置, 槽位号), 不存在时槽位号为 -1"""
+        h = _hash(pk)
+        mask = self.table_size - 1
+        i = h & mask
+        for _ in range(self.table_size):
+            entry_h, slot = _ENTRY.unpack_from(self.buf, self._table_offset + i * _ENTRY.size)
+            if slot == _EMPTY:
+                return i, _EMPTY
+            if slot != _DELETED and entry_h == h and self._slot_pk(slot) == pk:
+                return i, slot
+            i = (i + 1) & mask
+        return -1, _EMPTY
+
+    def _cached(self, slot: int, new: Dict[int, Tuple[int, SCHEMA]]) -> SCHEMA:
+        stamp = _SLOT.unpack_from(self.buf, self._slot_offset(slot))[3]
+        cached = self._cache.get(slot)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        new[slot] = entry = self._decode(slot)
+        return entry[1]
+
+    def _get(self, pk: bytes) -> Tuple[Optional[SCHEMA], Dict[int, Tuple[int, SCHEMA]]]:
+        new: Dict[int, Tuple[int, SCHEMA]] = {}
+        _, slot = self._find(pk)
+        return (None if slot == _EMPTY else self._cached(slot, new)), new
+
+    def _load(self) -> Tuple[List[SCHEMA], Dict[int, Tuple[int, SCHEMA]]]:
+        new: Dict[int, Tuple[int, SCHEMA]] = {}
+        rows = []
+        for slot in range(self._header(_USED)):
+            if self.buf[self._slot_offset(slot)] == _LIVE:
+                rows.append(self._cached(slot, new))
+        return rows, new
+
+    def _rows(self) -> List[SCHEMA]:
+        """按插入顺序返回所有行, 只解码本进程缓存之后变化过的槽位"""
+        rows, new = self._read(self._load)
+        # 只有通过 seqlock 校验的读取结果才能进入缓存
+        self._cache.update(new)
+        if len(self._cache) > len(rows) * 2 + 1024:
+            used = self._header(_USED)
+            self._cache = {slot: entry for slot, entry in self._cache.items() if slot < used}
+        return rows
+
+    def __len__(self) -> int:
+        return self._header(_COUNT)
+
+    def __iter__(self) -> Iterator[SCHEMA]:
+        return iter(self._rows())
+
+    def __contains__(self, pk: Any) -> bool:
+        return self._read(lambda: self._find(self._pk_bytes(pk))[1]) != _EMPTY
+
+    def get(self, pk: Any) -> Optional[SCHEMA]:
+        row, new = self._read(lambda: self._get(self._pk_bytes(pk)))
+        self._cache.update(new)
+        return row
+
+    # --- 写操作 (持有跨进程锁, 并推进 seqlock 版本) ---
+
+    def _begin(self) -> int:
+        version = self._version() + 1
+        self._set_version(version)
+        return version
+
+    def _end(self, version: int) -> None:
+        self._set_version(version + 1)
+
+    def _write_slot(self, slot: int, pk: bytes, payload: bytes, stamp: int) -> None:
+        offset = self._slot_offset(slot)
+        start = offset + _SLOT.size
+        self.buf[start : start + len(pk)] = pk
+        self.buf[start + len(pk) : start + len(pk) + len(payload)] = payload
+        _SLOT.pack_into(self.buf, offset, _LIVE, len(pk), len(payload), stamp)
+
+    def _encode(self, row: SCHEMA) -> Tuple[bytes, bytes]:
+        pk = self._pk_bytes(getattr(row, self.pk))
+        payload = row.model_dump_json().encode()
+        size = _SLOT.size + len(pk) + len(payload)
+        if size > self.slot_size:
+            raise ValueError(f"Row is too large for shared memory slot ({size} > {self.slot_size} bytes).")
+        return pk, payload
+
+    def _set_entry(self, i: int, h: int, slot: int) -> None:
+        _ENTRY.pack_into(self.buf, self._table_offset + i * _ENTRY.size, h, slot)
+
+    def _clear_table(self) -> None:
+        # 全 0xff 即 (hash=-1, slot=-1)
+        self.buf[self._table_offset : self._slots_offset] = b"\xff" * (self._slots_offset - self._table_offset)
+
+    def _compact(self, stamp: int) -> None:
+        """把有效行挪到槽位区的前部, 并重建哈希表"""
+        self._clear_table()
+        used = 0
+        for slot in range(self._header(_USED)):
+            offset = self._slot_offset(slot)
+            if self.buf[offset] != _LIVE:
+                continue
+            if slot != used:
+                target = self._slot_offset(used)
+                self.buf[target : target + self.slot_size] = self.buf[offset : offset + self.slot_size]
+                struct.pack_into("<q", self.buf, target + 8, stamp)
+            pk = self._slot_pk(used)
+            i, _ = self._find(pk)
+            self._set_entry(i, _hash(pk), used)
+            used += 1
+        self._set_header(_USED, used)
+
+    def next_pk(self) -> int:
+        """分配下一个自增主键, 跳过已被手动占用的值"""
+        with self.lock.write():
+            return self._next_pk_locked()
+
+    def _next_pk_locked(self) -> int:
+        pk = self._header(_NEXT_ID)
+        while self._find(self._pk_bytes(pk))[1] != _EMPTY:
+            pk += 1
+        self._set_header(_NEXT_ID, pk + 1)
+        return pk
+
+    def insert(self, row: SCHEMA) -> SCHEMA:
+        pk, payload = self._encode(row)
+        with self.lock.write():
+            return self._insert_locked(row, pk, payload)
+
+    def insert_auto(self, make_row: Callable[[int], SCHEMA]) -> SCHEMA:
+        """分配自增主键并插入 make_row(主键) 生成的行, 分配和插入在同一次跨进程锁内完成"""
+        with self.lock.write():
+            row = make_row(self._next_pk_locked())
+            return self._insert_locked(row, *self._encode(row))
+
+    def _insert_locked(self, row: SCHEMA, pk: bytes, payload: bytes) -> SCHEMA:
+        i, slot = self._find(pk)
+        if slot != _EMPTY:
+            raise KeyError(getattr(row, self.pk))
+        version = self._begin()
+        try:
+            if self._header(_USED) == self.capacity:
+                if self._header(_COUNT) == self.capacity:
+                    raise ValueError(f"Shared memory store is full (capacity={self.capacity}).")
+                self._compact(version)
+                i, _ = self._find(pk)
+            slot = self._header(_USED)
+            self._write_slot(slot, pk, payload, version)
+            self._set_entry(i, _hash(pk), slot)
+            self._set_header(_USED, slot + 1)
+            self._set_header(_COUNT, self._header(_COUNT) + 1)
+        finally:
+            self._end(version)
+        return row
+
+    def replace(self, pk: Any, row: SCHEMA) -> SCHEMA:
+        """替换已有行, 保持其在插入顺序中的位置"""
+        return self.update(pk, lambda _: row)
+
+    def update(self, pk: Any, apply: Callable[[SCHEMA], SCHEMA]) -> SCHEMA:
+        """在跨进程锁内用 apply(旧行) 生成新行并写回, 保证读-改-写的原子性"""
+        key = self._pk_bytes(pk)
+        with self.lock.write():
+            _, slot = self._find(key)
+            if slot == _EMPTY:
+                raise KeyError(pk)
+            row = apply(self._decode(slot)[1])
+            new_key, payload = self._encode(row)
+            version = self._begin()
+            try:
+                self._write_slot(slot, new_key, payload, version)
+            finally:
+                self._end(version)
+            return row
+
+    def remove(self, pk: Any) -> SCHEMA:
+        key = self._pk_bytes(pk)
+        with self.lock.write():
+            i, slot = self._find(key)
+            if slot == _EMPTY:
+                raise KeyError(pk)
+            row = self._decode(slot)[1]
+            version = self._begin()
+            try:
+                self.buf[self._slot_offset(slot)] = 0
+                self._set_entry(i, _hash(key), _DELETED)
+                self._set_header(_COUNT, self._header(_COUNT) - 1)
+            finally:
+                self._end(version)
+            return row
+
+    def clear(self) -> List[SCHEMA]:
+        """清空存储并重置自增主键, 返回被删除的行"""
+        with self.lock.write():
+            deleted = self.snapshot_rows()
+            version = self._begin()
+            try:
+                self._clear_table()
+                for slot in range(self._header(_USED)):
+                    self.buf[self._slot_offset(slot)] = 0
+                self._set_header(_USED, 0)
+                self._set_header(_COUNT, 0)
+                self._set_header(_NEXT_ID, 1)
+            finally:
+                self._end(version)
+            return deleted
+
+    def snapshot_rows(self) -> List[SCHEMA]:
+        """当前全部行的快照 (调用方需持有锁)"""
+        return [
+            self._decode(slot)[1]
+            for slot in range(self._header(_USED))
+            if self.buf[self._slot_offset(slot)] == _LIVE
+        ]
+
+    # --- 查询 ---
+
+    def search(
+        self,
+        filters: Optional[List[Filter]] = None,
+        sorting: Optional[List[Sorting]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[SCHEMA]:
+        stop = None if limit is None else skip + limit
+        return select(self._rows(), compile_filters(filters or []), sorting or [], skip, stop)
+
+    def page(self, skip: int = 0, limit: Optional[int] = None) -> List[SCHEMA]:
+        stop = None if limit is None else skip + limit
+        return list(islice(self._rows(), skip, stop))
+
+    # --- 生命周期 ---
+
+    def close(self) -> None:
+        """断开本进程与共享内存的连接"""
+        self.buf = None  # type: ignore[assignment]
+        self._cache.clear()
+        self._shm.close()
+        self.lock.close()
+
+    def unlink(self) -> None:
+        """销毁共享内存段 (所有进程都不再使用时调用)"""
+        self.close()
+        if sys.version_info < (3, 13):
+            # unlink() 会向 resource_tracker 注销, 先补上打开时注销掉的登记
+            resource_tracker.register(self._shm._name, "shared_memory")  # type: ignore[attr-defined]
+        self._shm.unlink()
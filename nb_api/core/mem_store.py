@@ -0,0 +1,991 @@
+"""内存存储引擎 (MemoryCRUDRouter 的底层数据结构)"""
+
+import heapq
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from itertools import islice
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from .locks import RWLock
+from .mem_predicate import PREDICATE, compile_filters
+from .mem_record import RecordCodec
+from .types import PYDANTIC_SCHEMA as SCHEMA, Filter, Sorting
+
+# 索引给出的查询计划: (估算候选行数, 取出候选主键的函数)
+PLAN = Tuple[int, Callable[[], Iterable[Any]]]
+
+_INF = float("inf")
+_NOTHING = object()
+
+
+def match_value(model_value: Any, f: Filter) -> bool:
+    """判断字段值是否满足单个过滤条件, 字段值为 None 时永远不匹配"""
+    if model_value is None:
+        return False
+
+    if f.operator == "eq":
+        return model_value == f.value
+    if f.operator == "ne":
+        return model_value != f.value
+    if f.operator == "gt":
+        return model_value > f.value
+    if f.operator == "lt":
+        return model_value < f.value
+    if f.operator == "contains":
+        return isinstance(model_value, str) and f.value in model_value
+    if f.operator == "in":
+        return model_value in f.value
+    return False
+
+
+class _Desc:
+    """反转比较方向的包装, 让降序字段可以和升序字段放进同一个组合排序键"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __eq__(self, other: Any) -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: "_Desc") -> bool:
+        return other.value < self.value
+
+
+def sort_key(sorting: List[Sorting]) -> Callable[[Any], Tuple[Any, ...]]:
+    """
+    把多个排序条件编译成一个组合排序键, 值为 None 的行无论升降序都排在最后
+
+    配合稳定排序 (sorted / heapq.nsmallest), 结果与逐个条件多次稳定排序一致
+    """
+    fields = [(s.field, s.direction == "desc") for s in sorting]
+
+    def key(row: Any) -> Tuple[Any, ...]:
+        parts: List[Any] = []
+        for field, desc in fields:
+            value = getattr(row, field, None)
+            parts.append(value is None)
+            parts.append(_Desc(value) if desc else value)
+        return tuple(parts)
+
+    return key
+
+
+def select(
+    candidates: Iterable[Any],
+    predicate: Optional[PREDICATE],
+    sorting: List[Sorting],
+    skip: int,
+    stop: Optional[int],
+) -> List[Any]:
+    """
+    对候选行做过滤 + 排序 + 分页
+
+    不排序时惰性过滤, 取满一页即停止; 排序且有 stop 时用堆只保留前 stop 行, O(n log k);
+    排序且无 stop 时按组合键整体排序一次
+    """
+    if predicate is not None:
+        candidates = filter(predicate, candidates)
+    if not sorting:
+        return list(islice(candidates, skip, stop))
+    key = sort_key(sorting)
+    if stop is None:
+        return sorted(candidates, key=key)[skip:]
+    return heapq.nsmallest(stop, candidates, key=key)[skip:]
+
+
+class HashIndex:
+    """
+    字段值 -> 主键集合 的哈希索引, 服务 eq / in / ne 过滤
+
+    值为 None 的行不进入索引 (搜索本来也会跳过 None 值),
+    不可哈希的值单独记录, 每次查找都作为候选返回
+    """
+
+    operators = ("eq", "in", "ne")
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self.buckets: Dict[Any, Dict[Any, None]] = {}
+        self.unhashable: Dict[Any, None] = {}
+        self.size = 0
+
+    def add(self, pk: Any, row: SCHEMA) -> None:
+        value = getattr(row, self.field, None)
+        if value is None:
+            return
+        try:
+            bucket = self.buckets.setdefault(value, {})
+        except TypeError:
+            self.unhashable[pk] = None
+            return
+        bucket[pk] = None
+        self.size += 1
+
+    def discard(self, pk: Any, row: SCHEMA) -> None:
+        value = getattr(row, self.field, None)
+        if value is None:
+            return
+        try:
+            bucket = self.buckets.get(value)
+        except TypeError:
+            self.unhashable.pop(pk, None)
+            return
+        if bucket is None or pk not in bucket:
+            return
+        del bucket[pk]
+        self.size -= 1
+        if not bucket:
+            del self.buckets[value]
+
+    def clear(self) -> None:
+        self.buckets.clear()
+        self.unhashable.clear()
+        self.size = 0
+
+    def _in_values(self, f: Filter) -> Optional[Iterable[Any]]:
+        # 字符串的 in 是子串语义, 只有容器才能走索引
+        return f.value if isinstance(f.value, (list, tuple, set, frozenset)) else None
+
+    def estimate(self, f: Filter) -> Optional[int]:
+        """估算过滤后的候选行数, 无法使用索引时返回 None"""
+        extra = len(self.unhashable)
+        try:
+            if f.operator == "eq":
+                return len(self.buckets.get(f.value, ())) + extra
+            if f.operator == "ne":
+                return self.size - len(self.buckets.get(f.value, ())) + extra
+            if f.operator == "in":
+                values = self._in_values(f)
+                if values is None:
+                    return None
+                return sum(len(self.buckets.get(v, ())) for v in set(values)) + extra
+        except TypeError:
+            return None
+        return None
+
+    def lookup(self, f: Filter) -> Iterable[Any]:
+        """返回可能满足过滤条件的主键 (调用前需 estimate 不为 None)"""
+        pks: List[Any] = list(self.unhashable)
+        if f.operator == "eq":
+            pks.extend(self.buckets.get(f.value, ()))
+        elif f.operator == "in":
+            for v in set(self._in_values(f) or ()):
+                pks.extend(self.buckets.get(v, ()))
+        else:
+            for value, bucket in self.buckets.items():
+                if value != f.value:
+                    pks.extend(bucket)
+        return pks
+
+    def plan(self, filters: List[Filter]) -> Optional[PLAN]:
+        best: Optional[PLAN] = None
+        for f in filters:
+            if f.operator not in self.operators:
+                continue
+            size = self.estimate(f)
+            if size is not None and (best is None or size < best[0]):
+                best = (size, lambda f=f: self.lookup(f))
+        return best
+
+
+class SortedIndex:
+    """
+    按字段值有序的索引, 服务 gt / lt 范围过滤和按该字段排序
+
+    keys 是 (字段值, 插入序号, pk) 的有序列表, 写入时用 bisect 维护;
+    相同字段值按插入序号排列, 因此顺序遍历与稳定排序的结果一致
+    """
+
+    operators = ("gt", "lt")
+
+    def __init__(self, field: str, seq: Dict[Any, int]) -> None:
+        self.field = field
+        self.keys: List[Tuple[Any, int, Any]] = []
+        self._seq = seq
+        # 值为 None 的行, 以及与其它值无法比较的行, 不进入有序列表
+        self.nulls: Dict[Any, None] = {}
+        self.unordered: Dict[Any, None] = {}
+
+    def add(self, pk: Any, row: SCHEMA) -> None:
+        value = getattr(row, self.field, None)
+        if value is None:
+            self.nulls[pk] = None
+            return
+        try:
+            insort(self.keys, (value, self._seq[pk], pk))
+        except TypeError:
+            self.unordered[pk] = None
+
+    def discard(self, pk: Any, row: SCHEMA) -> None:
+        value = getattr(row, self.field, None)
+        if value is None:
+            self.nulls.pop(pk, None)
+            return
+        if pk in self.unordered:
+            del self.unordered[pk]
+            return
+        key = (value, self._seq[pk], pk)
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def clear(self) -> None:
+        self.keys.clear()
+        self.nulls.clear()
+        self.unordered.clear()
+
+    @property
+    def complete(self) -> bool:
+        """是否所有行都在有序列表中 (只有这样才能直接按索引顺序遍历)"""
+        return not self.nulls and not self.unordered
+
+    def plan(self, filters: List[Filter]) -> Optional[PLAN]:
+        """把同一字段上的 gt / lt 合并成一次二分查找的区间"""
+        if self.unordered:
+            return None
+        lo, hi = 0, len(self.keys)
+        used = False
+        try:
+            for f in filters:
+                if f.operator == "gt":
+                    lo = max(lo, bisect_left(self.keys, (f.value, _INF)))
+                elif f.operator == "lt":
+                    hi = min(hi, bisect_left(self.keys, (f.value,)))
+                else:
+                    continue
+                used = True
+        except TypeError:
+            return None
+        if not used:
+            return None
+        hi = max(lo, hi)
+        return (hi - lo, lambda: [key[2] for key in self.keys[lo:hi]])
+
+    def walk(self, reverse: bool = False, start: Any = _NOTHING) -> Iterator[List[Any]]:
+        """
+        按字段值顺序逐组返回主键, 每组字段值相同且保持插入顺序
+
+        降序时组的顺序反转而组内顺序不变, 与 list.sort(reverse=True) 的稳定性一致;
+        传入 start 时二分定位, 从字段值等于 start 的组开始 (游标分页)
+        """
+        keys = self.keys
+        if not reverse:
+            i, n = 0 if start is _NOTHING else bisect_left(keys, (start,)), len(keys)
+            while i < n:
+                value = keys[i][0]
+                j = i + 1
+                while j < n and keys[j][0] == value:
+                    j += 1
+                yield [key[2] for key in keys[i:j]]
+                i = j
+            return
+        i = len(keys) if start is _NOTHING else bisect_left(keys, (start, _INF))
+        while i > 0:
+            value = keys[i - 1][0]
+            j = bisect_left(keys, (value,), 0, i)
+            yield [key[2] for key in keys[j:i]]
+            i = j
+
+
+class NgramIndex:
+    """
+    字符串字段的 n-gram 倒排索引, 服务 contains 过滤
+
+    每个字符串拆成长度为 n 的连续片段, 片段 -> 主键集合; 查询串的所有片段对应的主键取交集,
+    得到包含查询串的候选行 (超集, 仍需逐行校验)。默认 n=2, 两个字的中文关键词也能命中;
+    短于 n 的查询串无法使用索引, 退化为全表扫描
+    """
+
+    operators = ("contains",)
+
+    def __init__(self, field: str, n: int = 2) -> None:
+        self.field = field
+        self.n = n
+        self.postings: Dict[str, Dict[Any, None]] = {}
+        # 使用情况统计 (并发下是近似值), 用于判断字段是否值得建索引
+        self.queries = 0
+        self.served = 0
+        self.candidates = 0
+
+    def _grams(self, value: str) -> Set[str]:
+        n = self.n
+        return {value[i : i + n] for i in range(len(value) - n + 1)}
+
+    def add(self, pk: Any, row: SCHEMA) -> None:
+        value = getattr(row, self.field, None)
+        if not isinstance(value, str):
+            return
+        for gram in self._grams(value):
+            self.postings.setdefault(gram, {})[pk] = None
+
+    def discard(self, pk: Any, row: SCHEMA) -> None:
+        value = getattr(row, self.field, None)
+        if not isinstance(value, str):
+            return
+        for gram in self._grams(value):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.pop(pk, None)
+                if not posting:
+                    del self.postings[gram]
+
+    def clear(self) -> None:
+        self.postings.clear()
+
+    def lookup(self, value: str) -> Iterable[Any]:
+        postings = sorted((self.postings.get(g, {}) for g in self._grams(value)), key=len)
+        result: Set[Any] = set(postings[0])
+        for posting in postings[1:]:
+            if not result:
+                break
+            result.intersection_update(posting)
+        self.served += 1
+        self.candidates += len(result)
+        return result
+
+    def plan(self, filters: List[Filter]) -> Optional[PLAN]:
+        best: Optional[PLAN] = None
+        for f in filters:
+            if f.operator != "contains":
+                continue
+            self.queries += 1
+            if not isinstance(f.value, str) or len(f.value) < self.n:
+                continue
+            # 最短的倒排列表是交集大小的上界
+            size = min(len(self.postings.get(g, ())) for g in self._grams(f.value))
+            if best is None or size < best[0]:
+                best = (size, lambda value=f.value: self.lookup(value))
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        """索引大小 (估算字节数) 和命中情况"""
+        memory = sys.getsizeof(self.postings) + sum(
+            sys.getsizeof(gram) + sys.getsizeof(posting) for gram, posting in self.postings.items()
+        )
+        return {
+            "field": self.field,
+            "n": self.n,
+            "grams": len(self.postings),
+            "postings": sum(len(posting) for posting in self.postings.values()),
+            "memory_bytes": memory,
+            # contains 查询次数, 其中由索引缩小候选集的次数, 命中率, 平均每次的候选行数
+            "queries": self.queries,
+            "served": self.served,
+            "hit_rate": self.served / self.queries if self.queries else 0.0,
+            "avg_candidates": self.candidates / self.served if self.served else 0.0,
+        }
+
+
+INDEX = Union[HashIndex, SortedIndex, NgramIndex]
+
+
+class MemoryStore:
+    """
+    以主键为索引的内存存储
+
+    rows 是 pk -> 行 的字典, 字典本身保持插入顺序, 因此:
+    - get / update / delete 按主键 O(1)
+    - 遍历和分页仍然按插入顺序
+    - 可选的二级索引在写入时同步维护, 用于缩小搜索的候选集或按顺序遍历
+
+    线程安全: 路由是同步函数, 会在线程池里并发执行。所有写操作 (含主键分配) 持有写锁,
+    分页和搜索持有读锁, 按主键读取只是一次字典查找, 不加锁
+
+    容量限制 (可选): 超过 max_items 行或估算的 max_bytes 字节时淘汰最久未使用的行 (LRU,
+    按主键读取和写入算作使用); 设置 ttl 秒后, 行在最后一次写入 ttl 秒后过期。
+    淘汰和过期都走普通删除路径, 主键、二级索引和持久化日志保持一致
+
+    紧凑表示 (可选, 传入 codec): rows 里存 __slots__ 记录而不是 Pydantic 对象,
+    只在返回结果时用 model_construct 构造对象; patch 只改动变化的字段
+    """
+
+    def __init__(
+        self,
+        pk: str = "id",
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        codec: Optional[RecordCodec] = None,
+    ) -> None:
+        self.pk = pk
+        self.codec = codec
+        self.rows: Dict[Any, Any] = {}
+        self.next_id = 1
+        self.indexes: Dict[str, HashIndex] = {}
+        self.sorted_indexes: Dict[str, SortedIndex] = {}
+        self.text_indexes: Dict[str, NgramIndex] = {}
+        # pk -> 插入序号, 用于让索引命中的候选行恢复插入顺序
+        self._seq: Dict[Any, int] = {}
+        self._seq_counter = 0
+        # 按插入顺序排列的插入序号 + 序号 -> pk, 游标分页按插入顺序二分定位;
+        # 删除只从字典里移除, 失效序号超过一半时一次性清理
+        self._order = array("q")
+        self._pk_at: Dict[int, Any] = {}
+        self.lock = RWLock()
+        # 可选的持久化日志 (MemoryJournal), 在写锁内、修改之前记录每次写操作
+        self.journal: Any = None
+
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._bounded = max_items is not None or max_bytes is not None
+        # pk -> 估算字节数, 按最近使用排序; pk -> 过期时间, 按写入时间排序 (ttl 固定, 因此也按过期时间排序)
+        # 按主键读取不持有读写锁, 所以这两个结构另用一把小锁保护
+        self._lru: "OrderedDict[Any, int]" = OrderedDict()
+        self._expires: "OrderedDict[Any, float]" = OrderedDict()
+        self._aux_lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[SCHEMA]:
+        self._expire()
+        with self.lock.read():
+            return iter(self._models(list(self.rows.values())))
+
+    def __contains__(self, pk: Any) -> bool:
+        return pk in self.rows
+
+    def _model(self, row: Any) -> SCHEMA:
+        """存储中的行 -> 返回给调用方的模型"""
+        return row if self.codec is None else self.codec.unpack(row)
+
+    def _models(self, rows: List[Any]) -> List[SCHEMA]:
+        if self.codec is None:
+            return rows
+        unpack = self.codec.unpack
+        return [unpack(row) for row in rows]
+
+    def _all_indexes(self) -> List[INDEX]:
+        return [*self.indexes.values(), *self.sorted_indexes.values(), *self.text_indexes.values()]
+
+    def next_pk(self) -> int:
+        """分配下一个自增主键, 跳过已被手动占用的值"""
+        with self.lock.write():
+            return self._next_pk_locked()
+
+    def _next_pk_locked(self) -> int:
+        pk = self.next_id
+        while pk in self.rows:
+            pk += 1
+        self.next_id = pk + 1
+        return pk
+
+    def get(self, pk: Any) -> Optional[SCHEMA]:
+        self._expire()
+        row = self.rows.get(pk)
+        if row is None:
+            return None
+        if self._bounded:
+            with self._aux_lock:
+                if pk in self._lru:
+                    self._lru.move_to_end(pk)
+        return self._model(row)
+
+    # --- 容量限制 ---
+
+    def _track(self, pk: Any, row: SCHEMA) -> None:
+        """记录一次写入: 移到 LRU 末尾并刷新过期时间 (调用方持有写锁)"""
+        if not self._bounded and self.ttl is None:
+            return
+        with self._aux_lock:
+            if self._bounded:
+                size = len(row.model_dump_json()) if self.max_bytes is not None else 0
+                self.bytes += size - self._lru.get(pk, 0)
+                self._lru[pk] = size
+                self._lru.move_to_end(pk)
+            if self.ttl is not None:
+                self._expires[pk] = time.monotonic() + self.ttl
+                self._expires.move_to_end(pk)
+
+    def _untrack(self, pk: Any) -> None:
+        if not self._bounded and self.ttl is None:
+            return
+        with self._aux_lock:
+            self.bytes -= self._lru.pop(pk, 0)
+            self._expires.pop(pk, None)
+
+    def _over_capacity(self) -> bool:
+        if self.max_items is not None and len(self.rows) > self.max_items:
+            return True
+        # 至少保留刚写入的一行
+        return self.max_bytes is not None and self.bytes > self.max_bytes and len(self.rows) > 1
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的行直到满足容量限制 (调用方持有写锁)"""
+        while self._bounded and self._over_capacity():
+            with self._aux_lock:
+                pk = next(iter(self._lru))
+            self._remove(pk)
+            self.evictions += 1
+
+    def _first_expired(self, now: float) -> Any:
+        with self._aux_lock:
+            for pk, deadline in self._expires.items():
+                return pk if deadline <= now else _NOTHING
+        return _NOTHING
+
+    def _expire_locked(self) -> None:
+        """删除所有已过期的行 (调用方持有写锁)"""
+        now = time.monotonic()
+        pk = self._first_expired(now)
+        while pk is not _NOTHING:
+            self._remove(pk)
+            self.expirations += 1
+            pk = self._first_expired(now)
+
+    def _expire(self) -> None:
+        """有过期的行时获取写锁清理, 读操作开始前调用 (调用方不能持有锁)"""
+        if self.ttl is None or self._first_expired(time.monotonic()) is _NOTHING:
+            return
+        with self.lock.write():
+            self._expire_locked()
+
+    def eviction_stats(self) -> Dict[str, Any]:
+        """容量限制和淘汰计数"""
+        return {
+            "items": len(self.rows),
+            "bytes": self.bytes,
+            "max_items": self.max_items,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def add_index(self, field: str) -> None:
+        """声明哈希索引 (幂等), 并用已有数据构建"""
+        with self.lock.write():
+            if field in self.indexes:
+                return
+            index = HashIndex(field)
+            for pk, row in self.rows.items():
+                index.add(pk, row)
+            self.indexes[field] = index
+
+    def add_sorted_index(self, field: str) -> None:
+        """声明有序索引 (幂等), 并用已有数据构建"""
+        with self.lock.write():
+            if field in self.sorted_indexes:
+                return
+            index = SortedIndex(field, self._seq)
+            for pk, row in self.rows.items():
+                index.add(pk, row)
+            self.sorted_indexes[field] = index
+
+    def add_text_index(self, field: str, n: int = 2) -> None:
+        """声明 n-gram 倒排索引 (幂等), 并用已有数据构建"""
+        with self.lock.write():
+            if field in self.text_indexes:
+                return
+            index = NgramIndex(field, n)
+            for pk, row in self.rows.items():
+                index.add(pk, row)
+            self.text_indexes[field] = index
+
+    def index_stats(self) -> List[Dict[str, Any]]:
+        """各 n-gram 索引的内存占用和命中率"""
+        with self.lock.read():
+            return [index.stats() for index in self.text_indexes.values()]
+
+    def insert(self, row: SCHEMA) -> SCHEMA:
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            return self._insert_locked(row)
+
+    def insert_auto(self, make_row: Callable[[int], SCHEMA]) -> SCHEMA:
+        """
+        分配自增主键并插入 make_row(主键) 生成的行
+
+        分配和插入在同一次写锁内完成, 其间不会有并发写入占用这个主键。make_row 的异常原样抛出, 不插入
+        """
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            return self._insert_locked(make_row(self._next_pk_locked()))
+
+    def insert_many(
+        self, rows: List[Union[SCHEMA, Callable[[int], SCHEMA]]]
+    ) -> List[Union[SCHEMA, KeyError, ValueError]]:
+        """
+        批量插入, 整批只取一次写锁
+
+        元素为 make_row 函数时与 insert_auto 一样在锁内分配自增主键, 生成行时校验失败的对应位置返回 ValueError;
+        主键已存在的行不插入, 对应位置返回 KeyError, 其余行照常插入
+        """
+        results: List[Union[SCHEMA, KeyError, ValueError]] = []
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            for row in rows:
+                try:
+                    if callable(row):
+                        row = row(self._next_pk_locked())
+                    results.append(self._insert_locked(row))
+                except (KeyError, ValueError) as e:
+                    results.append(e)
+        return results
+
+    def _insert_locked(self, row: SCHEMA) -> SCHEMA:
+        pk = getattr(row, self.pk)
+        if pk in self.rows:
+            raise KeyError(pk)
+        stored = row if self.codec is None else self.codec.pack(row)
+        if self.journal is not None:
+            self.journal.log_put(row, self.next_id)
+        self.rows[pk] = stored
+        seq = self._seq[pk] = self._seq_counter
+        self._seq_counter += 1
+        self._pk_at[seq] = pk
+        self._order.append(seq)
+        for index in self._all_indexes():
+            index.add(pk, stored)
+        self._track(pk, row)
+        self._evict()
+        return row
+
+    def _replace(self, pk: Any, old: Any, row: SCHEMA) -> SCHEMA:
+        stored = row if self.codec is None else self.codec.pack(row)
+        if self.journal is not None:
+            self.journal.log_put(row, self.next_id)
+        for index in self._all_indexes():
+            index.discard(pk, old)
+            index.add(pk, stored)
+        self.rows[pk] = stored
+        self._track(pk, row)
+        self._evict()
+        return row
+
+    def replace(self, pk: Any, row: SCHEMA) -> SCHEMA:
+        """替换已有行, 保持其在插入顺序中的位置"""
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            old = self.rows.get(pk)
+            if old is None:
+                raise KeyError(pk)
+            return self._replace(pk, old, row)
+
+    def update(self, pk: Any, apply: Callable[[SCHEMA], SCHEMA]) -> SCHEMA:
+        """在写锁内用 apply(旧行) 生成新行并替换, 保证读-改-写的原子性"""
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            old = self.rows.get(pk)
+            if old is None:
+                raise KeyError(pk)
+            return self._replace(pk, old, apply(self._model(old)))
+
+    def patch(self, pk: Any, changes: Dict[str, Any]) -> SCHEMA:
+        """
+        修改给定字段: 旧行合并 changes 后按 schema 整行校验 (与重建整行的更新路径接受 / 拒绝相同的输入),
+        不合法时抛出 ValidationError, 不修改存储
+
+        紧凑表示下校验后的行重新打包成新记录再整体替换 (写时复制), 不加锁的按主键读取不会看到改了一半的行
+        """
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            old = self.rows.get(pk)
+            if old is None:
+                raise KeyError(pk)
+            return self._replace(pk, old, self._merge(old, changes))
+
+    def _merge(self, old: Any, changes: Dict[str, Any]) -> SCHEMA:
+        """旧行合并 changes 后按 schema 整行重新校验 (字段约束和模型校验器), 不合法时抛出 ValidationError"""
+        model = self._model(old)
+        return type(model).model_validate({**model.model_dump(), **changes})
+
+    def _select_locked(self, ids: Optional[List[Any]], filters: Optional[List[Filter]]) -> List[Any]:
+        """
+        批量更新 / 删除选中的主键: 主键在 ids 中且满足 filters (调用方需持有锁)
+
+        给出 ids 时按主键直接查找, 只校验这些行; 否则由索引缩小候选集
+        """
+        filters = filters or []
+        predicate = compile_filters(filters)
+        if ids is None:
+            return [getattr(row, self.pk) for row in self._search(filters, [], predicate, 0, None)]
+        rows = self.rows
+        pks = [pk for pk in dict.fromkeys(ids) if pk in rows]
+        if predicate is None:
+            return pks
+        return [pk for pk in pks if predicate(rows[pk])]
+
+    def update_many(
+        self, ids: Optional[List[Any]], filters: Optional[List[Filter]], changes: Dict[str, Any]
+    ) -> List[Any]:
+        """
+        把选中行的给定字段改成 changes, 整批只取一次写锁, 返回受影响的主键
+
+        先把所有选中行合并并校验, 任何一行不合法 (ValidationError) 都不修改任何行
+        """
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            pks = self._select_locked(ids, filters)
+            merged = [(pk, self._merge(self.rows[pk], changes)) for pk in pks]
+            for pk, row in merged:
+                # 修改过程中可能按容量淘汰了后面的行
+                old = self.rows.get(pk)
+                if old is not None:
+                    self._replace(pk, old, row)
+            return pks
+
+    def remove_many(self, ids: Optional[List[Any]], filters: Optional[List[Filter]]) -> List[Any]:
+        """删除选中的行, 整批只取一次写锁, 返回被删除的主键"""
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            pks = self._select_locked(ids, filters)
+            for pk in pks:
+                self._remove(pk)
+            return pks
+
+    def _remove(self, pk: Any) -> SCHEMA:
+        row = self.rows[pk]
+        if self.journal is not None:
+            self.journal.log_delete(pk)
+        for index in self._all_indexes():
+            index.discard(pk, row)
+        del self.rows[pk]
+        del self._pk_at[self._seq.pop(pk)]
+        dead = len(self._order) - len(self._pk_at)
+        if dead > 1024 and dead * 2 > len(self._order):
+            pk_at = self._pk_at
+            self._order = array("q", [seq for seq in self._order if seq in pk_at])
+        self._untrack(pk)
+        return row
+
+    def remove(self, pk: Any) -> SCHEMA:
+        with self.lock.write():
+            if self.ttl is not None:
+                self._expire_locked()
+            return self._model(self._remove(pk))
+
+    def clear(self) -> List[SCHEMA]:
+        """清空存储并重置自增主键, 返回被删除的行"""
+        with self.lock.write():
+            if self.journal is not None:
+                self.journal.log_clear()
+            # 换上新的空字典, 旧字典直接交给响应, 不逐个删除
+            rows, self.rows = self.rows, {}
+            self._seq.clear()
+            self._order, self._pk_at = array("q"), {}
+            for index in self._all_indexes():
+                index.clear()
+            deleted = self._models(list(rows.values()))
+            with self._aux_lock:
+                self._lru.clear()
+                self._expires.clear()
+                self.bytes = 0
+            self.next_id = 1
+            return deleted
+
+    def snapshot_rows(self) -> List[SCHEMA]:
+        """当前全部行的快照 (调用方需持有锁)"""
+        return self._models(list(self.rows.values()))
+
+    def _plan(self, filters: List[Filter]) -> Optional[List[Any]]:
+        """
+        选出候选行最少的索引, 返回按插入顺序排列的候选主键
+
+        候选集只保证是结果的超集, 调用方仍需逐条校验所有过滤条件;
+        没有能缩小范围的索引时返回 None
+        """
+        best = self._best_plan(filters)
+        if best is None:
+            return None
+        return sorted(best[1](), key=self._seq.__getitem__)
+
+    def _best_plan(self, filters: List[Filter]) -> Optional[PLAN]:
+        """候选行最少的索引计划, 不能缩小范围时返回 None"""
+        by_field: Dict[str, List[Filter]] = {}
+        for f in filters:
+            by_field.setdefault(f.field, []).append(f)
+
+        best: Optional[PLAN] = None
+        for field, field_filters in by_field.items():
+            for index in (self.indexes.get(field), self.sorted_indexes.get(field), self.text_indexes.get(field)):
+                plan = index.plan(field_filters) if index is not None else None
+                if plan is not None and (best is None or plan[0] < best[0]):
+                    best = plan
+        if best is None or best[0] >= len(self.rows):
+            return None
+        return best
+
+    def _walk_index(self, sorting: List[Sorting]) -> Optional[SortedIndex]:
+        """第一个排序字段上有完整的有序索引时, 返回该索引"""
+        if not sorting:
+            return None
+        index = self.sorted_indexes.get(sorting[0].field)
+        if index is None or not index.complete:
+            return None
+        return index
+
+    def _walk(
+        self,
+        index: SortedIndex,
+        sorting: List[Sorting],
+        predicate: Optional[PREDICATE],
+        start: Any = _NOTHING,
+    ) -> Iterator[SCHEMA]:
+        """按有序索引顺序遍历并过滤, 其余排序字段只在同值分组内排序"""
+        rest = sorting[1:]
+        for pks in index.walk(reverse=(sorting[0].direction == "desc"), start=start):
+            group = [self.rows[pk] for pk in pks]
+            if predicate is not None:
+                group = [r for r in group if predicate(r)]
+            if rest and len(group) > 1:
+                group.sort(key=sort_key(rest))
+            yield from group
+
+    def search(
+        self,
+        filters: Optional[List[Filter]] = None,
+        sorting: Optional[List[Sorting]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[SCHEMA]:
+        """
+        执行过滤 + 排序 + 分页
+
+        - 能用索引缩小候选集时, 只校验候选行
+        - 否则若第一个排序字段有有序索引, 按索引顺序遍历, 取满一页即停止
+        - 其余情况: 不排序时惰性过滤, 取满一页即停止;
+          排序且有 limit 时用堆只保留前 skip + limit 行, O(n log k);
+          排序且无 limit 时按组合键整体排序一次
+        """
+        filters = filters or []
+        sorting = sorting or []
+        stop = None if limit is None else skip + limit
+        predicate = compile_filters(filters)
+
+        self._expire()
+        with self.lock.read():
+            return self._models(self._search(filters, sorting, predicate, skip, stop))
+
+    def search_page(
+        self,
+        filters: Optional[List[Filter]] = None,
+        sorting: Optional[List[Sorting]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        after: Optional[List[Any]] = None,
+    ) -> Tuple[List[SCHEMA], Optional[List[Any]]]:
+        """
+        游标分页版的 search: after 为上一页返回的游标键, 只返回严格排在它之后的行
+
+        返回 (行, 游标键); 取满一页时游标键为最后一行的 [各排序字段值..., 插入序号], 否则为 None。
+        结果顺序与 search 相同 (插入序号即稳定排序的决胜键), 定位方式:
+        - 不排序: 在插入序号数组上二分, 从游标之后开始遍历
+        - 第一个排序字段有完整的有序索引: 在索引上二分, 从游标所在的值开始遍历
+        - 其余情况: 全表过滤 (排序键, 插入序号) > 游标, 堆只保留一页, 与翻到第几页无关
+        """
+        filters = filters or []
+        sorting = sorting or []
+        stop = None if limit is None else skip + limit
+        predicate = compile_filters(filters)
+
+        self._expire()
+        with self.lock.read():
+            rows = self._search(filters, sorting, predicate, skip, stop, after)
+            last = None
+            if limit is not None and rows and len(rows) == limit:
+                last = [getattr(rows[-1], s.field, None) for s in sorting] + [self._seq[getattr(rows[-1], self.pk)]]
+            return self._models(rows), last
+
+    def count(self, filters: Optional[List[Filter]] = None, cap: Optional[int] = None) -> int:
+        """
+        过滤后的行数: 无过滤条件时 O(1); 否则只校验索引选出的候选行
+
+        传入 cap 时数到 cap + 1 行即停止 (调用方据此判断是否超出)
+        """
+        filters = filters or []
+        predicate = compile_filters(filters)
+        stop = None if cap is None else cap + 1
+
+        self._expire()
+        with self.lock.read():
+            if predicate is None:
+                return len(self.rows) if stop is None else min(len(self.rows), stop)
+            # 单个 eq / in 条件落在哈希索引上时, 桶的大小就是精确行数
+            if len(filters) == 1 and filters[0].operator in ("eq", "in"):
+                index = self.indexes.get(filters[0].field)
+                if index is not None and not index.unhashable:
+                    n = index.estimate(filters[0])
+                    if n is not None:
+                        return n if stop is None else min(n, stop)
+            # 计数与顺序无关, 候选主键不必按插入顺序排序
+            plan = self._best_plan(filters)
+            if plan is None:
+                candidates: Iterable[Any] = self.rows.values()
+            else:
+                candidates = (self.rows[pk] for pk in plan[1]())
+            return sum(1 for _ in islice(filter(predicate, candidates), stop))
+
+    def _seek_predicate(
+        self, sorting: List[Sorting], after: List[Any], predicate: Optional[PREDICATE]
+    ) -> PREDICATE:
+        """(排序键, 插入序号) > 游标, 与过滤条件合并"""
+        key = sort_key(sorting)
+        seq, pk = self._seq, self.pk
+        bound = (key(SimpleNamespace(**{s.field: v for s, v in zip(sorting, after)})), after[-1])
+
+        def seek(row: Any) -> bool:
+            return (key(row), seq[getattr(row, pk)]) > bound
+
+        if predicate is None:
+            return seek
+        return lambda row: predicate(row) and seek(row)
+
+    def _rows_after(self, seq: int) -> Iterator[Any]:
+        """按插入顺序返回插入序号大于 seq 的行"""
+        order, pk_at, rows = self._order, self._pk_at, self.rows
+        for i in range(bisect_right(order, seq), len(order)):
+            pk = pk_at.get(order[i], _NOTHING)
+            if pk is not _NOTHING:
+                yield rows[pk]
+
+    def _search(
+        self,
+        filters: List[Filter],
+        sorting: List[Sorting],
+        predicate: Optional[PREDICATE],
+        skip: int,
+        stop: Optional[int],
+        after: Optional[List[Any]] = None,
+    ) -> List[SCHEMA]:
+        candidate_pks = self._plan(filters)
+        if after is not None:
+            if candidate_pks is None and not sorting:
+                return select(self._rows_after(after[-1]), predicate, sorting, skip, stop)
+            predicate = self._seek_predicate(sorting, after, predicate)
+        if candidate_pks is None:
+            index = self._walk_index(sorting)
+            if index is not None and (after is None or after[0] is not None):
+                start = _NOTHING if after is None else after[0]
+                return list(islice(self._walk(index, sorting, predicate, start), skip, stop))
+            candidates: Iterable[SCHEMA] = self.rows.values()
+        else:
+            candidates = (self.rows[pk] for pk in candidate_pks)
+
+        return select(candidates, predicate, sorting, skip, stop)
+
+    def page(self, skip: int = 0, limit: Optional[int] = None) -> List[SCHEMA]:
+        """按插入顺序分页, 只遍历 skip + limit 行"""
+        stop = None if limit is None else skip + limit
+        self._expire()
+        with self.lock.read():
+            return self._models(list(islice(self.rows.values(), skip, stop)))
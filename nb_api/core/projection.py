@@ -0,0 +1,72 @@
+"""字段投影 (fields=...): 只查询 / 只返回客户端需要的字段"""
+
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from sqlalchemy.inspection import inspect as sql_inspect
+from sqlalchemy.orm import load_only
+
+from .types import PYDANTIC_SCHEMA as SCHEMA, GetManyResult, PageResponseModel, ResponseModel
+
+# 按 schema 字段顺序排列的字段元组, None 表示不投影
+FIELDS = Optional[Tuple[str, ...]]
+
+
+class Projection:
+    """
+    校验 fields 参数, 并为每种字段组合生成只含这些字段的响应模型
+
+    字段组合按 schema 的字段顺序归一化 (fields=b,a 与 fields=a,b 共用一个模型);
+    投影模型和它的 TypeAdapter 按字段组合缓存, 最多保留 maxsize 种
+    """
+
+    def __init__(self, schema: Type[SCHEMA], maxsize: int = 256) -> None:
+        self.schema = schema
+        self.model = lru_cache(maxsize=maxsize)(self._build_model)
+        self.page_adapter = lru_cache(maxsize=maxsize)(self._build_page_adapter)
+        self.item_adapter = lru_cache(maxsize=maxsize)(self._build_item_adapter)
+        self.many_adapter = lru_cache(maxsize=maxsize)(self._build_many_adapter)
+
+    def resolve(self, fields: Optional[Iterable[str]]) -> FIELDS:
+        """校验字段名, 返回按 schema 顺序排列的字段元组; 没有指定字段时返回 None"""
+        if fields is None:
+            return None
+        requested = {f.strip() for f in fields if f.strip()}
+        if not requested:
+            return None
+        for field in requested:
+            if field not in self.schema.model_fields:
+                raise HTTPException(
+                    422, f"Invalid field: '{field}' is not a valid field for {self.schema.__name__}."
+                )
+        return tuple(f for f in self.schema.model_fields if f in requested)
+
+    def _build_model(self, fields: Tuple[str, ...]) -> Type[BaseModel]:
+        definitions: Any = {f: (self.schema.model_fields[f].annotation, self.schema.model_fields[f]) for f in fields}
+        config = ConfigDict(**{**self.schema.model_config, "from_attributes": True})  # type: ignore[typeddict-item]
+        return create_model(f"{self.schema.__name__}Fields", __config__=config, **definitions)
+
+    def _build_page_adapter(self, fields: Tuple[str, ...]) -> TypeAdapter:
+        return TypeAdapter(PageResponseModel[List[self.model(fields)]])  # type: ignore[misc]
+
+    def _build_item_adapter(self, fields: Tuple[str, ...]) -> TypeAdapter:
+        return TypeAdapter(ResponseModel[self.model(fields)])  # type: ignore[misc]
+
+    def _build_many_adapter(self, fields: Tuple[str, ...]) -> TypeAdapter:
+        return TypeAdapter(ResponseModel[GetManyResult[self.model(fields)]])  # type: ignore[misc]
+
+
+def load_fields(fields: Tuple[str, ...], keys: Iterable[str] = ()) -> List[str]:
+    """需要从数据库读取的字段: 投影字段 + 排序键 (生成 next_cursor 要用), 保持顺序去重"""
+    return list(dict.fromkeys([*fields, *keys]))
+
+
+def sa_load_only(statement: Any, db_model: Any, fields: FIELDS, keys: Iterable[str] = ()) -> Any:
+    """把字段投影下推到 SQL: 只读取投影字段和排序键对应的列 (主键总会读取), 其余列不查询也不构造"""
+    if fields is None:
+        return statement
+    columns = sql_inspect(db_model).column_attrs
+    attrs = [getattr(db_model, f) for f in load_fields(fields, keys) if f in columns]
+    return statement.options(load_only(*attrs)) if attrs else statement
@@ -0,0 +1,254 @@
+"""SQLAlchemy 系路由器 (SQLAlchemy / SQLModel / 异步 SQLModel) 共用的语句构造和同步执行"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from .batch import chunked, error_msg, sa_chunk_bound, sa_insert_many
+from .counting import TOTAL, sa_count_statement
+from .cursor import SORT_KEYS, sa_keyset
+from .projection import FIELDS, sa_load_only
+from .types import CALLABLE, PAGINATION, BatchCreateResult, BatchItemError, BatchWriteResult, Filter, ResponseModel, Sorting
+
+
+class SAQueryMixin:
+    """
+    构造 SQL 语句, 不执行; 执行 (同步 Session / 异步 AsyncSession) 留给各路由器
+
+    需要路由器提供 db_model / _pk / _cursors / count / count_cap / _count_cache / delete_all_chunk_size / batch_chunk_size
+    """
+
+    db_model: Any
+    _pk: str
+
+    @property
+    def _pk_column(self) -> Any:
+        """主键列"""
+        return getattr(self.db_model, self._pk)
+
+    def _keyset(self, db: Any, statement: Any, keys: SORT_KEYS, cursor: Optional[str]) -> Any:
+        """排序 + 游标定位, NULL 的位置取决于数据库方言"""
+        if cursor is None:
+            return sa_keyset(statement, self.db_model, keys)
+        values = self._cursors.decode(cursor, keys)
+        return sa_keyset(statement, self.db_model, keys, values, db.get_bind().dialect.name)
+
+    def _page_statement(self, db: Any, filtered: Any, keys: SORT_KEYS, pagination: PAGINATION, fields: FIELDS) -> Any:
+        """列表 / 搜索的一页: 排序 + 游标 + offset / limit + 字段投影 (排序键总是加载, 用于生成下一页游标)"""
+        statement = self._keyset(db, filtered, keys, pagination.get("cursor"))
+        statement = statement.offset(pagination.get("skip")).limit(pagination.get("limit"))
+        return sa_load_only(statement, self.db_model, fields, [f for f, _ in keys])
+
+    def _where(self, statement: Any, filters: Optional[List[Filter]]) -> Any:
+        """把过滤条件 (SearchRequest.filters) 编译成 WHERE 子句"""
+        for f in filters or []:
+            if not hasattr(self.db_model, f.field):
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Invalid filter field: '{f.field}' is not a valid field for {self.db_model.__name__}."
+                )
+
+            column = getattr(self.db_model, f.field)
+
+            if f.operator == "gt":
+                statement = statement.where(column > f.value)
+            elif f.operator == "lt":
+                statement = statement.where(column < f.value)
+            elif f.operator == "eq":
+                statement = statement.where(column == f.value)
+            elif f.operator == "ne":
+                statement = statement.where(column != f.value)
+            elif f.operator == "contains":
+                statement = statement.where(column.contains(f.value))
+            elif f.operator == "in":
+                statement = statement.where(column.in_(f.value))
+        return statement
+
+    def _check_sorting(self, sorting: Optional[List[Sorting]]) -> None:
+        """校验排序字段 (SearchRequest.sorting)"""
+        for s in sorting or []:
+            if not hasattr(self.db_model, s.field):
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Invalid sorting field: '{s.field}' is not a valid field for {self.db_model.__name__}."
+                )
+
+    def _batch_where(self, statement: Any, request: Any) -> Any:
+        """批量更新 / 删除的 WHERE: 主键在 ids 中, 且满足 filters"""
+        if request.ids is not None:
+            statement = statement.where(self._pk_column.in_(request.ids))
+        return self._where(statement, request.filters)
+
+    def _batch_statement(self, db: Any, statement: Any, request: Any) -> Tuple[Any, bool]:
+        """(加上 WHERE 的 UPDATE / DELETE, 数据库是否支持这种语句的 RETURNING)"""
+        dialect = db.get_bind().dialect
+        returning = dialect.update_returning if statement.is_update else dialect.delete_returning
+        return self._batch_where(statement, request).execution_options(synchronize_session=False), returning
+
+    def _update_values(self, request: Any) -> Dict[str, Any]:
+        """与 PUT /{item_id} 一样, 只更新数据库模型上存在的字段"""
+        return {k: v for k, v in self._batch_values(request).items() if hasattr(self.db_model, k)}
+
+    def _chunk_bound_statement(self) -> Optional[Any]:
+        """分块删除全部行时, 查询下一块主键上界的语句; 未设置 delete_all_chunk_size 时为 None"""
+        if self.delete_all_chunk_size is None:
+            return None
+        return sa_chunk_bound(self._pk_column, self.delete_all_chunk_size)
+
+    def _delete_rows_statement(self, bound: Any) -> Any:
+        """
+        集合式删除: 一条 DELETE, 不把行加载到会话里 (因此不执行 ORM 层的级联, 由数据库外键的 ON DELETE 处理);
+        bound 为 None 时删除剩下的全部行, 否则删除主键 <= bound 的一块
+        """
+        statement = delete(self.db_model) if bound is None else delete(self.db_model).where(self._pk_column <= bound)
+        return statement.execution_options(synchronize_session=False)
+
+    def _count_plan(self, filtered: Any, cursor: Optional[str], cache_key: str) -> Tuple[Optional[TOTAL], Optional[Any]]:
+        """
+        (已知的总数, 需要执行的 COUNT 语句), 两者至多一个不为 None
+
+        只在第一页执行一次 COUNT, 之后随游标带到各页; capped 最多数到 count_cap + 1 行; cached 先查缓存
+        """
+        if self.count is None:
+            return None, None
+        total = self._cursors.carried_total(cursor)
+        if total is not None:
+            return total, None
+        if self.count == "capped":
+            return None, sa_count_statement(filtered, self.count_cap)
+        if self.count == "cached":
+            cached = self._count_cache.get(cache_key)
+            if cached is not None:
+                return (cached, False), None
+        return None, sa_count_statement(filtered)
+
+    def _counted(self, n: int, cache_key: str) -> TOTAL:
+        """COUNT 语句的结果 -> 总数"""
+        if self.count == "capped":
+            return min(n, self.count_cap), n > self.count_cap
+        if self.count == "cached":
+            self._count_cache.set(cache_key, n)
+        return n, False
+
+    def _many_statements(self, ids: List[Any], fields: FIELDS) -> Iterator[Any]:
+        """GET /many: 每 batch_chunk_size 个主键一条 IN 查询, 不超出数据库的参数个数限制"""
+        for _, chunk in chunked(ids, self.batch_chunk_size):
+            yield sa_load_only(select(self.db_model).where(self._pk_column.in_(chunk)), self.db_model, fields)
+
+
+class SASyncMixin(SAQueryMixin):
+    """同步 Session 执行 SAQueryMixin 构造的语句, 以及基于它们的批量路由; SQLAlchemy 和 SQLModel 路由器共用"""
+
+    def _batch_write(self, db: Any, statement: Any, request: Any) -> BatchWriteResult:
+        """
+        执行一条 UPDATE / DELETE ... WHERE 并提交
+
+        请求 returning 时, 支持 RETURNING 的数据库在同一条语句里返回主键;
+        其余数据库先在同一事务里查出主键, 再按主键更新 / 删除
+        """
+        statement, returning = self._batch_statement(db, statement, request)
+        if not request.returning:
+            result = db.execute(statement)
+            db.commit()
+            return BatchWriteResult(affected=result.rowcount)
+        if returning:
+            ids = list(db.scalars(statement.returning(self._pk_column)).all())
+        else:
+            ids = list(db.scalars(self._batch_where(select(self._pk_column), request)).all())
+            db.execute(statement.where(self._pk_column.in_(ids)))
+        db.commit()
+        return BatchWriteResult(affected=len(ids), ids=ids)
+
+    def _delete_rows(self, db: Any) -> int:
+        """删除全部行; 设置 delete_all_chunk_size 时按主键范围分块删除, 每块单独提交, 限制锁的持有时间和单个事务的日志量"""
+        deleted = 0
+        while True:
+            bound_statement = self._chunk_bound_statement()
+            bound = None if bound_statement is None else db.scalar(bound_statement)
+            deleted += db.execute(self._delete_rows_statement(bound)).rowcount
+            db.commit()
+            if bound is None:
+                return deleted
+
+    def _total(self, db: Any, filtered: Any, cursor: Optional[str], cache_key: str) -> Optional[TOTAL]:
+        """列表响应的总数, 见 _count_plan"""
+        total, statement = self._count_plan(filtered, cursor, cache_key)
+        if statement is None:
+            return total
+        return self._counted(db.scalar(statement), cache_key)
+
+    def _insert_chunk(self, db: Any, rows: List[Dict[str, Any]]) -> List[Any]:
+        """插入一块数据并提交; 提交前先转换成 schema, 提交后 ORM 对象过期, 再读取会逐行 SELECT"""
+        db_models = sa_insert_many(db, self.db_model, rows)
+        items = [self.schema.model_validate(m, from_attributes=True) for m in db_models]
+        db.commit()
+        return items
+
+    def _get_many(self, ids: Any, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(
+            ids: List[Any] = ids,
+            db: Any = Depends(self.db_func),
+            fields: Optional[str] = None,
+        ) -> Any:
+            fields = self._fields(fields)
+            db_models: List[Any] = []
+            for statement in self._many_statements(ids, fields):
+                db_models.extend(db.execute(statement).scalars().all())
+            return self._many_response(ids, db_models, fields)
+
+        return route
+
+    def _create_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(
+            models: List[self.create_schema],  # type: ignore
+            db: Any = Depends(self.db_func),
+        ) -> Any:
+            created: List[Any] = []
+            errors: List[BatchItemError] = []
+            for start, chunk in chunked(models, self.batch_chunk_size):
+                rows = [model.model_dump() for model in chunk]
+                try:
+                    created.extend(self._insert_chunk(db, rows))
+                except SQLAlchemyError:
+                    db.rollback()
+                    # 整块失败 (约束冲突、取值超出列类型等任何数据库错误) 时逐条重试, 只有出错的条目记入 errors
+                    for i, row in enumerate(rows, start):
+                        try:
+                            created.extend(self._insert_chunk(db, [row]))
+                        except SQLAlchemyError as e:
+                            db.rollback()
+                            errors.append(BatchItemError(index=i, msg=error_msg(e)))
+
+            return ResponseModel(data=BatchCreateResult(created=created, errors=errors))
+
+        return route
+
+    def _update_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(
+            request: self._batch_update_request,  # type: ignore
+            db: Any = Depends(self.db_func),
+        ) -> Any:
+            statement = update(self.db_model).values(**self._update_values(request))
+            try:
+                return ResponseModel(data=self._batch_write(db, statement, request))
+            except IntegrityError as e:
+                db.rollback()
+                self._raise(e)
+
+        return route
+
+    def _delete_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        def route(
+            request: self._batch_delete_request,  # type: ignore
+            db: Any = Depends(self.db_func),
+        ) -> Any:
+            self._check_batch(request)
+            try:
+                return ResponseModel(data=self._batch_write(db, delete(self.db_model), request))
+            except IntegrityError as e:
+                db.rollback()
+                self._raise(e)
+
+        return route
@@ -0,0 +1,89 @@
+"""可插拔的 JSON 编码器 (orjson / msgspec / 标准库 json), 用于 CRUD 路由的响应"""
+
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Literal, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+    orjson_installed = False
+else:
+    orjson_installed = True
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None  # type: ignore
+    msgspec_installed = False
+else:
+    msgspec_installed = True
+
+logger = logging.getLogger("nb_api")
+
+SERIALIZER = Literal["auto", "orjson", "msgspec", "json"]
+DUMPS = Callable[[Any], bytes]
+
+
+def _default(obj: Any) -> Any:
+    """快速编码器不认识的类型 (Decimal / 模型 / 集合等) 交给 jsonable_encoder, 与 FastAPI 默认的编码结果一致"""
+    return jsonable_encoder(obj)
+
+
+def _json_dumps(content: Any) -> bytes:
+    # 与 starlette JSONResponse.render 的输出一致
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+def _orjson_dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _make_msgspec_dumps() -> DUMPS:
+    # msgspec 原生编码 Decimal, 不经过 enc_hook; 默认编码成字符串, 改为数值, 与 jsonable_encoder 一致
+    encoder = msgspec.json.Encoder(enc_hook=_default, decimal_format="number")
+    return encoder.encode
+
+
+def resolve_serializer(name: SERIALIZER) -> str:
+    """auto 依次选择 orjson / msgspec / json; 指定的库没有安装时退回标准库 json"""
+    if name == "auto":
+        if orjson_installed:
+            return "orjson"
+        return "msgspec" if msgspec_installed else "json"
+    if (name == "orjson" and not orjson_installed) or (name == "msgspec" and not msgspec_installed):
+        logger.warning(f"{name} is not installed, falling back to the standard json encoder.")
+        return "json"
+    if name not in ("orjson", "msgspec", "json"):
+        raise ValueError(f"Unknown serializer: '{name}'.")
+    return name
+
+
+def get_dumps(name: SERIALIZER) -> DUMPS:
+    resolved = resolve_serializer(name)
+    if resolved == "orjson":
+        return _orjson_dumps
+    if resolved == "msgspec":
+        return _make_msgspec_dumps()
+    return _json_dumps
+
+
+@lru_cache(maxsize=None)
+def get_response_class(name: SERIALIZER) -> Type[JSONResponse]:
+    """返回用指定编码器渲染的 JSONResponse 子类 (每种编码器只创建一次)"""
+    resolved = resolve_serializer(name)
+    dumps = get_dumps(resolved)  # type: ignore[arg-type]
+
+    class FastJSONResponse(JSONResponse):
+        def render(self, content: Any) -> bytes:
+            return dumps(content)
+
+    FastJSONResponse.__name__ = FastJSONResponse.__qualname__ = f"{resolved.capitalize()}JSONResponse"
+    return FastJSONResponse
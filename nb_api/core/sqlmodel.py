@@ -1,18 +1,24 @@
 """SQLModel CRUD 路由器"""
 
-from typing import Any, Callable, List, Type, Generator, Optional, Union, Dict, Literal
+from functools import partial
+from typing import Any, Callable, Iterator, List, Sequence, Type, Generator, Optional, Union, Dict, Literal
 
 from fastapi import Depends, HTTPException
 
 from .base import CRUDGenerator, NOT_FOUND
-from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, ResponseModel, CALLABLE, CALLABLE_LIST, SearchRequest, Sorting
+from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, PageResponseModel, ResponseModel, CALLABLE, CALLABLE_LIST, SearchRequest, Sorting, DeleteAllResponseModel
+from .counting import filters_key
+from .cursor import sort_keys
+from .sa_query import SASyncMixin
+from .streaming import STREAM_FORMAT
 from .utils import get_pk_type
 
 try:
     from sqlmodel import Session, select
+    from sqlmodel import Session as SQLModelSession
     from sqlalchemy.exc import IntegrityError
 except ImportError:
-    Session = None  # type: ignore
+    Session = SQLModelSession = None  # type: ignore
     IntegrityError = None  # type: ignore
     select = None  # type: ignore
     sqlmodel_installed = False
@@ -25,8 +31,15 @@ else:
 
 
 
-class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
-    """SQLModel CRUD 路由器"""
+class SQLModelCRUDRouter(SASyncMixin, CRUDGenerator[SCHEMA]):
+    """
+    SQLModel CRUD 路由器
+
+    stream_session: 流式输出 (Accept: application/x-ndjson 或 stream=true) 读取数据用的会话工厂,
+    如返回 sqlmodel.Session 的 sessionmaker. 流式响应在路由返回后才读取数据库, 那时请求的会话可能已经关闭,
+    所以流式读取总是使用单独的会话, 输出结束时关闭. 未指定时退回到在请求会话的 engine 上新建一个普通 Session:
+    不带应用对会话的配置 (会话类、事件、execution_options 等), 也看不到请求事务中未提交的修改
+    """
     
     def __init__(
         self,
@@ -45,6 +58,7 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
         delete_one_route: Union[bool, DEPENDENCIES] = True,
         delete_all_route: Union[bool, DEPENDENCIES] = True,
         search_route: Union[bool, DEPENDENCIES] = True,
+        stream_session: Optional[Callable[[], Any]] = None,
         **kwargs: Any
     ) -> None:
         assert (
@@ -53,6 +67,7 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
 
         self.db_model = db_model
         self.db_func = db
+        self.stream_session = stream_session
         
         # 获取主键字段名
         try:
@@ -86,27 +101,52 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             **kwargs
         )
 
+    def _iter_chunks(self, db: Any, statement: Any) -> Iterator[Sequence[Any]]:
+        """
+        流式输出时用服务端游标 (yield_per) 分块读取; 生成器惰性执行, 响应开始发送后才查询
+
+        路由返回后请求的会话可能已被依赖清理关闭 (FastAPI 0.106 ~ 0.117 在发送响应前清理 yield 依赖),
+        所以用 stream_session 另开一个会话读取 (未指定时在请求会话的 engine 上新建), 输出结束 (或客户端断开) 时关闭
+        """
+        factory = self.stream_session or partial(SQLModelSession, db.get_bind(self.db_model))
+        with factory() as stream_db:
+            result = stream_db.exec(statement.execution_options(yield_per=self.stream_chunk_size))
+            try:
+                yield from result.partitions()
+            finally:
+                result.close()
+
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
         def route(
             db: Session = Depends(self.db_func),
             pagination: PAGINATION = self.pagination,
-        ) -> ResponseModel[List[Any]]:
-            skip, limit = pagination.get("skip"), pagination.get("limit")
-
-            statement = select(self.db_model).offset(skip).limit(limit)
+            stream: Optional[STREAM_FORMAT] = self.stream,
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[Any]]:
+            fields = self._fields(fields)
+
+            keys = sort_keys(None, self._pk)
+            filtered = select(self.db_model)
+            statement = self._page_statement(db, filtered, keys, pagination, fields)
+            if stream:
+                return self._stream_response(self._iter_chunks(db, statement), stream, fields)
             db_models = db.exec(statement).all()
-            return ResponseModel(data=list(db_models))
+            total = self._total(db, filtered, pagination.get("cursor"), "")
+            return self._page_response(db_models, pagination.get("limit"), keys, total, fields)
 
         return route
 
     def _get_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(
-            item_id: self._pk_type, db: Session = Depends(self.db_func)  # type: ignore
+            item_id: self._pk_type,  # type: ignore
+            db: Session = Depends(self.db_func),
+            fields: Optional[str] = None,
         ) -> Any:
+            fields = self._fields(fields)
             model: Optional[SCHEMA] = db.get(self.db_model, item_id)
 
             if model:
-                return ResponseModel(data=model)
+                return self._item_response(model, fields)
             else:
                 raise NOT_FOUND
 
@@ -156,14 +196,8 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
         return route
 
     def _delete_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        def route(db: Session = Depends(self.db_func)) -> ResponseModel[List[Any]]:
-            statement = select(self.db_model)
-            models = db.exec(statement).all()
-            for model in models:
-                db.delete(model)
-            db.commit()
-
-            return ResponseModel(data=[])
+        def route(db: Session = Depends(self.db_func)) -> DeleteAllResponseModel[List[Any]]:
+            return DeleteAllResponseModel(data=[], deleted_count=self._delete_rows(db))
 
         return route
 
@@ -186,48 +220,23 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             search_params: SearchRequest,
             db: Session = Depends(self.db_func),
             pagination: PAGINATION = self.pagination,
-        ) -> ResponseModel[List[Any]]:
-            skip, limit = pagination.get("skip"), pagination.get("limit")
+            stream: Optional[STREAM_FORMAT] = self.stream,
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[Any]]:
+            # 1. 应用过滤器 (filters)
+            filtered = self._where(select(self.db_model), search_params.filters)
 
-            statement = select(self.db_model)
+            # 2. 校验排序字段 (sorting)
+            self._check_sorting(search_params.sorting)
 
-            # 1. 应用过滤器 (filters)
-            if search_params.filters:
-                for f in search_params.filters:
-                    if not hasattr(self.db_model, f.field):
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid filter field: '{f.field}' is not a valid field for {self.db_model.__name__}."
-                        )
-                    
-                    column = getattr(self.db_model, f.field)
-
-                    if f.operator == "gt":
-                        statement = statement.where(column > f.value)
-                    elif f.operator == "lt":
-                        statement = statement.where(column < f.value)
-                    elif f.operator == "eq":
-                        statement = statement.where(column == f.value)
-                    elif f.operator == "ne":
-                        statement = statement.where(column != f.value)
-                    elif f.operator == "contains":
-                        statement = statement.where(column.contains(f.value))
-                    elif f.operator == "in":
-                        statement = statement.where(column.in_(f.value))
-
-            # 2. 应用排序 (sorting)
-            if search_params.sorting:
-                for s in search_params.sorting:
-                    if not hasattr(self.db_model, s.field):
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid sorting field: '{s.field}' is not a valid field for {self.db_model.__name__}."
-                        )
-                    column = getattr(self.db_model, s.field)
-                    statement = statement.order_by(column.desc() if s.direction == "desc" else column.asc())
-
-            statement = statement.offset(skip).limit(limit)
+            # 3. 按排序字段 + 主键排序, 有游标时从游标位置继续
+            keys = sort_keys(search_params.sorting, self._pk)
+            fields = self._fields(fields, search_params)
+            statement = self._page_statement(db, filtered, keys, pagination, fields)
+            if stream:
+                return self._stream_response(self._iter_chunks(db, statement), stream, fields)
             db_models = db.exec(statement).all()
-            return ResponseModel(data=list(db_models))
+            total = self._total(db, filtered, pagination.get("cursor"), filters_key(search_params.filters))
+            return self._page_response(db_models, pagination.get("limit"), keys, total, fields)
 
         return route
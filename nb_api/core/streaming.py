@@ -0,0 +1,94 @@
+"""流式响应: 按块输出 NDJSON / JSON 数组, 用于大结果集导出 (get_all / search)"""
+
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, List, Literal, Optional, Sequence, Type, Union
+
+from fastapi import Depends, Request
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+
+from .types import PYDANTIC_SCHEMA as SCHEMA, PageResponseModel
+
+NDJSON = "application/x-ndjson"
+STREAM_FORMAT = Literal["ndjson", "json"]
+CHUNKS = Union[Iterable[Sequence[Any]], AsyncIterable[Sequence[Any]]]
+
+
+def stream_factory() -> Any:
+    """
+    创建流式输出依赖
+
+    请求头 Accept: application/x-ndjson 时逐行输出 NDJSON;
+    stream=true 时输出与普通响应相同的 {"status_code", "msg", "data": [...]} 结构, data 数组分块写出;
+    两者都没有时返回 None, 路由按原来的方式一次性返回
+    """
+
+    def stream(request: Request, stream: bool = False) -> Optional[STREAM_FORMAT]:
+        if NDJSON in request.headers.get("accept", ""):
+            return "ndjson"
+        return "json" if stream else None
+
+    return Depends(stream)
+
+
+class StreamEncoder:
+    """把一块 ORM 对象 / 模型校验成 schema 并序列化成字节, 每种输出格式一个实例"""
+
+    def __init__(self, schema: Type[SCHEMA], fmt: STREAM_FORMAT) -> None:
+        self.fmt = fmt
+        self.media_type = NDJSON if fmt == "ndjson" else "application/json"
+        self.row_adapter = TypeAdapter(schema)
+        self.list_adapter = TypeAdapter(List[schema])  # type: ignore[valid-type]
+
+        if fmt == "ndjson":
+            self.head, self.tail = b"", b""
+        else:
+            # 与普通列表响应的信封一致: 用空数据的 PageResponseModel 生成首尾 (流式输出不分页, next_cursor 为 null)
+            envelope = TypeAdapter(PageResponseModel[List[Any]]).dump_json(PageResponseModel(data=[]))
+            i = envelope.index(b'"data":[]') + len(b'"data":[')
+            self.head, self.tail = envelope[:i], envelope[i:]
+
+    def encode(self, rows: Sequence[Any], first: bool) -> bytes:
+        if self.fmt == "ndjson":
+            adapter = self.row_adapter
+            return b"".join(
+                adapter.dump_json(adapter.validate_python(row, from_attributes=True), by_alias=True) + b"\n"
+                for row in rows
+            )
+        body = self.list_adapter.dump_json(self.list_adapter.validate_python(rows, from_attributes=True), by_alias=True)
+        # 去掉数组的方括号, 块之间用逗号连接
+        return body[1:-1] if first else b"," + body[1:-1]
+
+
+def _iter_body(chunks: Iterable[Sequence[Any]], encoder: StreamEncoder) -> Iterator[bytes]:
+    yield encoder.head
+    first = True
+    for rows in chunks:
+        if rows:
+            yield encoder.encode(rows, first)
+            first = False
+    yield encoder.tail
+
+
+async def _aiter_body(chunks: AsyncIterable[Sequence[Any]], encoder: StreamEncoder) -> AsyncIterator[bytes]:
+    yield encoder.head
+    first = True
+    async for rows in chunks:
+        if rows:
+            yield encoder.encode(rows, first)
+            first = False
+    yield encoder.tail
+
+
+def stream_response(chunks: CHUNKS, encoder: StreamEncoder) -> StreamingResponse:
+    """
+    把分块产生的数据包装成 StreamingResponse
+
+    chunks 是同步或异步的可迭代对象, 每次产生一块 (一个列表) 数据; 应当惰性地执行查询,
+    这样只有当前块驻留内存, 第一块查出后就开始发送
+    """
+    if hasattr(chunks, "__aiter__"):
+        body: Any = _aiter_body(chunks, encoder)  # type: ignore[arg-type]
+    else:
+        body = _iter_body(chunks, encoder)  # type: ignore[arg-type]
+    return StreamingResponse(body, media_type=encoder.media_type)
+
@@ -1,17 +1,25 @@
 """Tortoise ORM CRUD 路由器"""
 
-from typing import Any, Callable, List, Type, Optional, Union, Dict, Literal
+from typing import Any, AsyncIterator, Callable, List, Sequence, Type, Optional, Union, Dict, Literal
 import asyncio
 
 from fastapi import Depends, HTTPException
 from tortoise.models import Model as TortoiseModel
-from tortoise.exceptions import IntegrityError
+from tortoise.exceptions import BaseORMException, IntegrityError
 from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
 from tortoise.query_utils import Prefetch
 from tortoise import Tortoise
+from tortoise.transactions import in_transaction
 
 from .base import CRUDGenerator, NOT_FOUND
-from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, ResponseModel, CALLABLE, CALLABLE_LIST, SearchRequest, Sorting
+from .types import DEPENDENCIES, PAGINATION, PYDANTIC_SCHEMA as SCHEMA, BaseModel, PageResponseModel, ResponseModel, CALLABLE, CALLABLE_LIST, Filter, SearchRequest, Sorting, BatchCreateResult, BatchItemError, BatchWriteResult, DeleteAllResponseModel
+from .batch import chunked, error_msg
+from .counting import TOTAL, filters_key
+from .loader import BatchLoader
+from .cursor import NULLS_HIGH_DIALECTS, SORT_KEYS, sort_keys
+from .projection import FIELDS, load_fields
+from .streaming import STREAM_FORMAT
 from .utils import get_pk_type
 
 
@@ -46,6 +54,7 @@ class TortoiseCRUDRouter(CRUDGenerator[SCHEMA]):
         delete_one_route: Union[bool, DEPENDENCIES] = True,
         delete_all_route: Union[bool, DEPENDENCIES] = True,
         search_route: Union[bool, DEPENDENCIES] = True,
+        coalesce_window: Optional[float] = None,
         **kwargs: Any
     ) -> None:
         self.db_model = db_model
@@ -71,31 +80,225 @@ class TortoiseCRUDRouter(CRUDGenerator[SCHEMA]):
             **kwargs
         )
 
+        # coalesce_window: 把这么多秒内并发的 GET /{item_id} 合并成一条 IN 查询 (每批最多 batch_chunk_size 个主键)
+        self._loader = (
+            None if coalesce_window is None
+            else BatchLoader(self._load_many, window=coalesce_window, max_batch=self.batch_chunk_size)
+        )
+
+    def coalesce_stats(self) -> Dict[str, Any]:
+        """GET /{item_id} 请求合并的批大小和等待时间, 用于调整 coalesce_window"""
+        return {} if self._loader is None else self._loader.stats()
+
+    async def _load_many(self, ids: List[Any], context: Any = None) -> Dict[Any, Any]:
+        """合并后的批量读取: 一条 IN 查询"""
+        db_models = await self.db_model.filter(**{f"{self._pk}__in": ids})
+        return {getattr(m, self._pk): m for m in db_models}
+
+    def _seek(self, keys: SORT_KEYS, values: List[Any]) -> Q:
+        """
+        严格排在游标之后的条件: k1 >= v1 AND ((k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...)
+
+        降序字段用 lt; NULL 按数据库默认的排序位置处理, 非空字段不生成 isnull 分支
+        """
+        nulls_high = self.db_model._meta.db.capabilities.dialect in NULLS_HIGH_DIALECTS
+        fields_map = self.db_model._meta.fields_map
+        clauses = []
+        for i, ((field, desc), value) in enumerate(zip(keys, values)):
+            nulls_last = nulls_high != desc
+            if value is None:
+                if nulls_last:
+                    continue
+                after = Q(**{f"{field}__isnull": False})
+            else:
+                after = Q(**{f"{field}__{'lt' if desc else 'gt'}": value})
+                if nulls_last and fields_map[field].null:
+                    after = after | Q(**{f"{field}__isnull": True})
+            equal = [
+                Q(**{f"{f}__isnull": True}) if v is None else Q(**{f: v})
+                for (f, _), v in zip(keys[:i], values[:i])
+            ]
+            clauses.append(Q(*equal, after) if equal else after)
+        if not clauses:
+            return Q(**{f"{self._pk}__in": []})
+
+        # 冗余的首字段范围条件, 让数据库对整个 OR 条件做索引区间扫描
+        seek = Q(*clauses, join_type="OR")
+        (field, desc), value = keys[0], values[0]
+        nulls_last = nulls_high != desc
+        if value is None:
+            return Q(Q(**{f"{field}__isnull": True}), seek) if nulls_last else seek
+        bound = Q(**{f"{field}__{'lte' if desc else 'gte'}": value})
+        if nulls_last and fields_map[field].null:
+            bound = bound | Q(**{f"{field}__isnull": True})
+        return Q(bound, seek)
+
+    def _q(self, filters: Optional[List[Filter]]) -> List[Q]:
+        """把过滤条件 (SearchRequest.filters) 编译成 Q 对象"""
+        q_objects = []
+        for f in filters or []:
+            if f.field not in self.db_model._meta.fields_map:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Invalid filter field: '{f.field}' is not a valid field for {self.db_model.__name__}."
+                )
+
+            # 构建 Q 对象
+            field_lookup = f"{f.field}__{f.operator}"
+            if f.operator == "eq":
+                field_lookup = f.field  # 等于操作不需要后缀
+            elif f.operator == "ne":
+                field_lookup = f"{f.field}__not"
+            elif f.operator == "gt":
+                field_lookup = f"{f.field}__gt"
+            elif f.operator == "lt":
+                field_lookup = f"{f.field}__lt"
+            elif f.operator == "contains":
+                field_lookup = f"{f.field}__icontains"
+            elif f.operator == "in":
+                field_lookup = f"{f.field}__in"
+
+            q_objects.append(Q(**{field_lookup: f.value}))
+        return q_objects
+
+    def _batch_query(self, request: Any) -> QuerySet:
+        """批量更新 / 删除选中的行: 主键在 ids 中, 且满足 filters"""
+        query = self.db_model.filter(*self._q(request.filters))
+        if request.ids is not None:
+            query = query.filter(**{f"{self._pk}__in": request.ids})
+        return query
+
+    async def _batch_write(self, request: Any, values: Optional[Dict[str, Any]] = None) -> BatchWriteResult:
+        """
+        一条 UPDATE / DELETE ... WHERE (QuerySet.update / delete), values 为 None 时删除
+
+        Tortoise 的批量更新 / 删除不支持 RETURNING, 请求 returning 时先在同一事务里查出主键, 再按主键更新 / 删除
+        """
+        if not request.returning:
+            query = self._batch_query(request)
+            affected = await (query.delete() if values is None else query.update(**values))
+            return BatchWriteResult(affected=affected)
+        async with in_transaction(self.db_model._meta.default_connection) as conn:
+            ids = await self._batch_query(request).using_db(conn).values_list(self._pk, flat=True)
+            query = self.db_model.filter(**{f"{self._pk}__in": ids}).using_db(conn)
+            await (query.delete() if values is None else query.update(**values))
+        return BatchWriteResult(affected=len(ids), ids=list(ids))
+
+    def _keyset(self, query: QuerySet, keys: SORT_KEYS, cursor: Optional[str]) -> QuerySet:
+        """按排序字段 + 主键排序, 有游标时从游标位置继续"""
+        if cursor is not None:
+            query = query.filter(self._seek(keys, self._cursors.decode(cursor, keys)))
+        return query.order_by(*[f"-{field}" if desc else field for field, desc in keys])
+
+    def _only(self, query: QuerySet, fields: FIELDS, keys: Optional[SORT_KEYS] = None) -> QuerySet:
+        """字段投影下推到 SQL: .only() 只读取投影字段和排序键对应的列"""
+        if fields is None:
+            return query
+        db_fields = self.db_model._meta.db_fields
+        return query.only(*[f for f in load_fields(fields, [f for f, _ in keys or []]) if f in db_fields])
+
+    async def _total(self, filtered: QuerySet, cursor: Optional[str], cache_key: str) -> Optional[TOTAL]:
+        """
+        列表响应的总数: 只在第一页执行一次 COUNT, 之后随游标带到各页
+
+        游标里带着总数时直接沿用; capped 只取前 count_cap + 1 行的主键
+        """
+        if self.count is None:
+            return None
+        total = self._cursors.carried_total(cursor)
+        if total is not None:
+            return total
+        if self.count == "capped":
+            n = len(await filtered.limit(self.count_cap + 1).values_list(self._pk, flat=True))
+            return min(n, self.count_cap), n > self.count_cap
+        if self.count == "cached":
+            cached = self._count_cache.get(cache_key)
+            if cached is not None:
+                return cached, False
+        n = await filtered.count()
+        if self.count == "cached":
+            self._count_cache.set(cache_key, n)
+        return n, False
+
+    async def _iter_chunks(
+        self, query: QuerySet, keys: SORT_KEYS, skip: Optional[int], limit: Optional[int]
+    ) -> AsyncIterator[List[Any]]:
+        """
+        流式输出时分块读取 (Tortoise 没有服务端游标)
+
+        第一块按 skip 读取, 之后每块从上一块最后一行的排序键定位, 每块的开销与位置无关
+        """
+        size = self.stream_chunk_size
+        remaining, last = limit, None
+        while remaining is None or remaining > 0:
+            n = size if remaining is None else min(size, remaining)
+            if last is None:
+                rows = await query.offset(skip or 0).limit(n)
+            else:
+                rows = await query.filter(self._seek(keys, [getattr(last, f) for f, _ in keys])).limit(n)
+            if rows:
+                yield rows
+            if len(rows) < n:
+                break
+            last = rows[-1]
+            if remaining is not None:
+                remaining -= n
+
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
         async def route(
             pagination: PAGINATION = self.pagination,
-        ) -> ResponseModel[List[Any]]:
+            stream: Optional[STREAM_FORMAT] = self.stream,
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[Any]]:
             skip, limit = pagination.get("skip"), pagination.get("limit")
+            fields = self._fields(fields)
 
-            query = self.db_model.all().offset(skip).limit(limit)
-            db_models = await query
-            return ResponseModel(data=list(db_models))
+            keys = sort_keys(None, self._pk)
+            filtered = self.db_model.all()
+            query = self._only(self._keyset(filtered, keys, pagination.get("cursor")), fields, keys)
+            if stream:
+                return self._stream_response(self._iter_chunks(query, keys, skip, limit), stream, fields)
+
+            db_models = await query.offset(skip).limit(limit)
+            total = await self._total(filtered, pagination.get("cursor"), "")
+            return self._page_response(db_models, limit, keys, total, fields)
 
         return route
 
     def _get_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
         async def route(
             item_id: self._pk_type,  # type: ignore
+            fields: Optional[str] = None,
         ) -> Any:
-            db_model = await self.db_model.get_or_none(**{self._pk: item_id})
+            fields = self._fields(fields)
+            if self._loader is not None:
+                # 合并读取整行, 字段投影只作用于响应
+                db_model = await self._loader.load(item_id)
+            else:
+                db_model = await self._only(self.db_model.filter(**{self._pk: item_id}), fields).first()
             
             if db_model:
-                return ResponseModel(data=db_model)
+                return self._item_response(db_model, fields)
             else:
                 raise NOT_FOUND
 
         return route
 
+    def _get_many(self, ids: Any, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            ids: List[Any] = ids,
+            fields: Optional[str] = None,
+        ) -> Any:
+            fields = self._fields(fields)
+            db_models: List[Any] = []
+            # 每 batch_chunk_size 个主键一条 IN 查询, 不超出数据库的参数个数限制
+            for _, chunk in chunked(ids, self.batch_chunk_size):
+                query = self.db_model.filter(**{f"{self._pk}__in": chunk})
+                db_models.extend(await self._only(query, fields, [(self._pk, False)]))
+            return self._many_response(ids, db_models, fields)
+
+        return route
+
     def _create(self, *args: Any, **kwargs: Any) -> CALLABLE:
         async def route(
             model: self.create_schema,  # type: ignore
@@ -108,6 +311,68 @@ class TortoiseCRUDRouter(CRUDGenerator[SCHEMA]):
 
         return route
 
+    async def _insert_chunk(self, models: Sequence[Any]) -> List[Any]:
+        """
+        在一个事务里插入一块数据
+
+        主键不由数据库生成时 (如 Python 端生成的 UUID) 用 bulk_create 一条语句插入;
+        自增主键时 bulk_create 不回填主键, 改为事务内逐条 save, 仍只提交一次
+        """
+        db_models = [self.db_model(**model.model_dump()) for model in models]
+        async with in_transaction(self.db_model._meta.default_connection) as conn:
+            if self.db_model._meta.pk.generated:
+                for db_model in db_models:
+                    await db_model.save(using_db=conn)
+            else:
+                await self.db_model.bulk_create(db_models, using_db=conn)
+        return db_models
+
+    def _create_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            models: List[self.create_schema],  # type: ignore
+        ) -> Any:
+            created: List[Any] = []
+            errors: List[BatchItemError] = []
+            for start, chunk in chunked(models, self.batch_chunk_size):
+                try:
+                    created.extend(await self._insert_chunk(chunk))
+                except BaseORMException:
+                    # 整块失败 (事务已回滚, 约束冲突、取值不合法等任何数据库错误) 时逐条重试, 只有出错的条目记入 errors
+                    for i, model in enumerate(chunk, start):
+                        try:
+                            created.extend(await self._insert_chunk([model]))
+                        except BaseORMException as e:
+                            errors.append(BatchItemError(index=i, msg=error_msg(e)))
+
+            return ResponseModel(data=BatchCreateResult(created=created, errors=errors))
+
+        return route
+
+    def _update_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            request: self._batch_update_request,  # type: ignore
+        ) -> Any:
+            fields_map = self.db_model._meta.fields_map
+            values = {k: v for k, v in self._batch_values(request).items() if k in fields_map}
+            try:
+                return ResponseModel(data=await self._batch_write(request, values))
+            except IntegrityError as e:
+                self._raise(e)
+
+        return route
+
+    def _delete_batch(self, *args: Any, **kwargs: Any) -> CALLABLE:
+        async def route(
+            request: self._batch_delete_request,  # type: ignore
+        ) -> Any:
+            self._check_batch(request)
+            try:
+                return ResponseModel(data=await self._batch_write(request))
+            except IntegrityError as e:
+                self._raise(e)
+
+        return route
+
     def _update(self, *args: Any, **kwargs: Any) -> CALLABLE:
         async def route(
             item_id: self._pk_type,  # type: ignore
@@ -131,12 +396,26 @@ class TortoiseCRUDRouter(CRUDGenerator[SCHEMA]):
 
         return route
 
+    async def _delete_rows(self) -> int:
+        """
+        集合式删除全部行: 一条 DELETE, 不把行加载到内存
+
+        设置 delete_all_chunk_size 时按主键范围分块删除, 每块一个事务, 限制锁的持有时间和单个事务的日志量
+        """
+        deleted = 0
+        while True:
+            bounds = []
+            if self.delete_all_chunk_size is not None:
+                bounds = await self.db_model.all().order_by(self._pk).offset(
+                    self.delete_all_chunk_size - 1
+                ).limit(1).values_list(self._pk, flat=True)
+            if not bounds:
+                return deleted + await self.db_model.all().delete()
+            deleted += await self.db_model.filter(**{f"{self._pk}__lte": bounds[0]}).delete()
+
     def _delete_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        async def route() -> ResponseModel[List[Any]]:
-            db_models = await self.db_model.all()
-            # 在 Tortoise ORM 中，删除所有记录
-            await self.db_model.filter().delete()
-            return ResponseModel(data=[])
+        async def route() -> DeleteAllResponseModel[List[Any]]:
+            return DeleteAllResponseModel(data=[], deleted_count=await self._delete_rows())
 
         return route
 
@@ -158,61 +437,38 @@ class TortoiseCRUDRouter(CRUDGenerator[SCHEMA]):
         async def route(
             search_params: SearchRequest,
             pagination: PAGINATION = self.pagination,
-        ) -> ResponseModel[List[Any]]:
+            stream: Optional[STREAM_FORMAT] = self.stream,
+            fields: Optional[str] = None,
+        ) -> PageResponseModel[List[Any]]:
             skip, limit = pagination.get("skip"), pagination.get("limit")
 
             # 构建查询
             query = self.db_model.all()
 
             # 1. 应用过滤器 (filters)
-            if search_params.filters:
-                q_objects = []
-                for f in search_params.filters:
-                    if f.field not in self.db_model._meta.fields_map:
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid filter field: '{f.field}' is not a valid field for {self.db_model.__name__}."
-                        )
-
-                    # 构建 Q 对象
-                    field_lookup = f"{f.field}__{f.operator}"
-                    if f.operator == "eq":
-                        field_lookup = f.field  # 等于操作不需要后缀
-                    elif f.operator == "ne":
-                        field_lookup = f"{f.field}__not"
-                    elif f.operator == "gt":
-                        field_lookup = f"{f.field}__gt"
-                    elif f.operator == "lt":
-                        field_lookup = f"{f.field}__lt"
-                    elif f.operator == "contains":
-                        field_lookup = f"{f.field}__icontains"
-                    elif f.operator == "in":
-                        field_lookup = f"{f.field}__in"
-
-                    q_objects.append(Q(**{field_lookup: f.value}))
-
-                # 应用所有 Q 对象
-                if q_objects:
-                    query = query.filter(*q_objects)
-
-            # 2. 应用排序 (sorting)
-            if search_params.sorting:
-                ordering = []
-                for s in search_params.sorting:
-                    if s.field not in self.db_model._meta.fields_map:
-                        raise HTTPException(
-                            status_code=422,
-                            detail=f"Invalid sorting field: '{s.field}' is not a valid field for {self.db_model.__name__}."
-                        )
-                    prefix = "-" if s.direction == "desc" else ""
-                    ordering.append(f"{prefix}{s.field}")
-                
-                if ordering:
-                    query = query.order_by(*ordering)
+            query = query.filter(*self._q(search_params.filters))
+
+            # 2. 校验排序字段 (sorting)
+            for s in search_params.sorting or []:
+                if s.field not in self.db_model._meta.fields_map:
+                    raise HTTPException(
+                        status_code=422,
+                        detail=f"Invalid sorting field: '{s.field}' is not a valid field for {self.db_model.__name__}."
+                    )
+
+            # 3. 按排序字段 + 主键排序, 有游标时从游标位置继续
+            keys = sort_keys(search_params.sorting, self._pk)
+            filtered = query
+            fields = self._fields(fields, search_params)
+            query = self._only(self._keyset(filtered, keys, pagination.get("cursor")), fields, keys)
+
+            if stream:
+                return self._stream_response(self._iter_chunks(query, keys, skip, limit), stream, fields)
 
             # 应用分页
             query = query.offset(skip).limit(limit)
             db_models = await query
-            return ResponseModel(data=list(db_models))
+            total = await self._total(filtered, pagination.get("cursor"), filters_key(search_params.filters))
+            return self._page_response(db_models, limit, keys, total, fields)
 
         return route
\ No newline at end of file
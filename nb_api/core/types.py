@@ -5,10 +5,13 @@ from fastapi.params import Depends
 from pydantic import BaseModel
 # from pydantic.generics import GenericModel
 
-PAGINATION = Dict[str, Optional[int]]
+# skip / limit 为 Optional[int], cursor 为 Optional[str]
+PAGINATION = Dict[str, Any]
 PYDANTIC_SCHEMA = BaseModel
 
 T = TypeVar("T")
+# 主键类型
+K = TypeVar("K")
 DEPENDENCIES = Optional[Sequence[Depends]]
 
 class ResponseModel(BaseModel, Generic[T]):
@@ -17,6 +20,36 @@ class ResponseModel(BaseModel, Generic[T]):
     msg: str = "success"
     data: Optional[T] = None
 
+class PageResponseModel(ResponseModel[T], Generic[T]):
+    """
+    列表响应模型 (get_all / search)
+
+    next_cursor 为下一页的游标, 已经到底时为 None;
+    total 为满足条件的总行数 (路由开启 count 时), total_capped 为 True 表示实际行数多于 total
+    """
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_capped: Optional[bool] = None
+
+class DeleteAllResponseModel(ResponseModel[T], Generic[T]):
+    """删除全部记录的响应: deleted_count 为删除的行数"""
+    deleted_count: Optional[int] = None
+
+class GetManyResult(BaseModel, Generic[T]):
+    """按主键批量读取 (GET / POST /many) 的结果: items 按请求中主键的顺序排列, missing 为不存在的主键"""
+    items: List[T] = []
+    missing: List[Any] = []
+
+class BatchItemError(BaseModel):
+    """批量操作中失败的条目: index 为它在请求列表中的下标"""
+    index: int
+    msg: str
+
+class BatchCreateResult(BaseModel, Generic[T]):
+    """批量创建结果: created 为创建成功的行 (按请求顺序), errors 为失败条目, 失败不影响其它条目"""
+    created: List[T] = []
+    errors: List[BatchItemError] = []
+
 class ErrorResponseModel(BaseModel):
     """错误响应模型"""
     status_code: int
@@ -52,4 +85,27 @@ class Sorting(BaseModel):
 
 class SearchRequest(BaseModel):
     filters: Optional[List[Filter]] = None
-    sorting: Optional[List[Sorting]] = None
\ No newline at end of file
+    sorting: Optional[List[Sorting]] = None
+    # 只返回这些字段 (字段投影), 优先于 ?fields= 查询参数
+    fields: Optional[List[str]] = None
+
+
+class BatchDeleteRequest(BaseModel, Generic[K]):
+    """
+    批量删除 (DELETE /batch) 的请求体
+
+    ids 和 filters (与 SearchRequest.filters 相同) 至少给出一个, 同时给出时两者都要满足;
+    returning 为 True 时响应中附带受影响行的主键
+    """
+    ids: Optional[List[K]] = None
+    filters: Optional[List[Filter]] = None
+    returning: bool = False
+
+class BatchUpdateRequest(BatchDeleteRequest[K], Generic[K, T]):
+    """批量更新 (PUT /batch) 的请求体: 选中的行都改成 values 中给出的字段值"""
+    values: T
+
+class BatchWriteResult(BaseModel):
+    """批量更新 / 删除结果: affected 为受影响的行数, ids 为受影响行的主键 (请求 returning 时)"""
+    affected: int
+    ids: Optional[List[Any]] = None
@@ -1,8 +1,10 @@
 """工具函数"""
 
-from typing import Optional, Type, Any
-from fastapi import Depends, HTTPException
-from pydantic import BaseModel, create_model
+import copy
+
+from typing import List, Optional, Type, Any
+from fastapi import Body, Depends, HTTPException
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
 
 from .types import T, PAGINATION, PYDANTIC_SCHEMA
 
@@ -55,6 +57,23 @@ def schema_factory(
     return schema
 
 
+def partial_schema(schema_cls: Type[T], name: str = "Partial") -> Type[T]:
+    """
+    创建所有字段都可以省略的 Schema (用于批量更新的 values)
+
+    字段类型和约束 (max_length / ge / ...) 不变, 只把默认值改成 None;
+    省略的字段不会出现在 model_dump(exclude_unset=True) 中
+    """
+    fields = {}
+    for field_name, field_info in schema_cls.model_fields.items():  # type: ignore[attr-defined]
+        info = copy.copy(field_info)
+        info.default = None
+        info.default_factory = None
+        fields[field_name] = (field_info.annotation, info)
+    schema: Type[T] = create_model(schema_cls.__name__ + name, **fields)  # type: ignore
+    return schema
+
+
 def create_query_validation_exception(field: str, msg: str) -> HTTPException:
     """创建查询参数验证异常"""
     return HTTPException(
@@ -70,9 +89,13 @@ def create_query_validation_exception(field: str, msg: str) -> HTTPException:
 def pagination_factory(max_limit: Optional[int] = None) -> Any:
     """
     创建分页依赖
+
+    skip / limit 为偏移分页; cursor 为上一页响应中的 next_cursor, 从该位置继续 (键集分页, 深翻页不变慢)
     """
 
-    def pagination(skip: int = 0, limit: Optional[int] = max_limit) -> PAGINATION:
+    def pagination(
+        skip: int = 0, limit: Optional[int] = max_limit, cursor: Optional[str] = None
+    ) -> PAGINATION:
         if skip < 0:
             raise create_query_validation_exception(
                 field="skip",
@@ -91,7 +114,38 @@ def pagination_factory(max_limit: Optional[int] = None) -> Any:
                     msg=f"limit query parameter must be less then {max_limit}",
                 )
 
-        return {"skip": skip, "limit": limit}
+        if cursor is not None and skip:
+            raise create_query_validation_exception(
+                field="cursor",
+                msg="cursor query parameter can not be combined with skip",
+            )
+
+        return {"skip": skip, "limit": limit, "cursor": cursor}
 
     return Depends(pagination)
 
+
+def ids_factory(pk_type: Any, from_body: bool = False) -> Any:
+    """
+    创建主键列表依赖 (GET /many?ids=1,2,3, 或 POST /many 的请求体 [1, 2, 3])
+
+    按主键类型校验, 去掉重复的主键并保持请求中的顺序
+    """
+    if from_body:
+        def ids_body(ids: List[pk_type] = Body(...)) -> List[Any]:  # type: ignore[valid-type]
+            return list(dict.fromkeys(ids))
+
+        return Depends(ids_body)
+
+    adapter = TypeAdapter(List[pk_type])  # type: ignore[valid-type]
+
+    def ids_query(ids: str) -> List[Any]:
+        try:
+            values = adapter.validate_python([v.strip() for v in ids.split(",") if v.strip()])
+        except ValidationError:
+            raise create_query_validation_exception(
+                field="ids", msg="ids query parameter must be a comma separated list of ids"
+            ) from None
+        return list(dict.fromkeys(values))
+
+    return Depends(ids_query)
@@ -29,6 +29,9 @@ setup(
     ],
     extras_require={
         "sqlmodel": ["sqlmodel>=0.0.14"],
+        "columnar": ["numpy>=1.21"],
+        "orjson": ["orjson>=3.6"],
+        "msgspec": ["msgspec>=0.18"],
         "dev": [
             "pytest>=7.4.0",
             "httpx>=0.26.0",
@@ -0,0 +1,114 @@
+"""异步路由 GET /{item_id} 请求合并 (coalesce_window) 的吞吐对比: AioSQLModel + Tortoise, sqlite 文件库
+
+python tests/ai_gen/bench_coalesce.py [请求数] [并发数]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+
+import httpx
+from fastapi import FastAPI
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Field, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from tortoise import Tortoise, fields
+from tortoise.models import Model
+
+from nb_api import AioSQLModelCRUDRouter, TortoiseCRUDRouter
+
+ROWS = 10_000
+WINDOWS = [None, 0.001, 0.005]
+
+
+class CoalesceItem(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    price: float
+
+
+class CoalesceItemT(Model):
+    id = fields.IntField(pk=True)
+    name = fields.CharField(50)
+    price = fields.FloatField()
+
+    class Meta:
+        app = "models"
+
+
+class Item(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Optional[int] = None
+    name: str
+    price: float
+
+
+async def run(router: Any, prefix: str, requests: int, concurrency: int) -> float:
+    app = FastAPI()
+    app.include_router(router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int) -> None:
+            async with semaphore:
+                response = await client.get(f"/{prefix}/{i * 7919 % ROWS + 1}")
+                assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+def report(name: str, window: Optional[float], rps: float, router: Any) -> None:
+    stats = router.coalesce_stats()
+    detail = ""
+    if stats:
+        detail = (
+            f"  batches={stats['batches']} avg_batch={stats['avg_batch_size']:.1f} "
+            f"max_batch={stats['max_batch_size']} avg_wait={stats['avg_wait_ms']:.2f}ms"
+        )
+    print(f"{name:<10} window={str(window):<6} {rps:10.0f} req/s{detail}")
+
+
+async def main(requests: int, concurrency: int) -> None:
+    print(f"{ROWS} rows, {requests} GET /{{item_id}} requests, concurrency={concurrency}")
+    directory = tempfile.mkdtemp()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'aio.db')}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.execute(insert(CoalesceItem), [{"name": f"item{i}", "price": i} for i in range(ROWS)])
+
+    async def get_db():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    for window in WINDOWS:
+        router = AioSQLModelCRUDRouter(
+            schema=Item, db_model=CoalesceItem, db=get_db, prefix="items", coalesce_window=window
+        )
+        report("aio", window, await run(router, "items", requests, concurrency), router)
+    await engine.dispose()
+
+    await Tortoise.init(
+        db_url=f"sqlite://{os.path.join(directory, 'tortoise.db')}", modules={"models": ["__main__"]}
+    )
+    await Tortoise.generate_schemas()
+    await CoalesceItemT.bulk_create([CoalesceItemT(name=f"item{i}", price=i) for i in range(ROWS)])
+    for window in WINDOWS:
+        router = TortoiseCRUDRouter(schema=Item, db_model=CoalesceItemT, prefix="titems", coalesce_window=window)
+        report("tortoise", window, await run(router, "titems", requests, concurrency), router)
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+    ))
@@ -0,0 +1,91 @@
+"""列表响应附带 total 的开销: 不计数 / exact / cached / capped (SQLAlchemy + sqlite 与内存路由, 各 200,000 行)
+
+python tests/ai_gen/bench_count.py
+"""
+
+import os
+import tempfile
+import time
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Column, Float, Integer, String, create_engine, insert
+from sqlalchemy.orm import Session, declarative_base
+
+from nb_api import MemoryCRUDRouter, SQLAlchemyCRUDRouter
+
+ROWS, LIMIT = 200_000, 20
+STRATEGIES = [None, "exact", "cached", "capped"]
+Base = declarative_base()
+
+
+class OrderTable(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False, index=True)
+    amount = Column(Float, nullable=False)
+
+
+class Order(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Optional[int] = None
+    status: str
+    amount: float
+
+
+def timed(client: TestClient, url: str, body, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = client.post(url, json=body)
+    assert response.status_code == 200, response.text
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench(name: str, client: TestClient, url: str) -> None:
+    body = {"filters": [{"field": "status", "operator": "eq", "value": "paid"}]}
+    first = timed(client, f"{url}?limit={LIMIT}", body)
+    # 第二页带着第一页游标里的总数, 不再计数
+    cursor = client.post(f"{url}?limit={LIMIT}", json=body).json()["next_cursor"]
+    second = timed(client, f"{url}?limit={LIMIT}&cursor={cursor}", body)
+    print(f"{name:<28}{first:>12.2f}{second:>16.2f}")
+
+
+def main() -> None:
+    print(f"{ROWS} rows (half match the filter), limit={LIMIT}, count_cap=10000")
+    print(f"{'case':<28}{'page 1 ms':>12}{'cursor page ms':>16}")
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(OrderTable), [
+            {"id": i, "status": "paid" if i % 2 else "new", "amount": float(i % 1000)} for i in range(1, ROWS + 1)
+        ])
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    for count in STRATEGIES:
+        app = FastAPI()
+        app.include_router(SQLAlchemyCRUDRouter(
+            schema=Order, db_model=OrderTable, db=get_db, prefix="orders", count=count
+        ))
+        bench(f"sqlalchemy count={count}", TestClient(app), "/orders/search")
+
+    for count in STRATEGIES:
+        prefix = f"bench_count_{str(count).lower()}"
+        router = MemoryCRUDRouter(schema=Order, prefix=prefix, indexes=["status"], count=count)
+        for i in range(1, ROWS + 1):
+            router.store.insert(Order(id=i, status="paid" if i % 2 else "new", amount=float(i % 1000)))
+        app = FastAPI()
+        app.include_router(router)
+        bench(f"memory count={count}", TestClient(app), f"/{prefix}/search")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""偏移分页 vs 游标分页: 第 1 页和深翻页的耗时 (内存路由 / SQLAlchemy + sqlite, 各 200,000 行)
+
+python tests/ai_gen/bench_cursor.py
+"""
+
+import os
+import tempfile
+import time
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Column, Float, Index, Integer, String, create_engine, insert
+from sqlalchemy.orm import Session, declarative_base
+
+from nb_api import MemoryCRUDRouter, SQLAlchemyCRUDRouter
+
+ROWS, LIMIT = 200_000, 20
+Base = declarative_base()
+
+
+class OrderTable(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False)
+    amount = Column(Float, nullable=False)
+
+    # 排序列 + 主键的组合索引, 游标定位和排序都走索引
+    __table_args__ = (Index("ix_orders_amount_id", "amount", "id"),)
+
+
+class Order(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Optional[int] = None
+    status: str
+    amount: float
+
+
+def timed(client: TestClient, method: str, url: str, body=None, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = client.request(method, url, json=body)
+    assert response.status_code == 200
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench(name: str, client: TestClient, method: str, url: str, body=None) -> None:
+    # 先用偏移分页取到深处的一页, 拿它的 next_cursor 作为深翻页的游标
+    deep = ROWS - 10 * LIMIT
+    cursor = client.request(method, f"{url}?skip={deep}&limit={LIMIT}", json=body).json()["next_cursor"]
+    first = timed(client, method, f"{url}?limit={LIMIT}", body)
+    offset = timed(client, method, f"{url}?skip={deep}&limit={LIMIT}", body)
+    seek = timed(client, method, f"{url}?limit={LIMIT}&cursor={cursor}", body)
+    print(f"{name:<28}{first:>12.2f}{offset:>16.2f}{seek:>16.2f}")
+
+
+def main() -> None:
+    print(f"{ROWS} rows, limit={LIMIT}, deep page = row {ROWS - 10 * LIMIT}")
+    print(f"{'case':<28}{'page 1 ms':>12}{'deep skip ms':>16}{'deep cursor ms':>16}")
+
+    router = MemoryCRUDRouter(schema=Order, prefix="bench_cursor_orders", sorted_indexes=["amount"])
+    for i in range(1, ROWS + 1):
+        router.store.insert(Order(id=i, status="paid", amount=float(i % 1000)))
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    sorting = {"sorting": [{"field": "amount", "direction": "desc"}]}
+    bench("memory get_all", client, "GET", "/bench_cursor_orders")
+    bench("memory search (indexed)", client, "POST", "/bench_cursor_orders/search", sorting)
+    bench("memory search (status)", client, "POST", "/bench_cursor_orders/search",
+          {"sorting": [{"field": "status", "direction": "asc"}]})
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(OrderTable), [
+            {"id": i, "status": "paid", "amount": float(i % 1000)} for i in range(1, ROWS + 1)
+        ])
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(SQLAlchemyCRUDRouter(schema=Order, db_model=OrderTable, db=get_db, prefix="orders"))
+    client = TestClient(app)
+    bench("sqlalchemy get_all", client, "GET", "/orders")
+    bench("sqlalchemy search (amount)", client, "POST", "/orders/search",
+          {"sorting": [{"field": "amount", "direction": "asc"}]})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""MemoryCRUDRouter 同步路由 (线程池) vs async 路由 (事件循环) 的吞吐对比
+
+python tests/ai_gen/bench_memory_async.py [请求数] [并发数]
+"""
+
+import asyncio
+import sys
+import time
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from nb_api import MemoryCRUDRouter
+
+
+class Item(BaseModel):
+    id: Optional[int] = None
+    name: str
+    price: float
+
+
+def make_app(async_routes: bool) -> FastAPI:
+    app = FastAPI()
+    prefix = "async_items" if async_routes else "sync_items"
+    app.include_router(MemoryCRUDRouter(schema=Item, prefix=prefix, async_routes=async_routes))
+    return app
+
+
+async def run(async_routes: bool, requests: int, concurrency: int) -> float:
+    app = make_app(async_routes)
+    prefix = "async_items" if async_routes else "sync_items"
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for i in range(100):
+            await client.post(f"/{prefix}", json={"name": f"item{i}", "price": i})
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int) -> None:
+            async with semaphore:
+                await client.get(f"/{prefix}/{i % 100 + 1}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+def main(requests: int, concurrency: int) -> None:
+    for async_routes in (False, True):
+        rps = asyncio.run(run(async_routes, requests, concurrency))
+        print(f"{'async' if async_routes else 'thread pool':<12} {rps:10.0f} req/s")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+    )
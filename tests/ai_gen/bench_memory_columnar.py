@@ -0,0 +1,50 @@
+"""行存储 vs 列式存储 搜索性能对比
+
+python tests/ai_gen/bench_memory_columnar.py [行数]
+"""
+
+import random
+import sys
+import time
+from typing import Optional
+
+from pydantic import BaseModel
+
+from nb_api.core.mem_columnar import ColumnarStore
+from nb_api.core.mem_store import MemoryStore
+from nb_api.core.types import Filter, Sorting
+
+
+class Order(BaseModel):
+    id: int
+    status: str
+    amount: float
+    quantity: int
+    note: Optional[str] = None
+
+
+def main(n: int) -> None:
+    rnd = random.Random(0)
+    statuses = ["new", "paid", "shipped", "done", "cancelled"]
+    row, col = MemoryStore(), ColumnarStore(Order)
+    for i in range(1, n + 1):
+        order = Order(id=i, status=rnd.choice(statuses), amount=rnd.random() * 1000, quantity=rnd.randint(1, 50))
+        row.insert(order)
+        col.insert(order)
+
+    queries = {
+        "eq + gt": ([Filter(field="status", operator="eq", value="paid"),
+                     Filter(field="amount", operator="gt", value=500)], None),
+        "contains + sort": ([Filter(field="status", operator="contains", value="ed")],
+                            [Sorting(field="amount", direction="desc")]),
+        "sort 2 keys": (None, [Sorting(field="quantity", direction="asc"), Sorting(field="amount", direction="desc")]),
+    }
+    for name, (filters, sorting) in queries.items():
+        for store in (row, col):
+            start = time.perf_counter()
+            store.search(filters, sorting, 0, 20)
+            print(f"{name:<16} {type(store).__name__:<14} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,64 @@
+"""Pydantic 行 vs 紧凑记录 的内存占用和更新延迟对比
+
+python tests/ai_gen/bench_memory_compact.py [行数]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+from pydantic import BaseModel
+
+from nb_api.core.mem_record import get_record_codec
+from nb_api.core.mem_store import MemoryStore
+
+
+class Order(BaseModel):
+    id: int
+    status: str
+    amount: float
+    quantity: int
+    note: Optional[str] = None
+
+
+def fill(store: MemoryStore, n: int) -> float:
+    """返回每行占用的字节数 (含行对象本身)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(1, n + 1):
+        store.insert(Order(id=i, status="new", amount=i * 0.5, quantity=i % 50))
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / n
+
+
+def update_model(store: MemoryStore, pk: int) -> None:
+    """原来的更新路径: model_dump 合并后重新构造并校验整行"""
+    def apply(old: Order) -> Order:
+        data = old.model_dump()
+        data.update({"status": "paid", "quantity": 3})
+        return Order(**data)
+    store.update(pk, apply)
+
+
+def main(n: int) -> None:
+    plain, compact = MemoryStore(), MemoryStore(codec=get_record_codec(Order))
+    print(f"{'per-row memory':<16} {'pydantic':<9} {fill(plain, n):8.0f} B")
+    print(f"{'per-row memory':<16} {'compact':<9} {fill(compact, n):8.0f} B")
+
+    for name, store, update in [
+        ("pydantic", plain, update_model),
+        ("compact", compact, lambda s, pk: s.patch(pk, {"status": "paid", "quantity": 3})),
+    ]:
+        start = time.perf_counter()
+        for pk in range(1, n + 1):
+            update(store, pk)
+        print(f"{'update latency':<16} {name:<9} {(time.perf_counter() - start) / n * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
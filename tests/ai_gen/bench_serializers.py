@@ -0,0 +1,57 @@
+"""列表接口在不同 JSON 编码器下的耗时对比 (100 / 1,000 / 10,000 行)
+
+python tests/ai_gen/bench_serializers.py
+"""
+
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from nb_api import MemoryCRUDRouter
+from nb_api.core.serializers import msgspec_installed, orjson_installed
+
+
+class Order(BaseModel):
+    id: Optional[int] = None
+    status: str
+    amount: float
+    created_at: datetime
+    note: Optional[str] = None
+
+
+def bench(rows: int, serializer: Optional[str], trusted_output: bool = False, repeat: int = 20) -> float:
+    prefix = f"orders_{rows}_{serializer}_{trusted_output}".lower()
+    router = MemoryCRUDRouter(schema=Order, prefix=prefix, serializer=serializer, trusted_output=trusted_output)
+    now = datetime(2024, 1, 1)
+    for i in range(1, rows + 1):
+        router.store.insert(Order(id=i, status="paid", amount=i * 1.5, created_at=now, note=f"订单{i}"))
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    client.get(f"/{prefix}")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client.get(f"/{prefix}")
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    candidates = [("default", None, False), ("json", "json", False)]
+    if orjson_installed:
+        candidates.append(("orjson", "orjson", False))
+    if msgspec_installed:
+        candidates.append(("msgspec", "msgspec", False))
+    candidates.append(("trusted_output", None, True))
+
+    print(f"{'encoder':<16}" + "".join(f"{n:>12}" for n in ("100 rows", "1000 rows", "10000 rows")))
+    for name, serializer, trusted in candidates:
+        times = [bench(rows, serializer, trusted) for rows in (100, 1_000, 10_000)]
+        print(f"{name:<16}" + "".join(f"{t:>10.2f}ms" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""SQLAlchemy 路由导出整表: 普通响应 vs 流式 NDJSON 的总耗时、峰值内存, 以及流式输出的首块耗时
+
+python tests/ai_gen/bench_streaming.py
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Column, Float, Integer, String, create_engine, insert
+from sqlalchemy.orm import Session, declarative_base
+
+from nb_api import SQLAlchemyCRUDRouter
+
+Base = declarative_base()
+
+
+class OrderTable(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False)
+    amount = Column(Float, nullable=False)
+    note = Column(String(50), nullable=True)
+
+
+class Order(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Optional[int] = None
+    status: str
+    amount: float
+    note: Optional[str] = None
+
+
+def bench(client: TestClient, headers: dict) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = len(client.get("/orders", headers=headers).content)
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return total * 1000, peak / 1024 / 1024, size / 1024 / 1024
+
+
+def first_chunk(router: SQLAlchemyCRUDRouter, engine) -> float:
+    # TestClient 会把整个响应收完再返回, 首块耗时直接从路由返回的 StreamingResponse 上取
+    with Session(engine) as session:
+        start = time.perf_counter()
+        response = router._get_all()(db=session, pagination={"skip": 0, "limit": None}, stream="ndjson")
+
+        async def pull() -> None:
+            async for chunk in response.body_iterator:
+                if chunk:
+                    break
+
+        asyncio.run(pull())
+        return (time.perf_counter() - start) * 1000
+
+
+def main(rows: int = 200_000) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(OrderTable), [
+            {"id": i, "status": "paid", "amount": i * 1.5, "note": f"订单{i}"} for i in range(1, rows + 1)
+        ])
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    router = SQLAlchemyCRUDRouter(schema=Order, db_model=OrderTable, db=get_db, prefix="orders")
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    print(f"{rows} rows")
+    print(f"{'mode':<10}{'total ms':>12}{'peak MiB':>12}{'body MiB':>12}")
+    for name, headers in [("buffered", {}), ("ndjson", {"Accept": "application/x-ndjson"})]:
+        total, peak, size = bench(client, headers)
+        print(f"{name:<10}{total:>12.0f}{peak:>12.1f}{size:>12.1f}")
+    print(f"ndjson first chunk: {first_chunk(router, engine):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""默认响应路径 vs trusted_output 的 get_all 大页耗时对比 (SQLAlchemy + 内存 SQLite)
+
+python tests/ai_gen/bench_trusted_output.py [每页行数]
+"""
+
+import sys
+import time
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Column, Float, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import StaticPool
+
+from nb_api import SQLAlchemyCRUDRouter
+
+Base = declarative_base()
+
+
+class OrderTable(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20))
+    amount = Column(Float)
+    note = Column(String(100), nullable=True)
+
+
+class Order(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: str
+    amount: float
+    note: Optional[str] = None
+
+
+def main(n: int) -> None:
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(OrderTable(id=i, status="paid", amount=i * 1.5, note=f"订单{i}") for i in range(1, n + 1))
+        session.commit()
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    for trusted in (False, True):
+        app = FastAPI()
+        app.include_router(SQLAlchemyCRUDRouter(
+            schema=Order, db_model=OrderTable, db=get_db, prefix="orders", trusted_output=trusted,
+        ))
+        client = TestClient(app)
+        client.get(f"/orders?limit={n}")
+        start = time.perf_counter()
+        for _ in range(10):
+            client.get(f"/orders?limit={n}")
+        elapsed = (time.perf_counter() - start) / 10
+        print(f"{'trusted_output' if trusted else 'default':<16} {elapsed * 1000:8.1f} ms / {n} rows")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000)
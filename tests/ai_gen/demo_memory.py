@@ -62,10 +62,8 @@ app.include_router(book_router)
 @app.on_event("startup")
 async def add_initial_data():
     """添加初始测试数据"""
-    from nb_api.core.mem import _memory_stores, _id_counters
-    
     # 获取 books 存储
-    books_store = _memory_stores.get("books", [])
+    books_store = book_router.store
     
     # 添加10条测试数据
     test_books = [
@@ -84,10 +82,10 @@ async def add_initial_data():
     # 添加到存储中
     for i, book_data in enumerate(test_books, 1):
         book_data["id"] = i
-        books_store.append(Book(**book_data))
+        books_store.insert(Book(**book_data))
     
     # 更新 ID 计数器
-    _id_counters["books"] = 11
+    books_store.next_id = 11
     
     print(f"已添加 {len(books_store)} 条初始数据")
 
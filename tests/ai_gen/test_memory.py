@@ -0,0 +1,883 @@
+"""内存 CRUD 路由器测试"""
+
+import os
+import pytest
+from datetime import date
+from typing import Optional
+from uuid import UUID, uuid4
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, Field
+from fastapi import FastAPI
+from nb_api import MemoryCRUDRouter
+
+
+class Book(BaseModel):
+    """测试图书模型"""
+    id: Optional[int] = None
+    title: str
+    author: str
+    price: float
+
+
+class Sku(BaseModel):
+    """自定义主键模型"""
+    code: int
+    name: str
+
+
+def create_client(prefix: str, **kwargs) -> TestClient:
+    app = FastAPI()
+    router = MemoryCRUDRouter(schema=Book, prefix=prefix, **kwargs)
+    app.include_router(router)
+    return TestClient(app)
+
+
+def seed_books(client: TestClient, prefix: str, n: int = 10) -> None:
+    authors = ["张三", "李四", "王五"]
+    for i in range(n):
+        client.post(f"/{prefix}", json={
+            "title": f"图书{i}",
+            "author": authors[i % 3],
+            "price": float(i * 10),
+        })
+
+
+def test_pk_index_crud():
+    """测试主键索引下的增删改查和插入顺序"""
+    client = create_client("pk_books")
+    seed_books(client, "pk_books", 5)
+
+    response = client.get("/pk_books/3")
+    assert response.status_code == 200
+    assert response.json()["data"]["title"] == "图书2"
+
+    response = client.put("/pk_books/3", json={"title": "改名", "author": "赵六", "price": 1.0})
+    assert response.json()["data"]["id"] == 3
+
+    response = client.delete("/pk_books/2")
+    assert response.status_code == 200
+    assert client.get("/pk_books/2").status_code == 404
+    assert client.delete("/pk_books/2").status_code == 404
+
+    # 更新不改变位置, 删除不打乱顺序
+    ids = [b["id"] for b in client.get("/pk_books").json()["data"]]
+    assert ids == [1, 3, 4, 5]
+    titles = [b["title"] for b in client.get("/pk_books?skip=1&limit=2").json()["data"]]
+    assert titles == ["改名", "图书3"]
+
+    client.delete("/pk_books")
+    assert client.get("/pk_books").json()["data"] == []
+
+
+def test_custom_pk_field():
+    """测试自定义主键字段"""
+    app = FastAPI()
+    app.include_router(MemoryCRUDRouter(schema=Sku, prefix="skus", pk_field="code"))
+    client = TestClient(app)
+
+    response = client.post("/skus", json={"name": "a"})
+    assert response.json()["data"]["code"] == 1
+    client.post("/skus", json={"name": "b"})
+
+    assert client.get("/skus/2").json()["data"]["name"] == "b"
+    response = client.put("/skus/2", json={"name": "bb"})
+    assert response.json()["data"] == {"code": 2, "name": "bb"}
+    assert client.delete("/skus/1").status_code == 200
+    assert [s["code"] for s in client.get("/skus").json()["data"]] == [2]
+
+
+def test_hash_index_search():
+    """测试二级哈希索引的搜索结果与全表扫描一致, 且随写入更新"""
+    indexed = create_client("idx_books", indexes=["author"])
+    plain = create_client("plain_books")
+    for client, prefix in ((indexed, "idx_books"), (plain, "plain_books")):
+        seed_books(client, prefix, 12)
+        client.put(f"/{prefix}/1", json={"title": "改", "author": "李四", "price": 5.0})
+        client.delete(f"/{prefix}/5")
+
+    bodies = [
+        {"filters": [{"field": "author", "operator": "eq", "value": "李四"}]},
+        {"filters": [{"field": "author", "operator": "ne", "value": "李四"},
+                     {"field": "price", "operator": "gt", "value": 30}]},
+        {"filters": [{"field": "author", "operator": "in", "value": ["张三", "王五"]}]},
+        {"filters": [{"field": "author", "operator": "eq", "value": "不存在"}]},
+    ]
+    for body in bodies:
+        expected = plain.post("/plain_books/search", json=body).json()["data"]
+        assert indexed.post("/idx_books/search", json=body).json()["data"] == expected
+
+    ids = [b["id"] for b in indexed.post("/idx_books/search", json=bodies[0]).json()["data"]]
+    assert ids == [1, 2, 8, 11]
+
+
+def test_sorted_index_search():
+    """测试有序索引的范围过滤和有序遍历与全表扫描一致"""
+    indexed = create_client("sorted_books", sorted_indexes=["price", "author"])
+    plain = create_client("unsorted_books")
+    for client, prefix in ((indexed, "sorted_books"), (plain, "unsorted_books")):
+        seed_books(client, prefix, 20)
+        client.put(f"/{prefix}/3", json={"title": "改", "author": "赵六", "price": 55.0})
+        client.delete(f"/{prefix}/7")
+
+    bodies = [
+        {"filters": [{"field": "price", "operator": "gt", "value": 50},
+                     {"field": "price", "operator": "lt", "value": 150}]},
+        {"sorting": [{"field": "price", "direction": "desc"}]},
+        {"sorting": [{"field": "author", "direction": "desc"}]},
+        {"sorting": [{"field": "author", "direction": "asc"}, {"field": "price", "direction": "desc"}],
+         "filters": [{"field": "title", "operator": "contains", "value": "1"}]},
+    ]
+    for body in bodies:
+        for query in ("", "?limit=3", "?skip=2&limit=4"):
+            expected = plain.post(f"/unsorted_books/search{query}", json=body).json()["data"]
+            assert indexed.post(f"/sorted_books/search{query}", json=body).json()["data"] == expected
+
+    ids = [b["id"] for b in indexed.post("/sorted_books/search?limit=3", json=bodies[1]).json()["data"]]
+    assert ids == [20, 19, 18]
+
+
+class Event(BaseModel):
+    """覆盖多种列类型的模型"""
+    id: int
+    name: Optional[str] = None
+    score: Optional[int] = None
+    ratio: float
+    active: bool
+
+
+def make_events(n: int = 300):
+    import random
+    rnd = random.Random(7)
+    names = ["alpha", "beta", "gamma", "delta", None]
+    return [
+        Event(
+            id=i,
+            name=rnd.choice(names),
+            score=rnd.choice([None, *range(10)]),
+            ratio=round(rnd.random(), 2),
+            active=rnd.random() > 0.5,
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def test_columnar_store_matches_row_store():
+    """测试列式存储的过滤 / 排序 / 分页结果与行存储一致"""
+    from nb_api.core.mem_columnar import ColumnarStore
+    from nb_api.core.mem_store import MemoryStore
+    from nb_api.core.types import Filter, Sorting
+
+    row, col = MemoryStore(), ColumnarStore(Event)
+    for event in make_events():
+        row.insert(event)
+        col.insert(event)
+    for pk in (3, 50, 120):
+        row.remove(pk)
+        col.remove(pk)
+    changed = Event(id=10, name="beta", score=9, ratio=0.5, active=True)
+    row.replace(10, changed)
+    col.replace(10, changed)
+
+    cases = [
+        ([Filter(field="name", operator="eq", value="beta")], None),
+        ([Filter(field="name", operator="contains", value="a")], [Sorting(field="ratio", direction="desc")]),
+        ([Filter(field="score", operator="gt", value=4), Filter(field="score", operator="lt", value=8)], None),
+        ([Filter(field="score", operator="in", value=[1, 2, 3])], [Sorting(field="name", direction="asc")]),
+        ([Filter(field="active", operator="eq", value=True), Filter(field="name", operator="ne", value="alpha")],
+         [Sorting(field="active", direction="desc"), Sorting(field="ratio", direction="asc")]),
+        ([Filter(field="name", operator="gt", value="beta"), Filter(field="ratio", operator="lt", value=0.5)],
+         [Sorting(field="name", direction="desc")]),
+    ]
+    for filters, sorting in cases:
+        for skip, limit in ((0, None), (0, 10), (5, 7)):
+            expected = [e.model_dump() for e in row.search(filters, sorting, skip, limit)]
+            assert [e.model_dump() for e in col.search(filters, sorting, skip, limit)] == expected
+
+    assert [e.id for e in col.page(2, 3)] == [e.id for e in row.page(2, 3)]
+    assert col.get(10) == changed
+    assert len(col.clear()) == len(row) and len(col) == 0
+
+
+class Dated(BaseModel):
+    """可空的非数值列"""
+    id: int
+    when: Optional[date] = None
+
+
+def test_columnar_sort_nullable_object():
+    """测试列式存储按可空的 date 列排序: None 排在最后, 结果与行存储一致"""
+    from nb_api.core.mem_columnar import ColumnarStore
+    from nb_api.core.mem_store import MemoryStore
+    from nb_api.core.types import Sorting
+
+    row, col = MemoryStore(), ColumnarStore(Dated)
+    for i, when in enumerate([date(2024, 1, 1), None, date(2023, 1, 1), None, date(2024, 1, 1)], 1):
+        row.insert(Dated(id=i, when=when))
+        col.insert(Dated(id=i, when=when))
+    for direction in ("asc", "desc"):
+        sorting = [Sorting(field="when", direction=direction)]
+        assert [d.id for d in col.search(None, sorting)] == [d.id for d in row.search(None, sorting)]
+    assert [d.id for d in col.search(None, [Sorting(field="when", direction="asc")])] == [3, 1, 5, 2, 4]
+
+
+def test_columnar_router():
+    """测试列式存储的路由"""
+    client = create_client("col_books", storage="columnar")
+    seed_books(client, "col_books", 6)
+    client.delete("/col_books/2")
+    body = {"filters": [{"field": "author", "operator": "in", "value": ["张三", "王五"]}],
+            "sorting": [{"field": "price", "direction": "desc"}]}
+    ids = [b["id"] for b in client.post("/col_books/search", json=body).json()["data"]]
+    assert ids == [6, 4, 3, 1]
+    assert client.get("/col_books/4").json()["data"]["title"] == "图书3"
+
+
+def test_topk_matches_full_sort():
+    """测试堆选取前 k 行与多次稳定排序后切片的结果一致 (含并列和 None)"""
+    from nb_api.core.mem_store import MemoryStore
+    from nb_api.core.types import Sorting
+
+    store = MemoryStore()
+    events = make_events(200)
+    for event in events:
+        store.insert(event)
+
+    sorting = [Sorting(field="active", direction="desc"), Sorting(field="score", direction="asc")]
+    reference = list(events)
+    reference.sort(key=lambda e: (e.score is None, e.score if e.score is not None else 0))
+    reference.sort(key=lambda e: e.active, reverse=True)
+    for skip, limit in ((0, 5), (17, 20), (190, 50)):
+        page = store.search(None, sorting, skip, limit)
+        assert [e.id for e in page] == [e.id for e in reference[skip:skip + limit]]
+    assert [e.id for e in store.search(None, None, 30, 5)] == list(range(31, 36))
+
+
+def test_compiled_predicate():
+    """测试编译后的谓词与逐条过滤语义一致, 且相同形状复用缓存"""
+    from nb_api.core.mem_predicate import compile_filters, compile_shape
+    from nb_api.core.mem_store import match_value
+    from nb_api.core.types import Filter
+
+    events = make_events(100)
+    for value in ("a", "beta", "zzz"):
+        filters = [Filter(field="name", operator="contains", value=value),
+                   Filter(field="score", operator="in", value=[1, 5, 9])]
+        predicate = compile_filters(filters)
+        expected = [e.id for e in events if all(match_value(getattr(e, f.field), f) for f in filters)]
+        assert [e.id for e in events if predicate(e)] == expected
+
+    info = compile_shape.cache_info()
+    compile_filters([Filter(field="name", operator="contains", value="q"),
+                     Filter(field="score", operator="in", value=[2])])
+    assert compile_shape.cache_info().hits == info.hits + 1
+    assert compile_filters(None) is None
+
+
+def test_concurrent_writers():
+    """测试 64 个并发写线程下主键唯一、索引一致, 并发读不报错"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    router = MemoryCRUDRouter(schema=Book, prefix="stress_books", indexes=["author"], sorted_indexes=["price"])
+    create, update, delete = router._create(), router._update(), router._delete_one()
+    search = router._search()
+    from nb_api.core.types import SearchRequest
+    stop = threading.Event()
+    errors = []
+
+    def writer(w: int) -> None:
+        for i in range(50):
+            book = create(router.create_schema(title=f"w{w}-{i}", author=f"a{w % 4}", price=float(i)))
+            if i % 5 == 0:
+                update(book.data.id, router.update_schema(title="u", author="a9", price=-1.0))
+            if i % 7 == 0:
+                delete(book.data.id)
+
+    def reader() -> None:
+        body = SearchRequest(filters=[{"field": "author", "operator": "eq", "value": "a1"}],
+                             sorting=[{"field": "price", "direction": "desc"}])
+        while not stop.is_set():
+            try:
+                search(body, {"skip": 0, "limit": 10})
+                router.store.page(0, 20)
+            except Exception as e:  # noqa
+                errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for t in readers:
+        t.start()
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        list(pool.map(writer, range(64)))
+    stop.set()
+    for t in readers:
+        t.join()
+
+    store = router.store
+    assert not errors
+    assert len(store) == 64 * (50 - 8)
+    assert store.next_id == 64 * 50 + 1
+    assert sum(len(b) for b in store.indexes["author"].buckets.values()) == len(store)
+    assert len(store.sorted_indexes["price"].keys) == len(store)
+    assert len(store.indexes["author"].buckets["a9"]) == 64 * (10 - 2)
+
+
+def test_insert_auto_atomic():
+    """测试 insert_auto: 分配主键和插入在同一次写锁内, 并发的手动插入抢不到分配出去的主键"""
+    import threading
+    from nb_api.core.mem_columnar import ColumnarStore
+    from nb_api.core.mem_store import MemoryStore
+
+    for store in (MemoryStore(), ColumnarStore(Book)):
+        results = []
+
+        def manual() -> None:
+            try:
+                results.append(store.insert(Book(id=1, title="手动", author="x", price=0)))
+            except KeyError as e:
+                results.append(e)
+
+        def make_row(pk: int) -> Book:
+            # 已分配主键、尚未插入时, 另一个线程尝试插入同一主键: 它必须等到这一行插入之后
+            thread = threading.Thread(target=manual)
+            thread.start()
+            thread.join(0.05)
+            assert thread.is_alive()
+            threads.append(thread)
+            return Book(id=pk, title="自动", author="x", price=0)
+
+        threads = []
+        assert store.insert_auto(make_row).id == 1
+        threads[0].join()
+        assert isinstance(results[0], KeyError)
+        assert store.get(1).title == "自动"
+
+
+def test_persistence_recovery(tmp_path):
+    """测试 WAL + 快照持久化: 重启后从快照和日志尾部恢复"""
+    from nb_api.core import mem
+
+    def start() -> TestClient:
+        mem._memory_stores.pop("durable_books", None)
+        return create_client("durable_books", persist_dir=str(tmp_path), snapshot_every=7, indexes=["author"])
+
+    client = start()
+    seed_books(client, "durable_books", 10)
+    client.put("/durable_books/2", json={"title": "改", "author": "赵六", "price": 1.0})
+    client.delete("/durable_books/3")
+    expected = client.get("/durable_books").json()["data"]
+    journal = mem._memory_stores["durable_books"].journal
+    journal.close()
+    assert (tmp_path / "durable_books.snapshot").exists()
+
+    # 模拟崩溃时写了一半的日志行
+    with open(journal._wal_path(journal.generation), "ab") as f:
+        f.write(b'{"op":"del","pk":')
+
+    client = start()
+    assert client.get("/durable_books").json()["data"] == expected
+    body = {"filters": [{"field": "author", "operator": "eq", "value": "赵六"}]}
+    assert [b["id"] for b in client.post("/durable_books/search", json=body).json()["data"]] == [2]
+    assert client.post("/durable_books", json={"title": "新", "author": "x", "price": 0}).json()["data"]["id"] == 11
+
+    client.delete("/durable_books")
+    mem._memory_stores["durable_books"].journal.close()
+    client = start()
+    assert client.get("/durable_books").json()["data"] == []
+    mem._memory_stores["durable_books"].journal.close()
+
+
+class Token(BaseModel):
+    """UUID 主键模型"""
+    key: UUID
+    owner: str
+
+
+def test_persistence_uuid_pk(tmp_path):
+    """测试 WAL 中删除记录的主键按主键类型编码, 重启后 UUID 主键的删除照常重放"""
+    from nb_api.core import mem
+
+    def start() -> TestClient:
+        mem._memory_stores.pop("durable_tokens", None)
+        app = FastAPI()
+        app.include_router(MemoryCRUDRouter(
+            schema=Token, prefix="durable_tokens", pk_field="key", create_schema=Token, persist_dir=str(tmp_path)
+        ))
+        return TestClient(app)
+
+    client = start()
+    keys = [str(uuid4()) for _ in range(3)]
+    for key in keys:
+        client.post("/durable_tokens", json={"key": key, "owner": "张三"})
+    assert client.delete(f"/durable_tokens/{keys[1]}").status_code == 200
+    mem._memory_stores["durable_tokens"].journal.close()
+
+    client = start()
+    assert [t["key"] for t in client.get("/durable_tokens").json()["data"]] == [keys[0], keys[2]]
+    mem._memory_stores["durable_tokens"].journal.close()
+
+
+def _shared_writer(name: str, start: int, n: int) -> None:
+    """子进程: attach 到同一块共享内存并写入"""
+    from nb_api.core.mem_shared import SharedMemoryStore
+    store = SharedMemoryStore(Book, name, capacity=64, slot_size=256)
+    for i in range(start, start + n):
+        store.insert(Book(id=store.next_pk(), title=f"子进程{i}", author="子进程", price=float(i)))
+    store.close()
+
+
+def test_shared_memory_store():
+    """测试共享内存存储: 多个进程看到同一份数据, 槽位满时压缩空洞"""
+    import multiprocessing
+    import uuid
+    from nb_api.core import mem
+    from nb_api.core.mem_shared import SharedMemoryStore
+
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    client = create_client(name, storage="shared", shared_capacity=64, shared_slot_size=256)
+    store = mem._memory_stores[name]
+    try:
+        seed_books(client, name, 10)
+        # 另一个 worker 进程写入, 本进程无需任何通知即可读到
+        process = multiprocessing.get_context("spawn").Process(target=_shared_writer, args=(name, 0, 5))
+        process.start()
+        process.join(30)
+        assert process.exitcode == 0
+        assert [b["id"] for b in client.get(f"/{name}").json()["data"]] == list(range(1, 16))
+        assert client.get(f"/{name}/13").json()["data"]["author"] == "子进程"
+
+        # 同一进程里再 attach 一次, 模拟另一个 worker
+        other = SharedMemoryStore(Book, name, capacity=64, slot_size=256)
+        client.put(f"/{name}/2", json={"title": "改", "author": "赵六", "price": 1.0})
+        client.delete(f"/{name}/1")
+        assert other.get(2).author == "赵六" and other.get(1) is None and len(other) == 14
+        body = {"filters": [{"field": "author", "operator": "eq", "value": "子进程"}],
+                "sorting": [{"field": "price", "direction": "desc"}]}
+        assert [b["id"] for b in client.post(f"/{name}/search", json=body).json()["data"]] == [15, 14, 13, 12, 11]
+
+        # 删除留下的空洞在槽位用完时被压缩, 插入顺序不变
+        for i in range(2, 12):
+            client.delete(f"/{name}/{i}")
+        for _ in range(55):
+            assert client.post(f"/{name}", json={"title": "t", "author": "a", "price": 0}).status_code == 200
+        assert len(other) == 59
+        assert [b.id for b in other][:5] == [12, 13, 14, 15, 16]
+        response = client.post(f"/{name}", json={"title": "x" * 300, "author": "a", "price": 0})
+        assert response.status_code == 422
+        other.close()
+    finally:
+        store.unlink()
+        mem._memory_stores.pop(name, None)
+
+
+def test_shared_memory_uuid_pk():
+    """测试共享内存存储的 UUID 主键: 主键按类型编码, 读取 / 修改 / 删除与行存储行为一致"""
+    import uuid
+    from nb_api.core import mem
+
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    app = FastAPI()
+    app.include_router(MemoryCRUDRouter(
+        schema=Token, prefix=name, pk_field="key", create_schema=Token, storage="shared",
+        shared_capacity=16, shared_slot_size=256,
+    ))
+    client = TestClient(app)
+    try:
+        key = str(uuid4())
+        assert client.post(f"/{name}", json={"key": key, "owner": "张三"}).status_code == 200
+        assert client.get(f"/{name}/{key}").json()["data"]["owner"] == "张三"
+        assert client.put(f"/{name}/{key}", json={"key": key, "owner": "李四"}).json()["data"]["owner"] == "李四"
+        assert client.get(f"/{name}/{uuid4()}").status_code == 404
+        assert client.delete(f"/{name}/{key}").status_code == 200
+        assert client.get(f"/{name}/{key}").status_code == 404
+    finally:
+        mem._memory_stores.pop(name).unlink()
+
+
+def _shared_dying_writer(name: str) -> None:
+    """子进程: 开始写入 (seqlock version 变为奇数) 后不收尾直接退出"""
+    from nb_api.core.mem_shared import SharedMemoryStore
+    store = SharedMemoryStore(Book, name, capacity=64, slot_size=256)
+    with store.lock.write():
+        store._begin()
+        os._exit(0)
+
+
+def test_shared_memory_dead_writer():
+    """测试写者写到一半时退出: 读者不再无限等待, 改为持锁读取并修复 version"""
+    import multiprocessing
+    import time
+    import uuid
+    from nb_api.core.mem_shared import SharedMemoryStore
+
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    store = SharedMemoryStore(Book, name, capacity=64, slot_size=256)
+    try:
+        store.insert(Book(id=1, title="t", author="a", price=0))
+        process = multiprocessing.get_context("spawn").Process(target=_shared_dying_writer, args=(name,))
+        process.start()
+        process.join(30)
+        assert process.exitcode == 0 and store._version() % 2
+
+        start = time.monotonic()
+        assert store.get(1).title == "t"
+        assert time.monotonic() - start < 5
+        assert store._version() % 2 == 0
+        assert [b.id for b in store] == [1]
+    finally:
+        store.unlink()
+
+
+def test_text_index_contains():
+    """测试 n-gram 倒排索引: contains 结果与全表扫描一致, 并统计命中情况"""
+    client = create_client("text_books", text_indexes=["title", "author"])
+    seed_books(client, "text_books", 30)
+    client.put("/text_books/5", json={"title": "Python 编程", "author": "李四", "price": 1.0})
+    client.delete("/text_books/7")
+
+    plain = create_client("plain_text_books")
+    seed_books(plain, "plain_text_books", 30)
+    plain.put("/plain_text_books/5", json={"title": "Python 编程", "author": "李四", "price": 1.0})
+    plain.delete("/plain_text_books/7")
+
+    for field, value in [("title", "图书1"), ("title", "书2"), ("title", "编程"), ("title", "图"),
+                         ("title", "不存在"), ("author", "李四")]:
+        body = {"filters": [{"field": field, "operator": "contains", "value": value}]}
+        expected = plain.post("/plain_text_books/search", json=body).json()["data"]
+        assert client.post("/text_books/search", json=body).json()["data"] == expected
+
+    from nb_api.core import mem
+    stats = {s["field"]: s for s in mem._memory_stores["text_books"].index_stats()}
+    assert stats["title"]["queries"] == 5
+    assert stats["title"]["served"] == 4  # "图" 短于 n, 无法使用索引
+    assert stats["title"]["memory_bytes"] > 0 and stats["author"]["grams"] == 3
+
+
+def test_bounded_store_eviction():
+    """测试容量限制: LRU 淘汰和 TTL 过期与主键、二级索引保持一致"""
+    import time
+    from nb_api.core import mem
+
+    client = create_client("lru_books", max_items=5, indexes=["author"])
+    seed_books(client, "lru_books", 5)
+    client.get("/lru_books/1")  # 1 变为最近使用
+    seed_books(client, "lru_books", 2)
+    assert [b["id"] for b in client.get("/lru_books").json()["data"]] == [1, 4, 5, 6, 7]
+    assert client.get("/lru_books/2").status_code == 404
+    body = {"filters": [{"field": "author", "operator": "eq", "value": "李四"}]}
+    assert [b["id"] for b in client.post("/lru_books/search", json=body).json()["data"]] == [5, 7]
+    stats = mem._memory_stores["lru_books"].eviction_stats()
+    assert stats["evictions"] == 2 and stats["items"] == 5
+
+    client = create_client("byte_books", max_bytes=300)
+    seed_books(client, "byte_books", 10)
+    stats = mem._memory_stores["byte_books"].eviction_stats()
+    assert 0 < stats["bytes"] <= 300 and stats["evictions"] == 10 - stats["items"]
+
+    client = create_client("ttl_books", ttl=0.2, indexes=["author"])
+    seed_books(client, "ttl_books", 3)
+    time.sleep(0.15)
+    client.put("/ttl_books/2", json={"title": "续期", "author": "李四", "price": 1.0})
+    time.sleep(0.1)
+    assert [b["id"] for b in client.get("/ttl_books").json()["data"]] == [2]
+    assert client.get("/ttl_books/1").status_code == 404
+    assert [b["id"] for b in client.post("/ttl_books/search", json=body).json()["data"]] == [2]
+    assert mem._memory_stores["ttl_books"].eviction_stats()["expirations"] == 2
+
+
+def test_compact_rows():
+    """测试紧凑行表示: 行存为 __slots__ 记录, 结果与普通存储一致"""
+    from nb_api.core import mem
+
+    client = create_client("compact_books", compact=True, indexes=["author"], sorted_indexes=["price"])
+    plain = create_client("plain_compact_books")
+    for c, prefix in [(client, "compact_books"), (plain, "plain_compact_books")]:
+        seed_books(c, prefix, 12)
+        c.put(f"/{prefix}/4", json={"title": "改", "author": "赵六", "price": 5.5})
+        c.put(f"/{prefix}/5", json={"price": 999.0, "title": "图书4", "author": "李四"})
+        c.delete(f"/{prefix}/6")
+
+    store = mem._memory_stores["compact_books"]
+    assert not hasattr(store.rows[1], "__dict__")
+    assert client.get("/compact_books").json() == plain.get("/plain_compact_books").json()
+    assert client.get("/compact_books/4").json() == plain.get("/plain_compact_books/4").json()
+    body = {"filters": [{"field": "author", "operator": "in", "value": ["赵六", "李四"]}],
+            "sorting": [{"field": "price", "direction": "desc"}]}
+    assert (client.post("/compact_books/search", json=body).json()
+            == plain.post("/plain_compact_books/search", json=body).json())
+    assert client.delete("/compact_books/4").json()["data"]["author"] == "赵六"
+    assert isinstance(store.get(5), Book) and store.get(5).price == 999.0
+
+
+def test_columnar_tombstones():
+    """测试列式存储的墓碑删除: 分页和搜索跳过墓碑, 按比例和空闲时间压缩"""
+    import time
+    from nb_api.core.mem_columnar import ColumnarStore
+    from nb_api.core.types import Filter
+
+    col = ColumnarStore(Event, compact_ratio=0.5, compact_idle=0.05)
+    events = make_events(100)
+    for event in events:
+        col.insert(event)
+    for pk in range(1, 41, 2):
+        col.remove(pk)
+    assert col.tombstones == 20 and col.compactions == 0
+    alive = [e for e in events if e.id > 40 or e.id % 2 == 0]
+    assert [e.id for e in col.page(5, 10)] == [e.id for e in alive[5:15]]
+    assert [e.id for e in col.search([Filter(field="id", operator="lt", value=10)])] == [2, 4, 6, 8]
+
+    # 大量删除触发按比例压缩, 顺序和主键查找保持正确
+    for pk in range(2, 80, 2):
+        col.remove(pk)
+    assert col.compactions >= 1
+    assert [e.id for e in col] == [e.id for e in alive if e.id >= 80 or e.id % 2]
+    assert col.get(81) == events[80] and col.get(2) is None
+
+    col.remove(81)
+    pending = col.tombstones
+    # 更新同样是写入, 持续更新时推迟空闲压缩
+    for _ in range(6):
+        time.sleep(0.02)
+        col.update(83, lambda e: e)
+    assert col.tombstones == pending > 0
+    time.sleep(0.3)
+    assert col.tombstones == 0 and col.n == len(col) == 40
+    col.insert(Event(id=1000, name="x", score=1, ratio=0.1, active=True))
+    assert [e.id for e in col][-2:] == [100, 1000]
+
+
+def test_async_routes():
+    """测试 async 模式: 路由注册为协程函数, 行为与同步模式一致"""
+    import asyncio
+
+    router = MemoryCRUDRouter(schema=Book, prefix="async_books", async_routes=True)
+    assert router.routes and all(asyncio.iscoroutinefunction(r.endpoint) for r in router.routes)
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    seed_books(client, "async_books", 5)
+    assert client.get("/async_books/3").json()["data"]["title"] == "图书2"
+    assert client.get("/async_books", params={"skip": 1, "limit": 2}).json()["data"][0]["id"] == 2
+    assert client.put("/async_books/3", json={"title": "改", "author": "赵六", "price": 1.0}).status_code == 200
+    assert client.delete("/async_books/9").json() == {"status_code": 404, "msg": "Item not found"}
+    body = {"filters": [{"field": "author", "operator": "eq", "value": "赵六"}]}
+    assert [b["id"] for b in client.post("/async_books/search", json=body).json()["data"]] == [3]
+
+
+def test_trusted_output():
+    """测试 trusted_output: 内存路由的响应与默认路径一致"""
+    plain, trusted = create_client("plain_trusted"), create_client("trusted", trusted_output=True)
+    for client, prefix in [(plain, "plain_trusted"), (trusted, "trusted")]:
+        seed_books(client, prefix, 5)
+    assert trusted.get("/trusted").json() == plain.get("/plain_trusted").json()
+    assert trusted.get("/trusted/2").json() == plain.get("/plain_trusted/2").json()
+    assert trusted.get("/trusted/9").json() == {"status_code": 404, "msg": "Item not found"}
+
+
+def _walk_cursor(client: TestClient, method: str, url: str, body=None, limit: int = 7) -> list:
+    rows, cursor = [], None
+    while True:
+        query = f"?limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        page = client.request(method, url + query, json=body).json()
+        rows.extend(page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows
+
+
+def test_cursor_pagination():
+    """测试游标分页: 逐页拼接的结果与一次性查询一致, 翻页期间的删除和插入不会导致重复或遗漏"""
+    app = FastAPI()
+    router = MemoryCRUDRouter(schema=Event, prefix="cursor_events", sorted_indexes=["ratio"])
+    app.include_router(router)
+    client = TestClient(app)
+    for event in make_events(100):
+        router.store.insert(event)
+
+    assert _walk_cursor(client, "GET", "/cursor_events") == client.get("/cursor_events").json()["data"]
+    for body in [
+        {},
+        {"sorting": [{"field": "ratio", "direction": "asc"}]},
+        {"sorting": [{"field": "ratio", "direction": "desc"}, {"field": "name", "direction": "asc"}]},
+        {"sorting": [{"field": "score", "direction": "desc"}, {"field": "name", "direction": "desc"}]},
+        {"filters": [{"field": "active", "operator": "eq", "value": True}],
+         "sorting": [{"field": "name", "direction": "asc"}]},
+    ]:
+        expected = client.post("/cursor_events/search", json=body).json()["data"]
+        assert _walk_cursor(client, "POST", "/cursor_events/search", body) == expected
+
+    # 翻页期间删除已读过的行、追加新行: 后续页不受影响
+    page = client.get("/cursor_events?limit=10").json()
+    for row in page["data"][:5]:
+        client.delete(f"/cursor_events/{row['id']}")
+    router.store.insert(Event(id=1000, ratio=0.5, active=True))
+    ids = [r["id"] for r in client.get(f"/cursor_events?limit=200&cursor={page['next_cursor']}").json()["data"]]
+    assert ids == list(range(11, 101)) + [1000]
+
+    assert client.get("/cursor_events?cursor=bad").status_code == 422
+    assert client.get(f"/cursor_events?skip=1&cursor={page['next_cursor']}").status_code == 422
+    # 游标与排序条件不匹配
+    sorted_body = {"sorting": [{"field": "ratio", "direction": "asc"}]}
+    assert client.post(f"/cursor_events/search?cursor={page['next_cursor']}", json=sorted_body).status_code == 422
+
+
+def test_cursor_after_many_deletes():
+    """测试大量删除后插入序号数组的清理"""
+    from nb_api.core.mem_store import MemoryStore
+
+    store = MemoryStore()
+    for i in range(1, 3001):
+        store.insert(Book(id=i, title=f"t{i}", author="a", price=float(i)))
+    for i in range(1, 2501, 2):
+        store.remove(i)
+    for i in range(2501, 2901):
+        store.remove(i)
+    assert len(store._order) < 3000
+
+    rows, after = store.search_page(limit=100)
+    seen = [b.id for b in rows]
+    while after is not None:
+        rows, after = store.search_page(limit=100, after=after)
+        seen.extend(b.id for b in rows)
+    assert seen == [b.id for b in store]
+
+
+def test_count():
+    """测试 total: 行存储按索引计数, capped 截断, 列存储同样返回总数"""
+    body = {"filters": [{"field": "author", "operator": "eq", "value": "张三"}]}
+
+    client = create_client("count_books", indexes=["author"], count="exact")
+    seed_books(client, "count_books", 10)
+    page = client.get("/count_books?limit=3").json()
+    assert (page["total"], page["total_capped"], len(page["data"])) == (10, False, 3)
+    assert client.post("/count_books/search", json=body).json()["total"] == 4
+    assert client.get(f"/count_books?limit=3&cursor={page['next_cursor']}").json()["total"] == 10
+
+    client = create_client("capped_books", indexes=["author"], count="capped", count_cap=3)
+    seed_books(client, "capped_books", 10)
+    page = client.post("/capped_books/search", json=body).json()
+    assert (page["total"], page["total_capped"]) == (3, True)
+
+    client = create_client("count_col_books", storage="columnar", count="cached")
+    seed_books(client, "count_col_books", 6)
+    assert client.post("/count_col_books/search", json=body).json()["total"] == 2
+    client.delete("/count_col_books/1")
+    assert client.post("/count_col_books/search", json=body).json()["total"] == 1
+
+
+def test_fields():
+    """测试字段投影: 行存储和列存储都只返回指定字段"""
+    for name, kwargs in [("fields_books", {}), ("fields_col_books", {"storage": "columnar"})]:
+        client = create_client(name, **kwargs)
+        seed_books(client, name, 4)
+        assert client.get(f"/{name}?fields=title&limit=2").json()["data"] == [{"title": "图书0"}, {"title": "图书1"}]
+        assert client.get(f"/{name}/2?fields=author,id").json()["data"] == {"id": 2, "author": "李四"}
+        body = {"filters": [{"field": "author", "operator": "eq", "value": "张三"}], "fields": ["price"]}
+        assert client.post(f"/{name}/search", json=body).json()["data"] == [{"price": 0.0}, {"price": 30.0}]
+        assert client.get(f"/{name}?fields=isbn").status_code == 422
+
+
+def test_create_batch():
+    """测试批量创建: 自动分配主键, 重复主键的条目记入 errors"""
+    client = create_client("batch_books", indexes=["author"])
+    books = [{"title": f"图书{i}", "author": "张三", "price": 1.0} for i in range(3)]
+    result = client.post("/batch_books/batch", json=books).json()["data"]
+    assert [b["id"] for b in result["created"]] == [1, 2, 3] and result["errors"] == []
+    body = {"filters": [{"field": "author", "operator": "eq", "value": "张三"}]}
+    assert len(client.post("/batch_books/search", json=body).json()["data"]) == 3
+
+    app = FastAPI()
+    app.include_router(MemoryCRUDRouter(schema=Sku, prefix="batch_skus", pk_field="code", create_schema=Sku))
+    client = TestClient(app)
+    result = client.post("/batch_skus/batch", json=[
+        {"code": 7, "name": "a"}, {"code": 7, "name": "b"}, {"code": 8, "name": "c"}
+    ]).json()["data"]
+    assert [s["code"] for s in result["created"]] == [7, 8]
+    assert result["errors"] == [{"index": 1, "msg": "Key already exists"}]
+
+
+def test_batch_update_delete():
+    """测试批量更新 / 删除: 选中的行在一次写锁内修改, 索引同步更新"""
+    client = create_client("batch_write_books", indexes=["author"])
+    client.post("/batch_write_books/batch", json=[{"title": f"图书{i}", "author": "张三", "price": float(i)} for i in range(4)])
+    body = {
+        "filters": [{"field": "price", "operator": "gt", "value": 1.0}],
+        "values": {"author": "李四"},
+        "returning": True,
+    }
+    assert client.put("/batch_write_books/batch", json=body).json()["data"] == {"affected": 2, "ids": [3, 4]}
+    body = {"filters": [{"field": "author", "operator": "eq", "value": "李四"}]}
+    assert [b["title"] for b in client.post("/batch_write_books/search", json=body).json()["data"]] == ["图书2", "图书3"]
+
+    body = {"ids": [4, 1, 99], "returning": True}
+    assert client.request("DELETE", "/batch_write_books/batch", json=body).json()["data"] == {"affected": 2, "ids": [4, 1]}
+    assert [b["id"] for b in client.get("/batch_write_books").json()["data"]] == [2, 3]
+    assert client.request("DELETE", "/batch_write_books/batch", json={}).status_code == 422
+
+
+def test_get_many():
+    """测试按主键批量读取: 按请求顺序返回, 报告不存在的主键"""
+    client = create_client("many_books")
+    client.post("/many_books/batch", json=[{"title": f"图书{i}", "author": "张三", "price": 1.0} for i in range(3)])
+    result = client.get("/many_books/many?ids=2,7,1").json()["data"]
+    assert [b["title"] for b in result["items"]] == ["图书1", "图书0"] and result["missing"] == [7]
+    assert client.post("/many_books/many", json=[3]).json()["data"]["items"][0]["id"] == 3
+
+
+def test_batch_requires_selection():
+    """测试批量更新 / 删除: 空的 ids / filters 与不给条件一样被拒绝, 不改动任何行"""
+    client = create_client("batch_guard_books")
+    client.post("/batch_guard_books/batch", json=[{"title": f"图书{i}", "author": "张三", "price": 1.0} for i in range(3)])
+    for body in ({}, {"filters": []}, {"ids": []}, {"ids": [], "filters": []}):
+        assert client.request("DELETE", "/batch_guard_books/batch", json=body).status_code == 422
+        assert client.put("/batch_guard_books/batch", json={**body, "values": {"author": "李四"}}).status_code == 422
+    assert [b["author"] for b in client.get("/batch_guard_books").json()["data"]] == ["张三"] * 3
+
+
+class Stock(BaseModel):
+    id: Optional[int] = None
+    name: str = Field(max_length=5)
+    qty: int = Field(ge=0)
+
+
+def test_batch_update_validates():
+    """测试批量更新: values 按 schema 的字段约束校验, 不合法时不修改任何行"""
+    app = FastAPI()
+    app.include_router(MemoryCRUDRouter(schema=Stock, prefix="batch_stocks"))
+    client = TestClient(app)
+    client.post("/batch_stocks/batch", json=[{"name": "a", "qty": 1}, {"name": "b", "qty": 2}])
+    for values in ({"qty": -5}, {"name": "waytoolongname"}):
+        assert client.put("/batch_stocks/batch", json={"ids": [1, 2], "values": values}).status_code == 422
+    assert [(s["name"], s["qty"]) for s in client.get("/batch_stocks").json()["data"]] == [("a", 1), ("b", 2)]
+    assert client.put("/batch_stocks/batch", json={"ids": [2], "values": {"qty": 0}}).json()["data"]["affected"] == 1
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_update_validates(compact):
+    """测试 PUT /{id}: 紧凑表示与普通行存储接受 / 拒绝相同的输入"""
+    prefix = f"validated_stocks_{str(compact).lower()}"
+    app = FastAPI()
+    app.include_router(MemoryCRUDRouter(schema=Stock, prefix=prefix, compact=compact))
+    client = TestClient(app)
+    client.post(f"/{prefix}", json={"name": "a", "qty": 1})
+    assert client.put(f"/{prefix}/1", json={"name": "waytoolongname", "qty": -3}).status_code == 422
+    assert client.get(f"/{prefix}/1").json()["data"] == {"id": 1, "name": "a", "qty": 1}
+    assert client.put(f"/{prefix}/1", json={"name": "b", "qty": 2}).json()["data"] == {"id": 1, "name": "b", "qty": 2}
+
+
+class StockIn(BaseModel):
+    name: str
+    qty: int
+
+
+def test_create_batch_validates():
+    """测试批量创建: 不符合 schema 的条目记入 errors, 其它条目照常创建"""
+    app = FastAPI()
+    app.include_router(MemoryCRUDRouter(schema=Stock, create_schema=StockIn, prefix="created_stocks"))
+    client = TestClient(app)
+    result = client.post("/created_stocks/batch", json=[
+        {"name": "a", "qty": 1}, {"name": "waytoolongname", "qty": 1}, {"name": "c", "qty": -1}, {"name": "d", "qty": 4}
+    ]).json()["data"]
+    assert [s["name"] for s in result["created"]] == ["a", "d"]
+    assert [error["index"] for error in result["errors"]] == [1, 2]
+    assert [s["name"] for s in client.get("/created_stocks").json()["data"]] == ["a", "d"]
@@ -0,0 +1,414 @@
+"""SQLAlchemy CRUD 路由器测试"""
+
+import asyncio
+from typing import Any, Optional
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Column, Float, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import StaticPool
+from nb_api import SQLAlchemyCRUDRouter
+from nb_api.core.loader import BatchLoader
+
+Base = declarative_base()
+
+
+class GoodsTable(Base):
+    __tablename__ = "goods"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(50), nullable=False, unique=True)
+    category = Column(String(20), nullable=True)
+    price = Column(Float, nullable=False)
+
+
+class Goods(BaseModel):
+    """商品模型"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Optional[int] = None
+    name: str
+    category: Optional[str] = None
+    price: float
+
+
+def create_client(**kwargs) -> TestClient:
+    # 单连接的内存数据库, 线程池里的各个请求看到同一份数据
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(SQLAlchemyCRUDRouter(schema=Goods, db_model=GoodsTable, db=get_db, prefix="goods", **kwargs))
+    return TestClient(app)
+
+
+def seed_goods(client: TestClient, n: int = 10) -> None:
+    categories = ["书籍", "数码", None]
+    for i in range(n):
+        client.post("/goods", json={"name": f"商品{i}", "category": categories[i % 3], "price": float(i)})
+
+
+def test_trusted_output():
+    """测试 trusted_output: 响应内容和 OpenAPI 文档与默认路径一致"""
+    plain, trusted = create_client(), create_client(trusted_output=True)
+    for client in (plain, trusted):
+        seed_goods(client, 5)
+
+    for method, url, body in [
+        ("GET", "/goods", None),
+        ("GET", "/goods?skip=1&limit=2", None),
+        ("GET", "/goods/3", None),
+        ("GET", "/goods/99", None),
+        ("PUT", "/goods/2", {"name": "改", "price": 9.5}),
+        ("POST", "/goods/search", {"filters": [{"field": "price", "operator": "gt", "value": 1}],
+                                   "sorting": [{"field": "price", "direction": "desc"}]}),
+        ("DELETE", "/goods/4", None),
+    ]:
+        expected = plain.request(method, url, json=body)
+        response = trusted.request(method, url, json=body)
+        assert response.status_code == expected.status_code
+        assert response.json() == expected.json()
+    assert trusted.get("/openapi.json").json() == plain.get("/openapi.json").json()
+
+
+def test_serializer():
+    """测试可插拔 JSON 编码器: 各编码器的响应与默认一致, 错误响应也使用同一编码器"""
+    from nb_api.core import serializers
+
+    plain = create_client()
+    seed_goods(plain, 5)
+    expected = plain.get("/goods").content
+    for name in ("orjson", "msgspec", "json", "auto"):
+        client = create_client(serializer=name)
+        seed_goods(client, 5)
+        assert client.get("/goods").content == expected
+        assert client.get("/goods/99").json() == {"status_code": 404, "msg": "Item not found"}
+        assert client.post("/goods/search", json={}).json() == plain.post("/goods/search", json={}).json()
+
+    assert serializers.get_response_class("orjson").__name__ == "OrjsonJSONResponse"
+    assert serializers.get_response_class("orjson")({"a": 1.5, "b": "中"}).body == '{"a":1.5,"b":"中"}'.encode()
+
+
+def test_serializer_decimal():
+    """测试 Decimal: 各编码器的输出与 FastAPI 默认的 jsonable_encoder 一致 (整数值不变成 3.0 或 "3")"""
+    import json
+    from decimal import Decimal
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from nb_api.core import serializers
+
+    content = {"a": Decimal("3"), "b": Decimal("2.5"), "c": [Decimal("-0.25")]}
+    expected = json.loads(JSONResponse(jsonable_encoder(content)).body)
+    assert expected == {"a": 3, "b": 2.5, "c": [-0.25]}
+    for name in ("orjson", "msgspec", "json"):
+        body = serializers.get_response_class(name)(content).body
+        assert json.loads(body) == expected and b'"a":3,' in body
+
+
+def test_serializer_fallback(monkeypatch):
+    """测试编码器未安装时退回标准库 json"""
+    from nb_api.core import serializers
+
+    monkeypatch.setattr(serializers, "orjson_installed", False)
+    monkeypatch.setattr(serializers, "msgspec_installed", False)
+    assert serializers.resolve_serializer("orjson") == "json"
+    assert serializers.resolve_serializer("auto") == "json"
+
+
+def test_streaming():
+    """测试流式输出: NDJSON 和 stream=true 的内容与普通响应一致, 分块边界不影响结果"""
+    import json
+
+    client = create_client(stream_chunk_size=3)
+    seed_goods(client, 10)
+    search = {"filters": [{"field": "price", "operator": "gt", "value": 1}],
+              "sorting": [{"field": "price", "direction": "desc"}]}
+
+    for method, url, body in [
+        ("GET", "/goods", None),
+        ("GET", "/goods?skip=2&limit=5", None),
+        ("GET", "/goods?skip=20", None),
+        ("POST", "/goods/search", search),
+    ]:
+        expected = client.request(method, url, json=body).json()
+        sep = "&" if "?" in url else "?"
+
+        response = client.request(method, url + sep + "stream=true", json=body)
+        assert response.headers["content-type"] == "application/json"
+        # 流式输出不分页, next_cursor 总是 null
+        assert response.json() == {**expected, "next_cursor": None}
+
+        response = client.request(method, url, json=body, headers={"Accept": "application/x-ndjson"})
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == expected["data"]
+
+    # 非法字段在开始输出之前报错
+    bad = {"filters": [{"field": "nope", "operator": "eq", "value": 1}]}
+    assert client.post("/goods/search?stream=true", json=bad).status_code == 422
+
+
+def test_cursor_pagination():
+    """测试游标分页: 逐页拼接的结果与一次性查询一致 (含可为空的排序列和混合升降序)"""
+    client = create_client()
+    seed_goods(client, 20)
+
+    def walk(method, url, body=None):
+        rows, cursor = [], None
+        while True:
+            page = client.request(method, url + "?limit=3" + (f"&cursor={cursor}" if cursor else ""), json=body).json()
+            rows.extend(page["data"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return rows
+
+    assert walk("GET", "/goods") == client.get("/goods").json()["data"]
+    for body in [
+        {"sorting": [{"field": "category", "direction": "asc"}]},
+        {"sorting": [{"field": "category", "direction": "desc"}, {"field": "price", "direction": "asc"}]},
+        {"filters": [{"field": "price", "operator": "gt", "value": 4}],
+         "sorting": [{"field": "price", "direction": "desc"}]},
+    ]:
+        expected = client.post("/goods/search", json=body).json()["data"]
+        assert len(expected) > 3
+        assert walk("POST", "/goods/search", body) == expected
+
+    assert client.get("/goods?limit=3&cursor=bad").status_code == 422
+
+
+def test_count():
+    """测试 total: exact / cached (写操作后失效) / capped, 总数随游标带到后续各页"""
+    body = {"filters": [{"field": "price", "operator": "gt", "value": 4}]}
+
+    client = create_client()
+    seed_goods(client, 5)
+    page = client.get("/goods").json()
+    assert page["total"] is None and page["total_capped"] is None
+
+    client = create_client(count="exact")
+    seed_goods(client, 20)
+    page = client.get("/goods?limit=3").json()
+    assert (page["total"], page["total_capped"], len(page["data"])) == (20, False, 3)
+    assert client.post("/goods/search", json=body).json()["total"] == 15
+    assert client.get("/goods?skip=30&limit=3").json()["total"] == 20
+
+    # 翻页时沿用第一页的总数, 中途新增的行不影响
+    client.post("/goods", json={"name": "新商品", "category": None, "price": 1.0})
+    page = client.get(f"/goods?limit=3&cursor={page['next_cursor']}").json()
+    assert page["total"] == 20 and page["next_cursor"] is not None
+
+    client = create_client(count="cached")
+    seed_goods(client, 10)
+    assert client.post("/goods/search", json=body).json()["total"] == 5
+    client.post("/goods", json={"name": "新商品", "category": None, "price": 100.0})
+    assert client.post("/goods/search", json=body).json()["total"] == 6
+    assert client.get("/goods").json()["total"] == 11
+
+    client = create_client(count="capped", count_cap=8)
+    seed_goods(client, 10)
+    page = client.get("/goods").json()
+    assert (page["total"], page["total_capped"]) == (8, True)
+    page = client.post("/goods/search", json=body).json()
+    assert (page["total"], page["total_capped"]) == (5, False)
+
+
+def test_fields():
+    """测试字段投影: 只返回指定字段, 游标 / 流式输出照常工作, 非法字段返回 422"""
+    client = create_client()
+    seed_goods(client, 7)
+
+    page = client.get("/goods?fields=price,name&limit=3").json()
+    assert [list(row) for row in page["data"]] == [["name", "price"]] * 3
+    rest = client.get(f"/goods?fields=name&limit=10&cursor={page['next_cursor']}").json()["data"]
+    assert [row["name"] for row in rest] == [f"商品{i}" for i in range(3, 7)]
+
+    assert client.get("/goods/2?fields=category").json()["data"] == {"category": "数码"}
+
+    body = {"sorting": [{"field": "price", "direction": "desc"}], "fields": ["id"]}
+    assert client.post("/goods/search?fields=name", json=body).json()["data"] == [{"id": i} for i in range(7, 0, -1)]
+    response = client.get("/goods?fields=id", headers={"Accept": "application/x-ndjson"})
+    assert response.text.splitlines() == [f'{{"id":{i}}}' for i in range(1, 8)]
+
+    assert client.get("/goods?fields=id,secret").status_code == 422
+    assert client.post("/goods/search", json={"fields": ["secret"]}).status_code == 422
+
+
+def test_create_batch():
+    """测试批量创建: 分块插入, 返回带主键的行; 重复的条目记入 errors, 不影响其它条目"""
+    client = create_client(batch_chunk_size=2)
+    items = [{"name": f"商品{i}", "category": None, "price": float(i)} for i in range(5)]
+    items[3]["name"] = "商品0"
+
+    result = client.post("/goods/batch", json=items).json()["data"]
+    assert [(row["id"], row["name"]) for row in result["created"]] == [(1, "商品0"), (2, "商品1"), (3, "商品2"), (4, "商品4")]
+    assert [error["index"] for error in result["errors"]] == [3]
+    assert [row["name"] for row in client.get("/goods").json()["data"]] == ["商品0", "商品1", "商品2", "商品4"]
+    assert client.post("/goods/batch", json=[{"name": "x"}]).status_code == 422
+
+
+def test_create_batch_db_error():
+    """测试批量创建: 约束冲突以外的数据库错误 (驱动无法绑定的取值) 也只记入出错的条目"""
+    class GoodsIn(BaseModel):
+        name: str
+        price: Any
+
+    client = create_client(batch_chunk_size=2, create_schema=GoodsIn)
+    items = [{"name": "a", "price": 1.0}, {"name": "b", "price": {"x": 1}}, {"name": "c", "price": 3.0}]
+    result = client.post("/goods/batch", json=items).json()["data"]
+    assert [row["name"] for row in result["created"]] == ["a", "c"]
+    assert [error["index"] for error in result["errors"]] == [1]
+
+
+def test_batch_update_delete():
+    """测试批量更新 / 删除: ids 和 filters 编译成一条 UPDATE / DELETE, returning 时返回受影响的主键"""
+    client = create_client()
+    client.post("/goods/batch", json=[{"name": f"商品{i}", "category": "a", "price": float(i)} for i in range(5)])
+    body = {
+        "ids": [1, 2, 3, 99],
+        "filters": [{"field": "price", "operator": "gt", "value": 0}],
+        "values": {"category": "b"},
+        "returning": True,
+    }
+    assert client.put("/goods/batch", json=body).json()["data"] == {"affected": 2, "ids": [2, 3]}
+    assert [row["category"] for row in client.get("/goods").json()["data"]] == ["a", "b", "b", "a", "a"]
+    # 只改动给出的字段; 唯一约束冲突返回 422
+    assert client.get("/goods/2").json()["data"]["name"] == "商品1"
+    assert client.put("/goods/batch", json={"ids": [1, 2], "values": {"name": "x"}}).status_code == 422
+    assert client.put("/goods/batch", json={"values": {"category": "c"}}).status_code == 422
+    # 空的 filters 不能当作 "全部行"
+    assert client.put("/goods/batch", json={"filters": [], "values": {"category": "c"}}).status_code == 422
+    assert client.request("DELETE", "/goods/batch", json={"filters": []}).status_code == 422
+    assert len(client.get("/goods").json()["data"]) == 5
+
+    body = {"filters": [{"field": "category", "operator": "eq", "value": "a"}]}
+    assert client.request("DELETE", "/goods/batch", json=body).json()["data"] == {"affected": 3, "ids": None}
+    assert [row["id"] for row in client.get("/goods").json()["data"]] == [2, 3]
+
+
+def test_delete_all():
+    """测试删除全部: 集合式 DELETE 返回 deleted_count; delete_all_chunk_size 按主键范围分块删除"""
+    for chunk_size in (None, 2):
+        client = create_client(delete_all_chunk_size=chunk_size)
+        client.post("/goods/batch", json=[{"name": f"商品{i}", "category": None, "price": 1.0} for i in range(5)])
+        response = client.delete("/goods").json()
+        assert response["data"] == [] and response["deleted_count"] == 5
+        assert client.get("/goods").json()["data"] == []
+        assert client.delete("/goods").json()["deleted_count"] == 0
+
+
+def test_get_many():
+    """测试按主键批量读取: 一条 IN 查询, 按请求顺序返回, 报告不存在的主键"""
+    client = create_client()
+    client.post("/goods/batch", json=[{"name": f"商品{i}", "category": None, "price": 1.0} for i in range(4)])
+
+    result = client.get("/goods/many?ids=3,99,1,3").json()["data"]
+    assert [row["id"] for row in result["items"]] == [3, 1] and result["missing"] == [99]
+    result = client.post("/goods/many?fields=name", json=[4, 2]).json()["data"]
+    assert result == {"items": [{"name": "商品3"}, {"name": "商品1"}], "missing": []}
+    assert client.get("/goods/many?ids=1,x").status_code == 422
+
+
+def test_coalesce_owner_cancelled():
+    """测试请求合并: 提供会话的第一个请求被取消时, 会话保持打开直到这一批查询结束"""
+
+    class FakeSession:
+        closed = False
+
+    async def fetch(keys, session):
+        await asyncio.sleep(0.05)
+        assert not session.closed
+        return {key: key * 10 for key in keys}
+
+    loader = BatchLoader(fetch, window=0.01)
+
+    async def request(key):
+        session = FakeSession()
+        try:
+            return await loader.load(key, session)
+        finally:
+            # 与 FastAPI 的依赖清理一样, 路由返回或被取消后关闭会话
+            session.closed = True
+
+    async def main():
+        first = asyncio.ensure_future(request(1))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(request(2))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        assert await second == 20
+        await asyncio.wait([first])
+        assert first.cancelled()
+
+        # 窗口结束前就被取消: 查询立即发出, 其他请求照常拿到结果
+        first = asyncio.ensure_future(request(3))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(request(4))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == 40
+
+    asyncio.run(main())
+
+
+def test_streaming_own_session():
+    """测试流式输出另开会话读取: 旧版 FastAPI 在发送响应前就关闭了请求的会话"""
+    from sqlalchemy import select
+
+    class ClosedSession(Session):
+        def execute(self, *args, **kwargs):
+            raise AssertionError("请求的会话已关闭")
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([GoodsTable(name=f"商品{i}", price=float(i)) for i in range(7)])
+        session.commit()
+
+    router = SQLAlchemyCRUDRouter(schema=Goods, db_model=GoodsTable, db=lambda: None, prefix="goods",
+                                  stream_chunk_size=3)
+    chunks = router._iter_chunks(ClosedSession(engine), select(GoodsTable).order_by(GoodsTable.id))
+    assert [[row.name for row in chunk] for chunk in chunks] == [
+        ["商品0", "商品1", "商品2"], ["商品3", "商品4", "商品5"], ["商品6"]
+    ]
+
+
+def test_streaming_session_factory():
+    """测试 stream_session: 流式输出用应用提供的会话工厂 (保留 sessionmaker 的配置), 输出结束时关闭"""
+    import json
+    from sqlalchemy.orm import sessionmaker
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    opened, created = [], []
+
+    class AppSession(Session):
+        def close(self):
+            opened.remove(self)
+            super().close()
+
+    factory = sessionmaker(engine, class_=AppSession)
+
+    def stream_session():
+        session = factory()
+        opened.append(session)
+        created.append(session)
+        return session
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(SQLAlchemyCRUDRouter(
+        schema=Goods, db_model=GoodsTable, db=get_db, prefix="goods", stream_session=stream_session
+    ))
+    client = TestClient(app)
+    seed_goods(client, 4)
+    assert not opened
+    response = client.get("/goods", headers={"Accept": "application/x-ndjson"})
+    assert [json.loads(line)["name"] for line in response.text.splitlines()] == [f"商品{i}" for i in range(4)]
+    assert len(created) == 1 and not opened
@@ -1,10 +1,15 @@
 """SQLModel CRUD 功能测试"""
 
+import asyncio
 from typing import Optional
+import httpx
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
 from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import FastAPI
-from nb_api import SQLModelCRUDRouter
+from nb_api import AioSQLModelCRUDRouter, SQLModelCRUDRouter
 
 
 # 定义测试模型
@@ -164,6 +169,50 @@ def test_sqlmodel_not_found():
     print("✅ SQLModel 404 测试通过!")
 
 
+def test_aio_sqlmodel_coalesce():
+    """测试异步路由器的请求合并: 并发的 GET /{item_id} 合并成少量 IN 查询, 各自拿到正确的行"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def get_session():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    router = AioSQLModelCRUDRouter(
+        schema=ProductRead,
+        create_schema=ProductCreate,
+        db_model=Product,
+        db=get_session,
+        prefix="products",
+        coalesce_window=0.01,
+    )
+    app = FastAPI()
+    app.include_router(router)
+
+    async def main():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            created = (await client.post("/products/batch", json=[
+                {"name": f"产品{i}", "price": i * 100.0, "stock": i} for i in range(10)
+            ])).json()["data"]["created"]
+            ids = [3, 1, 99, 10, 3, 7]
+            responses = await asyncio.gather(*(client.get(f"/products/{i}") for i in ids))
+            projected = (await client.get("/products/2?fields=name")).json()["data"]
+        await engine.dispose()
+
+        rows = {row["id"]: row for row in created}
+        assert [r.status_code for r in responses] == [200, 200, 404, 200, 200, 200]
+        for i, response in zip(ids, responses):
+            if i != 99:
+                assert response.json()["data"] == rows[i]
+        assert projected == {"name": "产品1"}
+        stats = router.coalesce_stats()
+        assert stats["requests"] == 7 and stats["batches"] < stats["requests"]
+
+    asyncio.run(main())
+
+
 if __name__ == "__main__":
     test_sqlmodel_crud_basic()
     test_sqlmodel_pagination()
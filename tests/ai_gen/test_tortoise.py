@@ -0,0 +1,186 @@
+"""Tortoise CRUD 路由器测试 (内存 SQLite)"""
+
+import asyncio
+from typing import Optional
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from tortoise import Tortoise, fields
+from tortoise.contrib.fastapi import register_tortoise
+from tortoise.models import Model
+from nb_api import TortoiseCRUDRouter
+
+
+class GoodsTable(Model):
+    id = fields.IntField(pk=True)
+    name = fields.CharField(50, unique=True)
+    category = fields.CharField(20, null=True)
+    price = fields.FloatField()
+
+    class Meta:
+        app = "models"
+        table = "goods"
+
+
+class Goods(BaseModel):
+    """商品模型"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Optional[int] = None
+    name: str
+    category: Optional[str] = None
+    price: float
+
+
+def create_client(**kwargs) -> TestClient:
+    # 用作上下文管理器: 进入时初始化 Tortoise 并建表, 退出时关闭连接
+    app = FastAPI()
+    app.include_router(TortoiseCRUDRouter(schema=Goods, db_model=GoodsTable, prefix="goods", **kwargs))
+    register_tortoise(app, db_url="sqlite://:memory:", modules={"models": [__name__]}, generate_schemas=True)
+    return TestClient(app)
+
+
+def seed_goods(client: TestClient, n: int = 10) -> None:
+    categories = ["书籍", "数码", None]
+    items = [{"name": f"商品{i}", "category": categories[i % 3], "price": float(i)} for i in range(n)]
+    assert client.post("/goods/batch", json=items).json()["data"]["errors"] == []
+
+
+def test_create_batch():
+    """测试批量创建: 分块插入, 返回带主键的行; 重复的条目记入 errors, 不影响其它条目"""
+    with create_client(batch_chunk_size=2) as client:
+        items = [{"name": f"商品{i}", "category": None, "price": float(i)} for i in range(5)]
+        items[3]["name"] = "商品0"
+
+        result = client.post("/goods/batch", json=items).json()["data"]
+        assert [(row["id"], row["name"]) for row in result["created"]] == [(1, "商品0"), (2, "商品1"), (3, "商品2"), (4, "商品4")]
+        assert [error["index"] for error in result["errors"]] == [3]
+
+
+def test_batch_update_delete():
+    """测试批量更新 / 删除: ids 和 filters 编译成一条 UPDATE / DELETE, returning 时返回受影响的主键"""
+    with create_client() as client:
+        client.post("/goods/batch", json=[{"name": f"商品{i}", "category": "a", "price": float(i)} for i in range(5)])
+        body = {
+            "ids": [1, 2, 3, 99],
+            "filters": [{"field": "price", "operator": "gt", "value": 0}],
+            "values": {"category": "b"},
+            "returning": True,
+        }
+        assert client.put("/goods/batch", json=body).json()["data"] == {"affected": 2, "ids": [2, 3]}
+        assert [row["category"] for row in client.get("/goods?limit=100").json()["data"]] == ["a", "b", "b", "a", "a"]
+        assert client.put("/goods/batch", json={"ids": [1, 2], "values": {"name": "x"}}).status_code == 422
+        assert client.request("DELETE", "/goods/batch", json={"filters": []}).status_code == 422
+
+        body = {"filters": [{"field": "category", "operator": "eq", "value": "a"}]}
+        assert client.request("DELETE", "/goods/batch", json=body).json()["data"] == {"affected": 3, "ids": None}
+        assert [row["id"] for row in client.get("/goods?limit=100").json()["data"]] == [2, 3]
+
+
+def test_delete_all():
+    """测试删除全部: 集合式 DELETE 返回 deleted_count; delete_all_chunk_size 按主键范围分块删除"""
+    for chunk_size in (None, 2):
+        with create_client(delete_all_chunk_size=chunk_size) as client:
+            seed_goods(client, 5)
+            response = client.delete("/goods").json()
+            assert response["data"] == [] and response["deleted_count"] == 5
+            assert client.get("/goods?limit=100").json()["data"] == []
+
+
+def test_cursor_pagination():
+    """测试游标分页: 逐页拼接的结果与一次性查询一致 (含可为空的排序列和混合升降序)"""
+    with create_client() as client:
+        seed_goods(client, 20)
+
+        def walk(method, url, body=None):
+            rows, cursor = [], None
+            while True:
+                page = client.request(method, url + "?limit=3" + (f"&cursor={cursor}" if cursor else ""), json=body).json()
+                rows.extend(page["data"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    return rows
+
+        assert walk("GET", "/goods") == client.get("/goods?limit=100").json()["data"]
+        for body in [
+            {"sorting": [{"field": "category", "direction": "asc"}]},
+            {"sorting": [{"field": "category", "direction": "desc"}, {"field": "price", "direction": "asc"}]},
+        ]:
+            expected = client.post("/goods/search?limit=100", json=body).json()["data"]
+            assert len(expected) == 20
+            assert walk("POST", "/goods/search", body) == expected
+
+        assert client.get("/goods?limit=3&cursor=bad").status_code == 422
+
+
+def test_count():
+    """测试 total: exact 随游标带到后续各页, capped 超出 count_cap 时截断"""
+    body = {"filters": [{"field": "price", "operator": "gt", "value": 4}]}
+
+    with create_client(count="exact") as client:
+        seed_goods(client, 10)
+        page = client.get("/goods?limit=3").json()
+        assert (page["total"], page["total_capped"], len(page["data"])) == (10, False, 3)
+        assert client.post("/goods/search?limit=3", json=body).json()["total"] == 5
+        page = client.get(f"/goods?limit=3&cursor={page['next_cursor']}").json()
+        assert page["total"] == 10
+
+    with create_client(count="capped", count_cap=8) as client:
+        seed_goods(client, 10)
+        page = client.get("/goods?limit=3").json()
+        assert (page["total"], page["total_capped"]) == (8, True)
+
+
+def test_fields():
+    """测试字段投影: 只返回指定字段, 非法字段返回 422"""
+    with create_client() as client:
+        seed_goods(client, 5)
+
+        page = client.get("/goods?fields=price,name&limit=3").json()
+        assert [list(row) for row in page["data"]] == [["name", "price"]] * 3
+        assert client.get("/goods/2?fields=category").json()["data"] == {"category": "数码"}
+        body = {"sorting": [{"field": "price", "direction": "desc"}], "fields": ["id"]}
+        assert client.post("/goods/search?limit=3", json=body).json()["data"] == [{"id": 5}, {"id": 4}, {"id": 3}]
+        assert client.get("/goods?fields=id,secret").status_code == 422
+
+
+def test_get_many():
+    """测试按主键批量读取: 按请求顺序返回, 报告不存在的主键"""
+    with create_client(batch_chunk_size=2) as client:
+        seed_goods(client, 4)
+
+        result = client.get("/goods/many?ids=3,99,1,3").json()["data"]
+        assert [row["id"] for row in result["items"]] == [3, 1] and result["missing"] == [99]
+        result = client.post("/goods/many?fields=name", json=[4, 2]).json()["data"]
+        assert result == {"items": [{"name": "商品3"}, {"name": "商品1"}], "missing": []}
+
+
+def test_coalesce_get_one():
+    """测试请求合并: 并发的 GET /{item_id} 合并成少量 IN 查询, 各自拿到正确的行, 不存在的主键返回 404"""
+    router = TortoiseCRUDRouter(schema=Goods, db_model=GoodsTable, prefix="goods", coalesce_window=0.01)
+    app = FastAPI()
+    app.include_router(router)
+
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": [__name__]})
+        try:
+            await Tortoise.generate_schemas()
+            await GoodsTable.bulk_create([GoodsTable(name=f"商品{i}", price=float(i)) for i in range(10)])
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                ids = [3, 1, 99, 10, 3, 7]
+                responses = await asyncio.gather(*(client.get(f"/goods/{i}") for i in ids))
+                projected = (await client.get("/goods/2?fields=name")).json()["data"]
+        finally:
+            await Tortoise.close_connections()
+
+        assert [r.status_code for r in responses] == [200, 200, 404, 200, 200, 200]
+        for i, response in zip(ids, responses):
+            if i != 99:
+                assert response.json()["data"] == {"id": i, "name": f"商品{i - 1}", "category": None, "price": float(i - 1)}
+        assert projected == {"name": "商品1"}
+        stats = router.coalesce_stats()
+        assert stats["requests"] == 7 and stats["batches"] < stats["requests"]
+
+    asyncio.run(main())